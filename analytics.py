@@ -0,0 +1,298 @@
+"""Sales totals kept up to date from the order log, for the Sales Dashboard.
+
+SalesTotals holds running sums (orders, revenue, discounts, GST) overall
+and per plant, per size and per coupon; folding one order in costs O(its
+lines) and reading any total costs O(1). SalesAnalytics tails the order
+log: refresh() folds in just the orders appended since the last call
+(by any server process), so the totals stay current without ever
+rescanning the history. Every `checkpoint_every` orders the totals are
+saved with the log offset they cover, so a restart picks up from there
+instead of reading millions of orders again.
+
+Revenue is what customers paid before GST (subtotal minus discounts). An
+order's discounts are spread over its lines in proportion to their share
+of the subtotal, so plant and size revenue add up to the overall total.
+A coupon is only credited with its own part of the discount (the order's
+`coupon_discount`; for orders logged without it, the amount left after the
+size discount minus what was paid), not with the size discount.
+
+Usage:
+    python analytics.py orders.log    # build or catch up the checkpoint and print the totals
+"""
+import argparse
+import atexit
+import heapq
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from pricing import SIZES, best_size_discount
+
+CHECKPOINT_VERSION = 2  # 2: coupons are credited with their own discount only
+NO_COUPON = "NIL"  # what the order log records for an order without a coupon
+UNKNOWN_SIZE = "unknown"  # orders written before lines recorded their size
+
+
+class SalesTotals:
+    """Running sales sums; every field is updated in place by add()"""
+
+    def __init__(self):
+        self.orders = 0
+        self.items = 0
+        self.subtotal = 0.0
+        self.discount = 0.0
+        self.gst = 0.0
+        self.revenue = 0.0
+        self.discounted_orders = 0
+        self.by_plant: Dict[int, List] = {}  # plant id -> [name, units, revenue]
+        self.by_size: Dict[str, List] = {}  # size -> [units, revenue]
+        self.by_coupon: Dict[str, List] = {}  # coupon -> [orders, discount, revenue]
+
+    def add(self, order: Dict):
+        """Fold one order log record into the totals"""
+        subtotal, gst = order['subtotal'], order['GST']
+        revenue = order['final_total'] - gst
+        discount = max(subtotal - revenue, 0.0)
+        self.orders += 1
+        self.subtotal += subtotal
+        self.discount += discount
+        self.gst += gst
+        self.revenue += revenue
+        if discount > 0:
+            self.discounted_orders += 1
+
+        share = revenue / subtotal if subtotal else 0.0
+        size_counts = [0] * len(SIZES)
+        for plant_id, item in order['items'].items():
+            units = item['quantity']
+            line_revenue = item['price'] * units * share
+            self.items += units
+            plant = self.by_plant.get(int(plant_id))
+            if plant is None:
+                plant = self.by_plant[int(plant_id)] = [item['name'], 0, 0.0]
+            plant[1] += units
+            plant[2] += line_revenue
+            size = self.by_size.setdefault(item.get('size', UNKNOWN_SIZE), [0, 0.0])
+            size[0] += units
+            size[1] += line_revenue
+            if item.get('size') in SIZES:
+                size_counts[SIZES.index(item['size'])] += units
+
+        coupon_discount = order.get('coupon_discount')
+        if coupon_discount is None:
+            # Coupons apply after the size discount: whatever of that amount wasn't paid was the coupon
+            size_percent, _ = best_size_discount(size_counts)
+            coupon_discount = max(subtotal * (1 - size_percent / 100) - revenue, 0.0)
+        # Codes match case-insensitively, and older orders logged them as typed
+        coupon = self.by_coupon.setdefault(order.get('Coupon', NO_COUPON).upper(), [0, 0.0, 0.0])
+        coupon[0] += 1
+        coupon[1] += coupon_discount
+        coupon[2] += revenue
+
+    @property
+    def average_discount(self) -> float:
+        """Mean discount per order, in dollars"""
+        return self.discount / self.orders if self.orders else 0.0
+
+    @property
+    def average_discount_percent(self) -> float:
+        """Discounts as a share of the undiscounted subtotal"""
+        return 100 * self.discount / self.subtotal if self.subtotal else 0.0
+
+    def top_plants(self, n: int) -> List[Tuple[int, str, int, float]]:
+        """(plant id, name, units, revenue) of the n plants with the most revenue"""
+        top = heapq.nlargest(n, self.by_plant.items(), key=lambda entry: entry[1][2])
+        return [(plant_id, name, units, revenue) for plant_id, (name, units, revenue) in top]
+
+    def top_coupons(self, n: int) -> List[Tuple[str, int, float, float]]:
+        """(code, orders, coupon discount, revenue) of the n coupons with the most revenue (orders without one left out)"""
+        coupons = ((code, totals) for code, totals in self.by_coupon.items() if code != NO_COUPON)
+        top = heapq.nlargest(n, coupons, key=lambda entry: entry[1][2])
+        return [(code, orders, discount, revenue) for code, (orders, discount, revenue) in top]
+
+    def summary(self) -> Dict:
+        """The overall figures, plus revenue per size"""
+        return {'orders': self.orders, 'items': self.items, 'subtotal': self.subtotal, 'discount': self.discount,
+                'gst': self.gst, 'revenue': self.revenue, 'discounted_orders': self.discounted_orders,
+                'average_discount': self.average_discount,
+                'average_discount_percent': self.average_discount_percent,
+                'by_size': {size: tuple(totals) for size, totals in self.by_size.items()}}
+
+    def to_state(self) -> Dict:
+        state = {field: getattr(self, field) for field in ('orders', 'items', 'subtotal', 'discount', 'gst',
+                                                            'revenue', 'discounted_orders', 'by_size', 'by_coupon')}
+        state['by_plant'] = [[plant_id] + totals for plant_id, totals in self.by_plant.items()]
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'SalesTotals':
+        totals = cls()
+        for field, value in state.items():
+            if field != 'by_plant':
+                setattr(totals, field, value)
+        totals.by_plant = {row[0]: row[1:] for row in state['by_plant']}
+        return totals
+
+
+class SalesAnalytics:
+    """SalesTotals of an order log, caught up incrementally and checkpointed to `checkpoint_path`"""
+
+    def __init__(self, log_path: str, checkpoint_path: Optional[str] = None, checkpoint_every: int = 10_000):
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.Lock()
+        self._offset = 0  # log bytes folded into the totals so far
+        self._last_line = -1  # offset of the last folded line, to recognise the same log after a restart
+        self._since_checkpoint = 0
+        self._cache: Dict[Tuple[str, int], object] = {}  # summary and top lists of the current version
+        self.version = 0  # bumped whenever new orders are folded in
+        self._ready = threading.Event()  # set once the first refresh has caught up with the log
+        self.totals = self._load_checkpoint() or SalesTotals()
+
+    def start(self):
+        """Catch up with the log in a background thread (slow the first time for a long history)"""
+        threading.Thread(target=self.refresh, name="sales-catch-up", daemon=True).start()
+        atexit.register(self.checkpoint)
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the first catch-up with the log; returns whether it has finished"""
+        return self._ready.wait(timeout)
+
+    def _load_checkpoint(self) -> Optional[SalesTotals]:
+        """The saved totals, if they still describe the start of this log"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint['version'] != CHECKPOINT_VERSION or not self._same_log(checkpoint):
+                return None
+            totals = SalesTotals.from_state(checkpoint['totals'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # unreadable: rebuild from the log
+        self._offset, self._last_line = checkpoint['offset'], checkpoint['last_line']
+        return totals
+
+    def _same_log(self, checkpoint: Dict) -> bool:
+        # The line before the saved offset must still be the order the checkpoint ended on
+        if checkpoint['offset'] == 0:
+            return True
+        with open(self.log_path, 'rb') as f:
+            f.seek(checkpoint['last_line'])
+            line = f.readline()
+        return (checkpoint['last_line'] + len(line) == checkpoint['offset'] and line.endswith(b"\n")
+                and json.loads(line).get('order_id') == checkpoint['last_order_id'])
+
+    def refresh(self, wait: bool = True) -> int:
+        """Fold in the orders appended to the log since the last refresh; returns how many.
+
+        wait=False returns 0 straight away if another refresh is running (it
+        will fold in the same orders, or the next refresh will).
+        """
+        if not self._lock.acquire(blocking=wait):
+            return 0
+        try:
+            return self._catch_up()
+        finally:
+            self._lock.release()
+
+    def _catch_up(self) -> int:
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            self._ready.set()
+            return 0  # no orders yet
+        if size < self._offset:  # the log was replaced by a shorter one: start over
+            self.totals, self._offset, self._last_line = SalesTotals(), 0, -1
+        added, last_order_id = 0, None
+        if size > self._offset:
+            with open(self.log_path, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written; picked up next time
+                    order = json.loads(line)
+                    self.totals.add(order)
+                    last_order_id = order.get('order_id')
+                    self._last_line = self._offset
+                    self._offset += len(line)
+                    added += 1
+        if added:
+            self.version += 1
+            self._cache.clear()
+            self._since_checkpoint += added
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._save_checkpoint(last_order_id)
+        self._ready.set()
+        return added
+
+    def _save_checkpoint(self, last_order_id):
+        if not self.checkpoint_path:
+            return
+        checkpoint = {'version': CHECKPOINT_VERSION, 'offset': self._offset, 'last_line': self._last_line,
+                      'last_order_id': last_order_id, 'totals': self.totals.to_state()}
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(checkpoint, f)
+            os.replace(tmp_path, self.checkpoint_path)
+            self._since_checkpoint = 0
+        except OSError:
+            pass  # try again after the next batch of orders
+
+    def checkpoint(self):
+        """Save the totals now (e.g. before shutting down)"""
+        with self._lock:
+            if self._last_line < 0 or not self._since_checkpoint:
+                return
+            try:
+                with open(self.log_path, 'rb') as f:
+                    f.seek(self._last_line)
+                    last_order_id = json.loads(f.readline()).get('order_id')
+            except (OSError, ValueError):
+                return  # the log is gone or was replaced; nothing worth saving
+            self._save_checkpoint(last_order_id)
+
+    def _cached(self, key: Tuple[str, int], compute):
+        # Computed once per version of the totals, then every read is a dict lookup
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                value = self._cache[key] = compute()
+            return value
+
+    def summary(self) -> Dict:
+        """Overall figures and revenue per size (see SalesTotals.summary)"""
+        return self._cached(('summary', 0), self.totals.summary)
+
+    def top_plants(self, n: int = 10) -> List[Tuple[int, str, int, float]]:
+        """Best selling plants by revenue"""
+        return self._cached(('plants', n), lambda: self.totals.top_plants(n))
+
+    def top_coupons(self, n: int = 10) -> List[Tuple[str, int, float, float]]:
+        """Coupons that brought in the most revenue"""
+        return self._cached(('coupons', n), lambda: self.totals.top_coupons(n))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the sales totals checkpoint of an order log")
+    parser.add_argument('log', help="Order log (one JSON order per line)")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <log>.analytics)")
+    args = parser.parse_args(argv)
+
+    analytics = SalesAnalytics(args.log, args.checkpoint or f"{args.log}.analytics")
+    added = analytics.refresh()
+    analytics.checkpoint()
+    totals = analytics.totals
+    print(f"{added} new orders folded in, {totals.orders} in total")
+    print(f"Revenue ${totals.revenue:,.2f}  GST ${totals.gst:,.2f}  "
+          f"average discount ${totals.average_discount:.2f} ({totals.average_discount_percent:.1f}%)")
+    for size, (units, revenue) in sorted(totals.by_size.items()):
+        print(f"  {size:8} {units:10,} units  ${revenue:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
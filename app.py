@@ -1,7 +1,22 @@
 import streamlit as st
-import json
 import math
+import os
+import secrets
+import uuid
 from typing import List, Dict
+from catalog import CatalogStore
+from coupons import CouponTable
+from images import ThumbnailCache
+from orders import OrderLog
+from checkout_queue import CheckoutQueue, CheckoutQueueFull
+from analytics import SalesAnalytics
+from inventory import OutOfStock, open_inventory
+from cart import Cart
+from pricing import Quote, quote_totals
+from metrics import span, start_exporter, timed
+from sessions import SessionCache, open_session_store
+from search import SearchIndex, ranked_tiers, tier_positions
+from ordering import SORT_OPTIONS, SortIndex
 
 # Configure the page
 st.set_page_config(
@@ -10,7 +25,8 @@ st.set_page_config(
     layout="wide"
 )
 # Custom CSS for better styling
-st.markdown("""
+with span('page_css'):
+    st.markdown("""
     <style>
     /* Main color scheme */
     :root {
@@ -134,53 +150,225 @@ st.markdown("""
     }
     </style>
 """, unsafe_allow_html=True)
+# Card images are served from local thumbnails instead of the remote hosts
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_CACHE_BYTES = 32 * 1024 * 1024
+
+# Catalog file: plants_data.json, or an indexed SQLite file built with `python catalog.py`
+PLANTS_DATA_PATH = os.environ.get('PLANTS_DATA_PATH', 'plants_data.json')
+
+COUPONS_DATA_PATH = os.environ.get('COUPONS_DATA_PATH', 'coupons.json')
+
+# Orders are appended to this log and survive restarts
+ORDERS_LOG_PATH = os.environ.get('ORDERS_LOG_PATH', 'orders.log')
+# Sales totals are checkpointed next to the order log, so a restart doesn't re-read every order
+ANALYTICS_PATH = os.environ.get('ANALYTICS_PATH', f'{ORDERS_LOG_PATH}.analytics')
+# The Sales Dashboard is for staff: it is only offered when a key is set, and asks for it
+SALES_DASHBOARD_KEY = os.environ.get('SALES_DASHBOARD_KEY', '')
+
+# Carts are saved under a token kept in a browser cookie (never in the URL, which gets shared):
+# a SQLite file shared by every server process, or ':memory:' to keep them in this process only
+SESSION_COOKIE = 'plant_session'
+SESSIONS_DB_PATH = os.environ.get('SESSIONS_DB_PATH', 'sessions.db')
+SESSION_TTL = float(os.environ.get('SESSION_TTL_DAYS', '30')) * 24 * 3600
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+
+# Units sold per plant, checked against the catalog's stock at checkout (':memory:' for this process only);
+# the SQLite counts are split over INVENTORY_SHARDS files so checkouts of different plants don't share a lock
+INVENTORY_DB_PATH = os.environ.get('INVENTORY_DB_PATH', 'inventory.db')
+INVENTORY_SHARDS = int(os.environ.get('INVENTORY_SHARDS', '16'))
+
+# Checked-out orders are written to the order log by background workers; checkout is
+# refused (and the cart kept) once this many orders are waiting
+CHECKOUT_WORKERS = int(os.environ.get('CHECKOUT_WORKERS', '2'))
+CHECKOUT_QUEUE_SIZE = int(os.environ.get('CHECKOUT_QUEUE_SIZE', '1000'))
+# Accepted orders are kept here until they reach the order log, and replayed after a crash
+CHECKOUT_SPOOL_DIR = os.environ.get('CHECKOUT_SPOOL_DIR', f'{ORDERS_LOG_PATH}.spool')
+
 # Load data functions
-@st.cache_data
-def load_plants_data():
-    with open('plants_data.json', 'r') as f:
-        return json.load(f)
+@st.cache_resource
+def load_catalog_store():
+    """Versioned catalog snapshots; edits to the catalog file are loaded in the background"""
+    return CatalogStore(PLANTS_DATA_PATH)
 
-@st.cache_data
-def load_coupons_data():
-    with open('coupons.json', 'r') as f:
-        return json.load(f)
+@timed()
+def load_plants_data():
+    """Return the plant catalog repository pinned for this rerun (JSON in memory or SQLite on disk)"""
+    return st.session_state.catalog_snapshot.catalog
+
+@st.cache_resource(max_entries=2)
+def load_search_index(catalog_version: int):
+    """Inverted index over plant names and descriptions, built once per catalog version"""
+    return SearchIndex.from_catalog(load_plants_data())
+
+@st.cache_resource(max_entries=2)
+def load_sort_index(catalog_version: int):
+    """Presorted price and name permutations, built once per catalog version"""
+    return SortIndex.from_catalog(load_plants_data())
+
+def search_matches(catalog_version: int, query: str):
+    """Return the search index's (name, anywhere) match bitsets, or None without a query"""
+    return load_search_index(catalog_version).match(query) if query else None
+
+def price_range_bits(catalog_version: int, price_range):
+    """Return the bitset of plants inside the price range, or None when no range is set"""
+    return load_sort_index(catalog_version).price_bits(*price_range) if price_range else None
+
+@st.cache_data(max_entries=1024)
+def load_facet_counts(catalog_version: int, facet: str, filters_key: tuple, query: str = "", price_range=None):
+    """Facet value counts for a selection (and search query / price range), cached per catalog version"""
+    catalog = load_plants_data()
+    matches = search_matches(catalog_version, query)
+    in_price = price_range_bits(catalog_version, price_range)
+    if matches is None and in_price is None:
+        return catalog.facet_counts(facet, dict(filters_key))
+    others = {name: selected for name, selected in filters_key if name != facet}
+    base = catalog.match(others)
+    if matches is not None:
+        base &= matches[1]
+    if in_price is not None:
+        base &= in_price
+    return {value: (catalog.match({facet: [value]}) & base).bit_count() for value in catalog.facet_values(facet)}
+
+@st.cache_resource
+def load_thumbnail_cache():
+    """Shared thumbnail cache so each image is only fetched and resized once"""
+    return ThumbnailCache(THUMBNAIL_DIR, size=THUMBNAIL_SIZE, max_bytes=THUMBNAIL_CACHE_BYTES)
+
+@st.cache_resource
+def load_order_log():
+    """Open the shared order log (recovers from a crash on first open) and index it by customer in the background"""
+    return OrderLog(ORDERS_LOG_PATH).build_index_in_background()
+
+@st.cache_resource
+def load_inventory():
+    """Sold counts shared by every session; checkouts reserve their units here"""
+    return open_inventory(INVENTORY_DB_PATH, INVENTORY_SHARDS)
+
+@st.cache_resource
+def load_analytics():
+    """Sales totals of the order log, caught up in the background and then kept current"""
+    return SalesAnalytics(ORDERS_LOG_PATH, ANALYTICS_PATH).start()
+
+@st.cache_resource
+def load_checkout_queue():
+    """Background order writer shared by every session; a failed order gives its stock back"""
+    inventory, analytics = load_inventory(), load_analytics()
+
+    def release_stock(snapshot, error):
+        # Against the stock the units were reserved with, not whatever catalog version is current now
+        quantities = {int(plant_id): item['quantity'] for plant_id, item in snapshot.order()['items'].items()}
+        inventory.release(quantities, dict(snapshot.stock))
+
+    # Every written order is folded into the sales totals (skipped while a catch-up is running, which includes it)
+    checkout_queue = CheckoutQueue(load_order_log(), workers=CHECKOUT_WORKERS, max_pending=CHECKOUT_QUEUE_SIZE,
+                                   hooks=[lambda order_id, snapshot: analytics.refresh(wait=False)],
+                                   on_failed=release_stock, spool_dir=CHECKOUT_SPOOL_DIR)
+    checkout_queue.register_gauges()
+    return checkout_queue
+
+@st.cache_resource
+def load_coupon_table():
+    """Coupon hash index shared by every session, reloaded when coupons.json changes"""
+    return CouponTable(COUPONS_DATA_PATH)
+
+@st.cache_resource
+def load_session_cache():
+    """Write-behind cache over the session store, shared by every session of this process"""
+    return SessionCache(open_session_store(SESSIONS_DB_PATH), max_sessions=SESSION_CACHE_SIZE, ttl=SESSION_TTL)
+
+def restore_session():
+    """Pick up the cart and customer id saved under the browser's session cookie, or start a new session"""
+    if 'session' in st.query_params:
+        del st.query_params['session']  # links from before the cookie carried the token; don't keep it in the URL
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if not isinstance(token, str):
+        token = None  # no browser behind this run (e.g. AppTest), so no real cookies
+    # Re-read the store: the last rerun of this session may have been served by another process
+    state = load_session_cache().get(token, refresh=True) if token else None
+    if state is None:
+        token = secrets.token_urlsafe(32)
+    else:
+        st.session_state.customer_id = state['customer_id']
+        st.session_state.cart = Cart.from_state(state['cart'])
+    set_session_cookie(token)  # also pushes the expiry of a returning session back
+    st.session_state.session_token = token
+    save_session()
+
+def set_session_cookie(token: str):
+    """Store the session token in a first-party cookie; it is sent with the next visit's connection"""
+    secure = "(location.protocol === 'https:' ? '; Secure' : '')"
+    st.html(f"<script>document.cookie = '{SESSION_COOKIE}={token}; path=/; max-age={int(SESSION_TTL)}; "
+            f"SameSite=Strict' + {secure};</script>", unsafe_allow_javascript=True)
+
+def save_session():
+    """Hand the cart to the session cache if it changed (it is written to the store in the background)"""
+    state = {'customer_id': st.session_state.customer_id, 'cart': st.session_state.cart.to_state()}
+    if state != st.session_state.get('saved_session'):
+        load_session_cache().put(st.session_state.session_token, state)
+        st.session_state.saved_session = state
+
+SIZE_ORDER = ['small', 'medium', 'big']
+
+# Plant grid settings: only one page of cards is built per rerun
+GRID_MODES = ['Pages', 'Load more']
+PAGE_SIZE_OPTIONS = [8, 16, 32, 64]
+DEFAULT_PAGE_SIZE = 16
+HISTORY_PAGE_SIZE = 10
+LOW_STOCK = 5  # cards show "Only N left" from here down
 
 # Initialize session state
 if 'cart' not in st.session_state:
-    st.session_state.cart = {}
+    st.session_state.cart = Cart()
 
-if 'history' not in st.session_state: #create session state for history to save data
-    st.session_state.history = {}
+if 'customer_id' not in st.session_state: # orders in the order log are keyed by this id
+    st.session_state.customer_id = uuid.uuid4().hex
 
 if 'page' not in st.session_state:
     st.session_state.page = 'main'
 
+if 'grid_page' not in st.session_state:
+    st.session_state.grid_page = 0
+
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
+
+if 'session_token' not in st.session_state: # first rerun of this browser session
+    restore_session()
+
+# Timing histograms are exported in the background when PLANT_METRICS=1
+start_exporter()
 
+# Started with the app rather than at the first checkout, so orders a crashed process left in the spool are written now
+load_checkout_queue()
 
-def add_to_cart(plant_id: int, plant_name: str, plant_price: float):
+# Pin the catalog for this rerun; a newer version swapped in meanwhile is used from the next rerun
+st.session_state.catalog_snapshot = load_catalog_store().current()
+
+
+
+def add_button_key(plant_id: int) -> str:
+    """Fragment key of a card's Add to Cart button and confirmation"""
+    return f"add_button_{plant_id}"
+
+def add_to_cart(plant_id: int, plant_name: str, plant_price: float, plant_size: str = ""):
     """Add a plant to the cart"""
-    if plant_id in st.session_state.cart:
-        st.session_state.cart[plant_id]['quantity'] += 1
-    else:
-        st.session_state.cart[plant_id] = {
-            'name': plant_name,
-            'price': plant_price,
-            'quantity': 1
-        }
+    st.session_state.cart.add(plant_id, plant_name, plant_price, plant_size)
     # Set flag to show success message under the corresponding button
-    st.session_state.last_added = plant_name
-    # cart = { 
-    #   plant_id: {
-    #       'name': plant_name, 
-    #       'price': plant_price, 
-    #       'quantity': 1
-    #   } 
-    #}
+    previous = st.session_state.get('last_added')
+    st.session_state.last_added = plant_id
+    # Only rerun the cart summary and the buttons whose confirmation changed, not the whole page
+    targets = ['cart_summary', add_button_key(plant_id)]
+    if previous != plant_id and previous in st.session_state.get('grid_plant_ids', ()):
+        targets.append(add_button_key(previous))
+    save_session()  # main() doesn't get to the end of a fragment rerun
+    st.rerun(targets)
 
 def remove_from_cart(plant_id: int):
     """Remove a plant from the cart"""
     if plant_id in st.session_state.cart:
-        del st.session_state.cart[plant_id]
+        st.session_state.cart.remove(plant_id)
         st.rerun()
 
 def update_quantity(plant_id: int, new_quantity: int):
@@ -188,76 +376,52 @@ def update_quantity(plant_id: int, new_quantity: int):
     if new_quantity <= 0:
         remove_from_cart(plant_id)
     else:
-        st.session_state.cart[plant_id]['quantity'] = new_quantity
-
-def calculate_total():
-    """Calculate total cart value"""
-    total = 0
-    for item in st.session_state.cart.values():
-        total += item['price'] * item['quantity']
-    return total
-
-
-def calculate_size_discount(plants: List[Dict], subtotal: float):
-    """Return automatic size-based discount (amount, percent, label).
-
-    Rules:
-    - 3 or more big plants → 20%
-    - 4 or more medium plants → 15%
-    - 5 or more small plants → 10%
-
-    Chooses the highest eligible discount and applies it to the whole subtotal.
-    """
-    if not st.session_state.cart:
-        return 0.0, 0, ""
-
-    id_to_size = {p['id']: p['size'] for p in plants}
-    size_counts = {"big": 0, "medium": 0, "small": 0}
-
-    for plant_id, item in st.session_state.cart.items():
-        size = id_to_size.get(plant_id)
-        if size in size_counts:
-            size_counts[size] += item['quantity']
-
-    candidates = []
-    if size_counts["big"] >= 3:
-        candidates.append((20, "3 big plants"))
-    if size_counts["medium"] >= 4:
-        candidates.append((15, "4 medium plants"))
-    if size_counts["small"] >= 5:
-        candidates.append((10, "5 small plants"))
-
-    if not candidates:
-        return 0.0, 0, ""
-
-    best_percent, label = max(candidates, key=lambda t: t[0])
-    discount_amount = subtotal * (best_percent / 100)
-    return discount_amount, best_percent, label
-
-
-def apply_coupon(coupon_code: str, total: float):
-    """Apply coupon discount"""
-    coupons = load_coupons_data()
-    if coupon_code.upper() in coupons['coupons']:
-        discount_percent = coupons['coupons'][coupon_code.upper()]['discount_percent']
-        discount_amount = total * (discount_percent / 100)
-        return discount_amount, discount_percent
-    return 0, 0
-
-def filter_plants(plants: List[Dict], size_filter: List[str], color_filter: List[str]):
-    """Filter plants based on size and color"""
-    filtered = []
-    for plant in plants:
-        size_match = not size_filter or plant['size'] in size_filter
-        color_match = not color_filter or plant['color'] in color_filter
-        if size_match and color_match:
-            filtered.append(plant)
-    return filtered
-
-def display_plant_card(plant: Dict):
-    """Display a single plant card"""
+        st.session_state.cart.set_quantity(plant_id, new_quantity)
+
+def apply_cart_edits(plant_ids: List[int]):
+    """Apply the quantities and removals staged in the batch edit form, all in one go"""
+    quantities = {}
+    for plant_id in plant_ids:
+        if st.session_state.get(f"batch_remove_{plant_id}"):
+            quantities[plant_id] = 0
+        else:
+            quantities[plant_id] = st.session_state.get(f"batch_qty_{plant_id}", st.session_state.cart[plant_id].quantity)
+    st.session_state.cart.update(quantities)
+
+@timed()
+def quote_cart(coupon_percent: float = 0) -> Quote:
+    """Price the cart from its running totals: O(1) whatever the number of lines"""
+    cart = st.session_state.cart
+    return quote_totals(cart.subtotal, cart.size_counts, coupon_percent)
+
+@timed()
+def get_coupon_percent(coupon_code: str):
+    """Return the discount percent of a coupon code, 0 if it doesn't exist"""
+    return load_coupon_table().snapshot().percent(coupon_code)
+
+@timed()
+def show_add_button(plant: Dict, available=None):
+    """Add to Cart button and its confirmation; a fragment of its own so adding reruns just this"""
+    cart = st.session_state.cart
+    in_cart = cart[plant['id']].quantity if plant['id'] in cart else 0
+    st.button(
+        "Add to Cart",
+        key=f"add_{plant['id']}",
+        use_container_width=True,
+        disabled=available is not None and in_cart >= available, # no more than is left in stock
+        on_click=add_to_cart,
+        args=(plant['id'], plant['name'], plant['price'], plant['size'])
+    )
+    if st.session_state.get("last_added") == plant["id"]: # ✅ Show success message right below the button
+        st.success(f"Added {plant['name']} to cart!")
+
+@timed()
+def display_plant_card(plant: Dict, available=None):
+    """Display a single plant card (available: units left in stock, None if untracked)"""
     with st.container():
-        st.image(plant['image'], width=200)
+        # The browser loads the original URL until the thumbnail has been built in the background
+        thumbnail = load_thumbnail_cache().get(plant['image'])
+        st.image(thumbnail if thumbnail is not None else plant['image'], width=200)
         st.subheader(plant['name'])
         st.write(plant['description'])
         st.write(f"**${plant['price']:.2f}**")
@@ -268,51 +432,124 @@ def display_plant_card(plant: Dict):
             st.caption(f"Size: {plant['size'].title()}")
         with col2:
             st.caption(f"Color: {plant['color'].title()}")
+        if available == 0:
+            st.caption("Out of stock")
+        elif available is not None and available <= LOW_STOCK:
+            st.caption(f"Only {available} left")
+
+        # One keyed fragment per card, so add_to_cart can rerun exactly the buttons it changed
+        st.fragment(show_add_button, key=add_button_key(plant['id']))(plant, available)
+
+def size_sort_key(size: str):
+    """Sort sizes small → medium → big, unknown sizes last"""
+    return (SIZE_ORDER.index(size) if size in SIZE_ORDER else len(SIZE_ORDER), size)
+
+def selected_facet_values(facet: str, values: List[str]) -> List[str]:
+    """Return the facet values whose sidebar checkbox is ticked"""
+    return [value for value in values if st.session_state.get(f"{facet}_{value}")]
+
+def price_slider_bounds(catalog_version: int) -> tuple:
+    """Whole-dollar slider bounds covering every price in the catalog (read off the presorted prices)"""
+    sort_index = load_sort_index(catalog_version)
+    if not sort_index.size:
+        return 0.0, 1.0
+    low, high = float(math.floor(sort_index.min_price)), float(math.ceil(sort_index.max_price))
+    return low, max(high, low + 1)
+
+def selected_price_range(bounds: tuple):
+    """Return the slider's (low, high), or None when it covers the whole catalog"""
+    # Keep the stored range inside the bounds of the current catalog version
+    low, high = st.session_state.get('price_range', bounds)
+    low, high = min(max(low, bounds[0]), bounds[1]), max(min(high, bounds[1]), bounds[0])
+    st.session_state.price_range = (low, high)
+    return None if (low, high) == bounds else (low, high)
+
+def show_plant_grid(plants: List[Dict]):
+    """Display plants in rows of 4"""
+    # add_to_cart only reruns the confirmation of a card that is still on screen
+    st.session_state.grid_plant_ids = {plant['id'] for plant in plants}
+    with span('stock_levels'):
+        available = load_inventory().available(plants) # one lookup for the whole page
+    plants_per_row = 4
+    num_rows = math.ceil(len(plants) / plants_per_row)
+
+    for row in range(num_rows):
+        cols = st.columns(plants_per_row)
+        for col_idx in range(plants_per_row):
+            plant_idx = row * plants_per_row + col_idx
+            if plant_idx < len(plants):
+                with cols[col_idx]:
+                    display_plant_card(plants[plant_idx], available.get(plants[plant_idx]['id']))
 
-        # Use on_click callback so session_state updates before sidebar re-renders
-        st.button(
-            "Add to Cart",
-            key=f"add_{plant['id']}",
-            use_container_width=True,
-            on_click=add_to_cart,
-            args=(plant['id'], plant['name'], plant['price'])
-        )
-        if st.session_state.get("last_added") == plant["name"]: # ✅ Show success message right below the button
-            st.success(f"Added {plant['name']} to cart!")
+@st.fragment(key='cart_summary')
+@timed()
+def show_cart_summary():
+    """Sidebar cart metric; reruns on its own when a plant is added"""
+    st.metric("🛒 Items in Cart", st.session_state.cart.item_count)
+
+def change_grid_page(page: int):
+    """Move the plant grid to another page (or load up to that page)"""
+    st.session_state.grid_page = page
+
+@timed()
 def show_main_page():
     """Display the main shopping page"""
     st.title("🌱 Garden Paradise - Plant Shop")
     st.markdown("*Beautiful plants anyone can grow outdoors*")
 
     # Load plants data
-    plants_data = load_plants_data()
-    plants = plants_data['plants']
+    catalog = load_plants_data()
+    catalog_version = st.session_state.catalog_snapshot.version
+
+    # Search box: every word is matched as a prefix of a word in the name or description
+    query = st.text_input("🔎 Search plants", key="search_query",
+                          placeholder="Search by name or description").strip()
+    if query:
+        last_word = query.split()[-1].lower()
+        hints = [hint for hint in load_search_index(catalog_version).suggest(last_word) if hint != last_word]
+        if hints:
+            st.caption("Try: " + ", ".join(hints))
 
     # Create sidebar for filters
     with st.sidebar:
         st.header("🔍 Filters")
 
+        # Facet values and counts are precomputed per catalog version; the counts
+        # follow the selections already made in the other facet ("Red (14)")
+        size_options = sorted(catalog.facet_values('size'), key=size_sort_key)
+        color_options = catalog.facet_values('color')
+        selected_sizes = selected_facet_values('size', size_options)
+        selected_colors = selected_facet_values('color', color_options)
+        filters_key = (('size', tuple(selected_sizes)), ('color', tuple(selected_colors)))
+        price_bounds = price_slider_bounds(catalog_version)
+        price_range = selected_price_range(price_bounds)
+
         # Size filter
         st.subheader("Plant Size")
-        size_options = ['small', 'medium', 'big']
-        selected_sizes = []
+        size_counts = load_facet_counts(catalog_version, 'size', filters_key, query, price_range)
         for size in size_options:
-            if st.checkbox(size.title(), key=f"size_{size}"):
-                selected_sizes.append(size)
+            st.checkbox(f"{size.title()} ({size_counts.get(size, 0)})", key=f"size_{size}")
 
         # Color filter
         st.subheader("Plant Color")
-        color_options = list(set([plant['color'] for plant in plants]))
-        color_options.sort()
-        selected_colors = []
+        color_counts = load_facet_counts(catalog_version, 'color', filters_key, query, price_range)
         for color in color_options:
-            if st.checkbox(color.title(), key=f"color_{color}"):
-                selected_colors.append(color)
+            st.checkbox(f"{color.title()} ({color_counts.get(color, 0)})", key=f"color_{color}")
+
+        # Price filter
+        st.subheader("Price")
+        st.slider("Price range ($)", min_value=price_bounds[0], max_value=price_bounds[1], step=1.0, key="price_range")
+
+        # Grid settings
+        st.subheader("Display")
+        sort = st.selectbox("Sort by", SORT_OPTIONS, key="sort_order")
+        grid_mode = st.radio("Grid mode", GRID_MODES, horizontal=True, key="grid_mode")
+        page_size = st.selectbox("Plants per page", PAGE_SIZE_OPTIONS,
+                                 index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE), key="page_size")
 
         # Cart summary
         st.divider()
-        cart_count = sum(item['quantity'] for item in st.session_state.cart.values())
-        st.metric("🛒 Items in Cart", cart_count)
+        show_cart_summary()
 
         if st.button("View Cart", use_container_width=True):
             st.session_state.page = 'cart'
@@ -322,118 +559,124 @@ def show_main_page():
             st.session_state.page = 'history'
             st.rerun()
 
-    # Filter plants
-    filtered_plants = filter_plants(plants, selected_sizes, selected_colors)
+        elif SALES_DASHBOARD_KEY and st.button("Sales Dashboard", use_container_width=True):
+            st.session_state.page = 'sales'
+            st.rerun()
 
-    if not filtered_plants:
-        st.warning("No plants match your current filters. Try adjusting your selection.")
-        return
+    show_plant_results({'size': selected_sizes, 'color': selected_colors}, query, price_range,
+                       sort, grid_mode, page_size)
 
-    # Display plants in rows of 4
-    plants_per_row = 4
-    num_rows = math.ceil(len(filtered_plants) / plants_per_row)
+@st.fragment(key='plant_grid')
+@timed()
+def show_plant_results(filters: Dict[str, List[str]], query: str, price_range, sort: str,
+                       grid_mode: str, page_size: int):
+    """Matching plants, one page of cards and the page navigation; paging reruns only this fragment"""
+    catalog = load_plants_data()
+    catalog_version = st.session_state.catalog_snapshot.version
 
-    for row in range(num_rows):
-        cols = st.columns(plants_per_row)
-        for col_idx in range(plants_per_row):
-            plant_idx = row * plants_per_row + col_idx
-            if plant_idx < len(filtered_plants):
-                with cols[col_idx]:
-                    display_plant_card(filtered_plants[plant_idx])
+    # Filter plants
+    with span('filter_count'):
+        matches = search_matches(catalog_version, query)
+        in_price = price_range_bits(catalog_version, price_range)
+        if matches is None and in_price is None and sort == 'Featured':
+            tiers = None
+            total_matches = catalog.count(filters)
+        else:
+            # Facet filters AND price range; search hits are split into ranked tiers (name matches first)
+            bits = catalog.match(filters)
+            if in_price is not None:
+                bits &= in_price
+            tiers = ranked_tiers(matches, bits) if matches is not None else [bits]
+            total_matches = sum(tier.bit_count() for tier in tiers)
+
+    if not total_matches:
+        st.session_state.grid_plant_ids = set()
+        st.warning("No plants match your current filters. Try adjusting your selection.")
+        return
 
+    # Go back to the first page whenever the filters or the grid settings change
+    grid_state = (tuple(filters['size']), tuple(filters['color']), query, price_range, sort, grid_mode, page_size)
+    if st.session_state.get('grid_state') != grid_state:
+        st.session_state.grid_state = grid_state
+        st.session_state.grid_page = 0
+
+    # Only build the cards for the visible slice
+    num_pages = math.ceil(total_matches / page_size)
+    if grid_mode == 'Pages':
+        page = min(st.session_state.grid_page, num_pages - 1)
+        start, stop = page * page_size, (page + 1) * page_size
+    else:
+        start, stop = 0, (st.session_state.grid_page + 1) * page_size
+    with span('filter_page'):
+        if tiers is None:
+            visible_plants = catalog.page(filters, start, stop - start)
+        elif sort == 'Featured':
+            visible_plants = catalog.plants_at(tier_positions(tiers, start, stop))
+        else:
+            # A sort order replaces the relevance ranking: walk the presorted permutation
+            combined = 0
+            for tier in tiers:
+                combined |= tier
+            visible_plants = catalog.plants_at(load_sort_index(catalog_version).positions(sort, combined, start, stop))
+
+    st.caption(f"Showing {start + 1}-{start + len(visible_plants)} of {total_matches} plants")
+    show_plant_grid(visible_plants)
+
+    if grid_mode == 'Pages':
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            st.button("← Previous", disabled=page == 0, use_container_width=True,
+                      on_click=change_grid_page, args=(page - 1,))
+        with nav_col2:
+            st.markdown(f"<div style='text-align: center'>Page {page + 1} of {num_pages}</div>", unsafe_allow_html=True)
+        with nav_col3:
+            st.button("Next →", disabled=page >= num_pages - 1, use_container_width=True,
+                      on_click=change_grid_page, args=(page + 1,))
+    elif stop < total_matches:
+        st.button("Load more", use_container_width=True,
+                  on_click=change_grid_page, args=(st.session_state.grid_page + 1,))
+
+@timed()
 def show_coupon_page():
     """Coupon Page"""
     st.title("Coupon Page")
 
-    # Load coupon data
-    with open('coupons.json', 'r') as f:
-        data = json.load(f)
-    coupons_data = data["coupons"]
-
-    # Define CSS style for rounded boxes
-    st.markdown("""
-    <style>
-    .rounded-box {
-        border: 2px solid #000000;
-        border-radius: 12px;
-        padding: 15px;
-        margin-bottom: 20px;
-        background-color: #E3EEEF;
-    }
-    .coupon-key {
-        font-weight: bold;
-        font-size: 22px;
-        color: #333333;
-        margin-bottom: 10px;
-    }
-    .coupon-info {
-        font-size: 18px;
-        color: #070D0D;
-        margin-left: 10px;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-    # Render each coupon inside its own rounded box
-    for code, details in coupons_data.items():
-        st.markdown(f"""
-        <div class='rounded-box'>
-            <div class='coupon-key'>{code}</div>
-            <div class='coupon-info'>Discount: {details['discount_percent']}%</div>
-            <div class='coupon-info'>Description: {details['description']}</div>
-        </div>
-        """, unsafe_allow_html=True)
+    # Coupon boxes (and their CSS) are rendered once per coupon snapshot
+    with span('coupon_html'):
+        st.markdown(load_coupon_table().snapshot().html, unsafe_allow_html=True)
 
     # Back button
     if st.button("← Back to Cart"):
         st.session_state.page = 'cart'
         st.rerun()
 
-def show_cart_page():
-    """Display the cart page"""
-    st.title("🛒 Your Shopping Cart")
-
-    if st.button("← Back to Shop"):
-        st.session_state.page = 'main'
-        st.rerun()
-    
-    if st.button("View Coupons"):
-        st.session_state.page = 'coupon'
-        st.rerun()
-
-    if not st.session_state.cart:
-        st.info("Your cart is empty! Go back to the shop to add some plants.")
-        return
-
-    # Display cart items
-    st.subheader("Cart Items")
-
-    # Create a container for cart items
+def show_cart_lines():
+    """Cart lines with live quantity inputs and Remove buttons (each change reruns the page)"""
     for plant_id, item in st.session_state.cart.items():
         with st.container():
             col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
 
             with col1:
-                st.write(f"**{item['name']}**")
+                st.write(f"**{item.name}**")
 
             with col2:
-                st.write(f"${item['price']:.2f}")
+                st.write(f"${item.price:.2f}")
 
             with col3:
                 # Quantity selector
                 new_quantity = st.number_input(
                     "Qty", 
                     min_value=1, 
-                    value=item['quantity'], 
+                    value=item.quantity, 
                     key=f"qty_{plant_id}",
                     label_visibility="collapsed"
                 )
-                if new_quantity != item['quantity']:
+                if new_quantity != item.quantity:
                     update_quantity(plant_id, new_quantity)
                     st.rerun()
 
             with col4:
-                subtotal = item['price'] * item['quantity']
+                subtotal = item.price * item.quantity
                 st.write(f"${subtotal:.2f}")
 
             with col5:
@@ -442,17 +685,50 @@ def show_cart_page():
 
         st.divider()
 
-    # Calculate totals
-    total_noGST = calculate_total()
+def show_cart_batch_form():
+    """Cart lines in a form: edits are staged in the browser and applied together on submit"""
+    items = list(st.session_state.cart.items())
+    with st.form("cart_batch_edit_form"):
+        for plant_id, item in items:
+            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+            with col1:
+                st.write(f"**{item.name}**")
+            with col2:
+                st.write(f"${item.price:.2f}")
+            with col3:
+                st.number_input("Qty", min_value=0, value=item.quantity, key=f"batch_qty_{plant_id}",
+                                label_visibility="collapsed")
+            with col4:
+                st.checkbox("Remove", key=f"batch_remove_{plant_id}")
+        # One rerun (and one re-quote) for the whole batch
+        st.form_submit_button("Apply changes", use_container_width=True,
+                              on_click=apply_cart_edits, args=([plant_id for plant_id, _ in items],))
+
+@timed()
+def show_cart_page():
+    """Display the cart page"""
+    st.title("🛒 Your Shopping Cart")
+
+    if st.button("← Back to Shop"):
+        st.session_state.page = 'main'
+        st.rerun()
+    
+    if st.button("View Coupons"):
+        st.session_state.page = 'coupon'
+        st.rerun()
 
-    # Load plants for size lookups and compute automatic size discount
-    plants_data = load_plants_data()
-    auto_discount_amount, auto_discount_percent, auto_discount_label = calculate_size_discount(plants_data['plants'], total_noGST)
+    if not st.session_state.cart:
+        st.info("Your cart is empty! Go back to the shop to add some plants.")
+        return
 
-    subtotal_after_auto = total_noGST - auto_discount_amount
-    GST_amount = subtotal_after_auto * 0.1
-    final_total = subtotal_after_auto + GST_amount
+    # Display cart items
+    st.subheader("Cart Items")
 
+    if st.toggle("Batch edit", key="cart_batch_edit",
+                 help="Change several quantities and removals, then apply them together"):
+        show_cart_batch_form()
+    else:
+        show_cart_lines()
 
     # Coupon section
     st.subheader("💰 Coupon Code")
@@ -461,14 +737,20 @@ def show_cart_page():
     with coupon_col1:
         coupon_code = st.text_input("Enter coupon code:", placeholder="e.g., WELCOME10")
 
-    discount_amount = 0
-    discount_percent = 0
+    # Quote the whole cart in one pass: subtotal, size discount, coupon and GST
+    quote = quote_cart(get_coupon_percent(coupon_code) if coupon_code else 0)
+    total_noGST = quote.subtotal
+    auto_discount_amount = quote.size_discount
+    auto_discount_percent = quote.size_discount_percent
+    auto_discount_label = quote.size_discount_label
+    discount_amount = quote.coupon_discount
+    discount_percent = quote.coupon_percent
+    GST_amount = quote.gst
+    final_total = quote.total
 
     if coupon_code:
-        discount_amount, discount_percent = apply_coupon(coupon_code, subtotal_after_auto)
         if discount_amount > 0:
             st.success(f"Coupon applied! You saved {discount_percent}% (${discount_amount:.2f})")
-            GST_amount = (subtotal_after_auto - discount_amount) * 0.1  # Apply GST to discounted subtotal
         else:
             st.error("Invalid coupon code")
 
@@ -491,34 +773,56 @@ def show_cart_page():
             st.write(f"-${auto_discount_amount:.2f}")
         if discount_amount > 0:
             st.write(f"-${discount_amount:.2f}")
-            final_total = subtotal_after_auto - discount_amount + GST_amount
         st.write(f"${GST_amount:.2f}") #Include GST
         st.write(f"**${final_total:.2f}**")
 
     # Checkout button
     st.divider()
     if st.button("🚀 Proceed to Checkout", use_container_width=True, type="primary"):
-        st.balloons()
-        st.success("Thank you for your order! Your plants will be delivered soon! 🌱")
-        if st.session_state.history:
-            next_key = max(st.session_state.history.keys()) + 1  #Save number of orders
-        else:
-            next_key = 1
-        st.session_state.history[next_key] = {
-            "items": st.session_state.cart.copy(), #copy cart, plant_id(name,price,quantity) 
+        cart = st.session_state.cart
+        quantities = {plant_id: item.quantity for plant_id, item in cart.items()}
+        stock = {plant_id: plant['stock'] for plant_id, plant in load_plants_data().get_many(quantities).items()}
+        try:
+            # All lines or none: a sold-out line leaves the cart (and everyone's stock) as it was
+            load_inventory().reserve(quantities, stock)
+        except OutOfStock as shortage:
+            for plant_id, units in shortage.shortages.items():
+                if units:
+                    st.error(f"Only {units} {cart[plant_id].name} left in stock, please lower the quantity")
+                else:
+                    st.error(f"{cart[plant_id].name} is sold out, please remove it from your cart")
+            return
+        order = {
+            "items": st.session_state.cart.to_dict(), #copy cart, plant_id(name,price,quantity,size) 
             "subtotal": total_noGST, # original subtotal before discounts
             "GST": GST_amount, # GST after discounts
-            "final_total": final_total # final total after all discounts + GST
+            "final_total": final_total, # final total after all discounts + GST
+            "item_count": st.session_state.cart.item_count # for the history header
         }
         total_discount_taken = auto_discount_amount + (discount_amount if discount_amount > 0 else 0)
         if total_discount_taken > 0:
             discount_str = "-$" + str(round(total_discount_taken, 2))
-            st.session_state.history[next_key].update({"Discount": discount_str})
+            order.update({"Discount": discount_str})
         else:
-            st.session_state.history[next_key].update({"Discount": "NIL"})
-        st.session_state.history[next_key].update({"Coupon": coupon_code if discount_amount > 0 else "NIL"})
+            order.update({"Discount": "NIL"})
+        order.update({"Coupon": coupon_code.upper() if discount_amount > 0 else "NIL"}) # codes match case-insensitively
+        order.update({"coupon_discount": discount_amount}) # the coupon's part of the discount, for the sales totals
+        try:
+            # Queued as an immutable snapshot; a worker writes it to the order log in the background
+            load_checkout_queue().submit(st.session_state.customer_id, order, stock)
+        except CheckoutQueueFull:
+            load_inventory().release(quantities, stock) # the order wasn't taken, put the units back
+            st.error("We are taking a lot of orders right now, please try again in a moment.")
+            return
+        except OSError:
+            load_inventory().release(quantities, stock) # couldn't be saved to the spool, so it wasn't taken
+            st.error("We couldn't save your order, please try again in a moment.")
+            return
+        st.balloons()
+        st.success("Thank you for your order! Your plants will be delivered soon! 🌱")
 
-        st.session_state.cart = {}  # Clear cart after checkout
+        st.session_state.cart.clear()  # Clear cart after checkout
+@timed()
 def show_history_page(): #Show Order History page
     """Display the history page"""
     st.title("🚚 Your Order History")
@@ -527,41 +831,132 @@ def show_history_page(): #Show Order History page
         st.session_state.page = 'main'
         st.rerun()
 
-    if not st.session_state.history:
-        st.info("You have not made any orders, Go back to the shop to add some plants.")
+    order_log = load_order_log()
+    total_orders = order_log.count_for(st.session_state.customer_id)
+    pending = load_checkout_queue().pending_for(st.session_state.customer_id)
+    if pending:
+        st.info(f"{pending} new order(s) still being processed, they will show up here in a moment.")
+    if not total_orders:
+        if not pending:
+            st.info("You have not made any orders, Go back to the shop to add some plants.")
         return
 
-    # Display cart items
-    st.subheader("Orders made")
+    # Only the current page of orders is read, newest first
+    num_pages = math.ceil(total_orders / HISTORY_PAGE_SIZE)
+    page = min(st.session_state.history_page, num_pages - 1)
+    orders = order_log.orders_for(st.session_state.customer_id, page * HISTORY_PAGE_SIZE,
+                                  HISTORY_PAGE_SIZE, newest_first=True)
 
-    # Create a container for cart items
-    for order_id, order_data in st.session_state.history.items():
-        st.subheader(f"📦 Order #{order_id}")
-        
-        # Loop through items inside inner dict this order
-        for plant_id, item in order_data["items"].items(): #for each plant_id, run items
-            with st.container():
-                col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
-
-                with col1:
-                    st.write(f"**{item['name']}**")
-
-                with col2:
-                    st.write(f"${item['price']:.2f}")
-
-                with col3:
-                    st.write(f"Qty: {item['quantity']}")
-
-                with col4:
-                    subtotal = item['price'] * item['quantity']
-                    st.write(f"${subtotal:.2f}")
-        st.write(f"Subtotal: ${order_data['subtotal']:.2f}")
-        st.write(f"Discounted amount: {order_data['Discount']},   Coupon Code used: {order_data['Coupon']}")
-        st.write(f"GST Amount: ${order_data['GST']:.2f}")
-        st.write(f"**Final Total: ${order_data['final_total']:.2f}**")
+    st.subheader("Orders made")
+    st.caption(f"{total_orders} orders, newest first")
+
+    for order_data in orders:
+        # Collapsed header built from the totals saved at checkout
+        item_count = order_data.get('item_count', sum(item['quantity'] for item in order_data['items'].values()))
+        header_col1, header_col2 = st.columns([3, 1])
+        with header_col1:
+            st.subheader(f"📦 Order #{order_data['order_id']}")
+            st.caption(f"{item_count} items · Coupon: {order_data['Coupon']} · Discount: {order_data['Discount']}")
+        with header_col2:
+            st.write(f"**${order_data['final_total']:.2f}**")
+            show_items = st.toggle("Show items", key=f"order_items_{order_data['order_id']}")
+
+        # Line items are only built for the orders the user opened
+        if show_items:
+            for plant_id, item in order_data["items"].items(): #for each plant_id, run items
+                with st.container():
+                    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+
+                    with col1:
+                        st.write(f"**{item['name']}**")
+
+                    with col2:
+                        st.write(f"${item['price']:.2f}")
+
+                    with col3:
+                        st.write(f"Qty: {item['quantity']}")
+
+                    with col4:
+                        subtotal = item['price'] * item['quantity']
+                        st.write(f"${subtotal:.2f}")
+            st.write(f"Subtotal: ${order_data['subtotal']:.2f}")
+            st.write(f"Discounted amount: {order_data['Discount']},   Coupon Code used: {order_data['Coupon']}")
+            st.write(f"GST Amount: ${order_data['GST']:.2f}")
+            st.write(f"**Final Total: ${order_data['final_total']:.2f}**")
         st.divider()
+
+    if num_pages > 1:
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            st.button("← Newer", disabled=page == 0, use_container_width=True,
+                      on_click=change_history_page, args=(page - 1,))
+        with nav_col2:
+            st.markdown(f"<div style='text-align: center'>Page {page + 1} of {num_pages}</div>", unsafe_allow_html=True)
+        with nav_col3:
+            st.button("Older →", disabled=page >= num_pages - 1, use_container_width=True,
+                      on_click=change_history_page, args=(page + 1,))
+
+@timed()
+def show_sales_page():
+    """Sales dashboard: reads totals kept up to date as orders are written, nothing is recomputed here"""
+    st.title("📈 Sales Dashboard")
+
+    if st.button("← Back to Shop"):
+        st.session_state.page = 'main'
+        st.rerun()
+
+    if not st.session_state.get('sales_unlocked'):
+        key = st.text_input("Staff key", type="password", key="sales_key")
+        if not key:
+            return
+        if not secrets.compare_digest(key.encode(), SALES_DASHBOARD_KEY.encode()):
+            st.error("Wrong key")
+            return
+        st.session_state.sales_unlocked = True # for the rest of this browser session
+        st.rerun()
+
+    analytics = load_analytics()
+    analytics.refresh(wait=False)  # picks up orders written by other server processes
+    if not analytics.wait_ready(timeout=1.0):
+        st.info("Catching up on the order history, check back in a moment.")
+        return
+    summary = analytics.summary()
+    if not summary['orders']:
+        st.info("No orders yet.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Orders", f"{summary['orders']:,}")
+    col2.metric("Revenue (before GST)", f"${summary['revenue']:,.2f}")
+    col3.metric("GST collected", f"${summary['gst']:,.2f}")
+    col4.metric("Average discount", f"${summary['average_discount']:.2f}",
+                f"{summary['average_discount_percent']:.1f}% of subtotal", delta_color="off")
+
+    st.subheader("Revenue by size")
+    st.table([{"Size": size.title(), "Units": f"{units:,}", "Revenue": f"${revenue:,.2f}"}
+              for size, (units, revenue) in sorted(summary['by_size'].items(), key=lambda entry: size_sort_key(entry[0]))])
+
+    st.subheader("Top plants")
+    st.table([{"Plant": name, "Units": f"{units:,}", "Revenue": f"${revenue:,.2f}"}
+              for _, name, units, revenue in analytics.top_plants(10)])
+
+    st.subheader("Top coupons")
+    coupons = analytics.top_coupons(10)
+    if coupons:
+        st.table([{"Coupon": code, "Orders": f"{orders:,}", "Discount given": f"${discount:,.2f}",
+                   "Revenue": f"${revenue:,.2f}"} for code, orders, discount, revenue in coupons])
+    else:
+        st.caption("No coupons used yet.")
+
+def change_history_page(page: int):
+    """Move the order history to another page"""
+    st.session_state.history_page = page
+
 # Main app logic
+@timed('rerun')
 def main():
+    if st.session_state.page == 'sales' and not SALES_DASHBOARD_KEY:
+        st.session_state.page = 'main' # the dashboard is switched off
     # Navigation
     if st.session_state.page == 'main':
         show_main_page()
@@ -571,6 +966,9 @@ def main():
         show_history_page()
     elif st.session_state.page == 'coupon': #Show Coupon Page
         show_coupon_page()
+    elif st.session_state.page == 'sales':
+        show_sales_page()
+    save_session()
 
 if __name__ == "__main__":
     main()
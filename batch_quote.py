@@ -0,0 +1,203 @@
+"""Re-price a JSONL stream of carts offline with the same rules as the cart page.
+
+Each input line is one cart:
+
+    {"cart_id": "a1", "items": {"1": {"quantity": 2, "price": 33.5}}, "coupon": "WELCOME10"}
+
+`items` may also be a list of {"id": 1, "quantity": 2} objects. A missing
+price means "use the current catalog price", so order history entries can be
+replayed as-is or against today's prices with --catalog-prices.
+
+Usage:
+    python batch_quote.py carts.jsonl -o quotes.jsonl --workers 8
+    python batch_quote.py carts.jsonl --coupon-rate SPRING20=30 > quotes.jsonl
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from catalog import open_catalog
+from coupons import CouponTable
+from pricing import PricingTable, Quote
+
+# Set in each worker process by _init_worker
+_table: PricingTable = None
+_coupon_rates: Dict[str, float] = {}
+_catalog_prices = False
+
+
+def _init_worker(catalog_path: str, coupon_rates: Dict[str, float], catalog_prices: bool):
+    global _table, _coupon_rates, _catalog_prices
+    _table = PricingTable.from_catalog(open_catalog(catalog_path))
+    _coupon_rates = coupon_rates
+    _catalog_prices = catalog_prices
+
+
+def parse_cart(cart: Dict, catalog_prices: bool = False):
+    """Return (ids, quantities, prices) lists for a cart record; a NaN price means catalog price"""
+    items = cart.get('items') or {}
+    if isinstance(items, dict):
+        lines = [(int(plant_id), item) for plant_id, item in items.items()]
+    else:
+        lines = [(int(item['id']), item) for item in items]
+    ids = [plant_id for plant_id, _ in lines]
+    quantities = [int(item['quantity']) for _, item in lines]
+    if catalog_prices:
+        prices = [math.nan] * len(lines)
+    else:
+        prices = [float(item['price']) if item.get('price') is not None else math.nan for _, item in lines]
+    return ids, quantities, prices
+
+
+def quote_carts(carts: List[Dict], table: PricingTable, coupon_rates: Dict[str, float],
+                catalog_prices: bool = False) -> List[Dict]:
+    """Quote a batch of cart records with one call to the pricing kernel; returns one output record per cart"""
+    records: List[Dict] = [None] * len(carts)
+    batch, lengths, ids, quantities, prices, coupons = [], [], [], [], [], []
+    for i, cart in enumerate(carts):
+        if not isinstance(cart, dict):
+            records[i] = _not_a_cart(cart)
+            continue
+        try:
+            cart_ids, cart_quantities, cart_prices = parse_cart(cart, catalog_prices)
+        except (KeyError, TypeError, ValueError) as e:
+            records[i] = {'cart_id': cart.get('cart_id'), 'error': str(e)}
+            continue
+        batch.append(i)
+        lengths.append(len(cart_ids))
+        ids.extend(cart_ids)
+        quantities.extend(cart_quantities)
+        prices.extend(cart_prices)
+        coupons.append((cart.get('coupon') or '').upper())
+    if not batch:
+        return records
+
+    # Carts with a line that has no price and isn't in the catalog can't be quoted
+    lengths = np.array(lengths, dtype=np.int64)
+    ids = np.array(ids, dtype=np.int64)
+    quantities = np.array(quantities, dtype=np.int64)
+    prices = np.array(prices, dtype=np.float64)
+    cart_of_line = np.repeat(np.arange(len(batch)), lengths)
+    unpriced = (table.rows_for(ids) < 0) & np.isnan(prices)
+    bad_carts = np.bincount(cart_of_line[unpriced], minlength=len(batch)) > 0
+    for k in np.flatnonzero(bad_carts):
+        records[batch[k]] = {'cart_id': carts[batch[k]].get('cart_id'),
+                             'error': f"Unknown plant ids: {ids[unpriced & (cart_of_line == k)].tolist()}"}
+
+    good = ~bad_carts
+    good_lines = good[cart_of_line]
+    percents = [coupon_rates.get(coupon, 0) for coupon in coupons]
+    quotes = table.quote_batch(lengths[good], ids[good_lines], quantities[good_lines], prices[good_lines],
+                               np.array(percents, dtype=np.float64)[good])
+    fields = [field.tolist() for field in quotes]
+    for k, i in enumerate(np.flatnonzero(good).tolist()):
+        record = {'cart_id': carts[batch[i]].get('cart_id')}
+        record.update(zip(Quote._fields, (field[k] for field in fields)))
+        record['coupon'] = coupons[i] if record['coupon_discount'] > 0 else None
+        records[batch[i]] = record
+    return records
+
+
+def _not_a_cart(cart) -> Dict:
+    return {'cart_id': None, 'error': f"Cart must be a JSON object, not {type(cart).__name__}"}
+
+
+def _quote_chunk(lines: List[str]) -> List[str]:
+    # A line that can't be a cart gets an error record in its place instead of failing the chunk
+    carts, errors = [], {}
+    for i, line in enumerate(lines):
+        try:
+            cart = json.loads(line)
+        except ValueError as e:
+            errors[i] = {'cart_id': None, 'error': f"Invalid JSON: {e}"}
+            continue
+        if isinstance(cart, dict):
+            carts.append(cart)
+        else:
+            errors[i] = _not_a_cart(cart)
+    quotes = iter(quote_carts(carts, _table, _coupon_rates, _catalog_prices))
+    return [json.dumps(errors[i] if i in errors else next(quotes)) for i in range(len(lines))]
+
+
+def _chunks(lines: Iterator[str], size: int) -> Iterator[List[str]]:
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(input_file, output_file, catalog_path: str, coupon_rates: Dict[str, float],
+        workers: int, chunk_size: int, catalog_prices: bool = False) -> int:
+    """Stream carts through a process pool and write quotes in input order; returns the cart count"""
+    count = 0
+    # Only a few chunks per worker are in flight, so memory stays flat for any input size
+    max_in_flight = workers * 4
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(catalog_path, coupon_rates, catalog_prices)) as pool:
+        in_flight = deque()
+        for chunk in _chunks(input_file, chunk_size):
+            in_flight.append(pool.apply_async(_quote_chunk, (chunk,)))
+            if len(in_flight) >= max_in_flight:
+                count += _write(output_file, in_flight.popleft().get())
+        while in_flight:
+            count += _write(output_file, in_flight.popleft().get())
+    return count
+
+
+def _write(output_file, quotes: List[str]) -> int:
+    output_file.write('\n'.join(quotes))
+    output_file.write('\n')
+    return len(quotes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quote a JSONL file of carts with the shop's pricing rules")
+    parser.add_argument('input', help="JSONL file of carts ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="JSONL file for the quotes (default: stdout)")
+    parser.add_argument('--catalog', default=os.environ.get('PLANTS_DATA_PATH', 'plants_data.json'),
+                        help="Catalog file (JSON or SQLite)")
+    parser.add_argument('--coupons', default='coupons.json', help="Coupons file")
+    parser.add_argument('--coupon-rate', action='append', default=[], metavar='CODE=PERCENT',
+                        help="Override or add a coupon rate (repeatable)")
+    parser.add_argument('--catalog-prices', action='store_true',
+                        help="Ignore prices stored in the carts and use current catalog prices")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Carts per task sent to a worker")
+    args = parser.parse_args(argv)
+
+    coupon_rates = CouponTable(args.coupons).rates()
+    for override in args.coupon_rate:
+        code, _, percent = override.partition('=')
+        coupon_rates[code.upper()] = float(percent)
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, 'r')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        start = time.perf_counter()
+        count = run(input_file, output_file, args.catalog, coupon_rates,
+                    args.workers, args.chunk_size, args.catalog_prices)
+        elapsed = time.perf_counter() - start
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"Quoted {count} carts in {elapsed:.2f}s ({rate:,.0f} carts/s) with {args.workers} workers",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
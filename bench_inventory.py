@@ -0,0 +1,167 @@
+"""Checkout contention benchmark for inventory.py.
+
+N buyer threads check out carts as fast as they can. Most carts hold one
+of a few hot plants, so the buyers keep competing for the same stock;
+the rest of each cart is drawn from the long tail of the catalog. Every
+backend is run for the same time and the script reports checkouts per
+second, how many were turned away as out of stock, and whether any plant
+was sold beyond its stock (it exits with status 1 if so).
+
+Backends:
+    memory   MemoryInventory with its lock stripes
+    global   MemoryInventory with a single stripe, i.e. one global lock (the baseline)
+    sharded  SqliteInventory split over --shards WAL files, one connection per buyer and shard (the app's default)
+    sqlite   SqliteInventory on a single WAL file, i.e. one database-wide write lock
+
+The in-process backends run every buyer as a thread of this process, so
+the GIL caps how much the stripes can help; --processes spreads the
+SQLite buyers over several processes sharing the files, the way several
+server processes would.
+
+Usage:
+    python bench_inventory.py
+    python bench_inventory.py --buyers 64 --hot-skus 2 --seconds 5 --backend sharded --backend sqlite --processes 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from inventory import Inventory, MemoryInventory, OutOfStock, SqliteInventory
+
+BACKENDS = ['memory', 'global', 'sharded', 'sqlite']
+
+
+def open_backend(name: str, path: str, shards: int) -> Inventory:
+    if name == 'memory':
+        return MemoryInventory()
+    if name == 'global':
+        return MemoryInventory(stripes=1)
+    return SqliteInventory(path, shards if name == 'sharded' else 1)
+
+
+def make_stock(args) -> Dict[int, int]:
+    """Hot plants are ids 1..hot_skus and run out during the run; the tail is ample"""
+    stock = {plant_id: args.hot_stock for plant_id in range(1, args.hot_skus + 1)}
+    stock.update((plant_id, args.tail_stock) for plant_id in range(args.hot_skus + 1, args.skus + 1))
+    return stock
+
+
+def buyer(inventory: Inventory, stock: Dict[int, int], args, seed: int, stop: threading.Event, results: List):
+    rng = random.Random(seed)
+    checkouts = rejected = 0
+    bought: Dict[int, int] = {}
+    while not stop.is_set():
+        cart = {}
+        if rng.random() < args.hot_share:
+            cart[rng.randint(1, args.hot_skus)] = rng.randint(1, 2)
+        for _ in range(rng.randint(0, args.cart_lines - 1)):
+            cart[rng.randint(args.hot_skus + 1, args.skus)] = rng.randint(1, 3)
+        if not cart:
+            continue
+        try:
+            inventory.reserve(cart, stock)
+        except OutOfStock:
+            rejected += 1
+            continue
+        checkouts += 1
+        for plant_id, quantity in cart.items():
+            bought[plant_id] = bought.get(plant_id, 0) + quantity
+    results.append((checkouts, rejected, bought))
+
+
+def shop(inventory: Inventory, args, seeds) -> Tuple[List, float]:
+    """Run one buyer thread per seed for --seconds; returns their results and the elapsed time"""
+    stock = make_stock(args)
+    stop = threading.Event()
+    results: List = []
+    threads = [threading.Thread(target=buyer, args=(inventory, stock, args, seed, stop, results)) for seed in seeds]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def shop_in_process(path: str, shards: int, args, seeds) -> Tuple[List, float]:
+    inventory = SqliteInventory(path, shards)
+    try:
+        return shop(inventory, args, seeds)
+    finally:
+        inventory.close()
+
+
+def run(name: str, args, directory: str) -> Dict:
+    path = os.path.join(directory, f'{name}.db')
+    inventory = open_backend(name, path, args.shards)
+    stock = make_stock(args)
+    if name in ('sharded', 'sqlite') and args.processes > 1:
+        with ProcessPoolExecutor(args.processes) as pool:
+            shares = [pool.submit(shop_in_process, path, inventory.shards, args,
+                                  range(i, args.buyers, args.processes))
+                      for i in range(args.processes)]
+            outcomes = [share.result() for share in shares]
+        results = [result for share, _ in outcomes for result in share]
+        elapsed = max(seconds for _, seconds in outcomes)
+    else:
+        results, elapsed = shop(inventory, args, range(args.buyers))
+
+    bought: Dict[int, int] = {}
+    for _, _, counts in results:
+        for plant_id, quantity in counts.items():
+            bought[plant_id] = bought.get(plant_id, 0) + quantity
+    sold = inventory.sold_many(stock)
+    oversold = [plant_id for plant_id, units in sold.items() if units > stock[plant_id]]
+    # Every unit counted as sold was handed to exactly one successful checkout
+    mismatched = [plant_id for plant_id in stock if sold[plant_id] != bought.get(plant_id, 0)]
+    inventory.close()
+    checkouts = sum(result[0] for result in results)
+    return {
+        'checkouts': checkouts,
+        'rejected': sum(result[1] for result in results),
+        'rate': checkouts / elapsed,
+        'hot_sold': sum(sold[plant_id] for plant_id in range(1, args.hot_skus + 1)),
+        'oversold': oversold,
+        'mismatched': mismatched,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkout contention benchmark for the inventory backends")
+    parser.add_argument('--buyers', type=int, default=32, help="Concurrent buyer threads")
+    parser.add_argument('--hot-skus', type=int, default=4, help="Plants most carts compete for")
+    parser.add_argument('--hot-share', type=float, default=0.9, help="Share of carts holding a hot plant")
+    parser.add_argument('--hot-stock', type=int, default=50_000, help="Stock of each hot plant")
+    parser.add_argument('--skus', type=int, default=10_000, help="Plants in the catalog")
+    parser.add_argument('--tail-stock', type=int, default=1_000_000, help="Stock of every other plant")
+    parser.add_argument('--cart-lines', type=int, default=3, help="Most lines per cart")
+    parser.add_argument('--seconds', type=float, default=3.0, help="How long each backend runs")
+    parser.add_argument('--backend', choices=BACKENDS, action='append', help="Backend to run (default: all)")
+    parser.add_argument('--processes', type=int, default=1, help="Processes the SQLite buyers are spread over")
+    parser.add_argument('--shards', type=int, default=16, help="Files the sharded backend is split over")
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix='bench-inventory-') as directory:
+        for name in args.backend or BACKENDS:
+            r = run(name, args, directory)
+            print(f"{name:8} {r['rate']:10,.0f} checkouts/s  {r['checkouts']:9,} ok  {r['rejected']:9,} out of stock  "
+                  f"hot units sold {r['hot_sold']:,}/{args.hot_skus * args.hot_stock:,}")
+            if r['oversold'] or r['mismatched']:
+                failed = True
+                print(f"  OVERSOLD plants {r['oversold'][:10]}, sold != bought for {r['mismatched'][:10]}")
+    if failed:
+        sys.exit(1)
+    print(f"\n{args.buyers} buyers, no plant sold beyond its stock")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Headless rerun benchmarks for every page of app.py.
+
+Drives the app with Streamlit's AppTest harness against data from
+generate_data.py, sweeping catalog size, cart size and order history
+length. For each scenario it records rerun latency percentiles and the
+number of elements the page builds, then compares them with
+bench_baseline.json. The add/* scenarios time an "Add to Cart" click on
+the first card instead of a plain rerun, and the sales/* scenarios check
+that the Sales Dashboard costs the same however long the history is.
+
+Usage:
+    python bench_pages.py                     # run and compare with the baseline
+    python bench_pages.py --update-baseline   # run and store the results as the new baseline
+    python bench_pages.py --quick             # smaller sweep for a fast check
+
+Exits with status 1 when a scenario is slower than the baseline by more than
+--tolerance (plus --slack-ms of absolute noise allowance) or builds more
+elements than before.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import streamlit as st
+from PIL import Image
+from streamlit.testing.v1 import AppTest
+
+from cart import Cart
+from generate_data import iter_orders, iter_plants
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+COUPONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coupons.json')
+
+BENCH_CUSTOMER = 'bench'
+
+FULL_SWEEP = {
+    'catalog': [12, 1_000, 10_000, 100_000],
+    'cart': [1, 10, 50],
+    'history': [1, 100, 1_000, 10_000],
+}
+QUICK_SWEEP = {
+    'catalog': [12, 1_000],
+    'cart': [1, 10],
+    'history': [1, 100],
+}
+
+
+def write_catalog(path: str, num_plants: int, image: str, seed: int = 0) -> List[Dict]:
+    """Write a generated plants_data.json with `num_plants` plants, all using a local image"""
+    plants = [dict(plant, image=image) for plant in iter_plants(num_plants, seed)]
+    with open(path, 'w') as f:
+        json.dump({'plants': plants}, f)
+    return plants
+
+
+def write_history(path: str, num_plants: int, num_orders: int, seed: int = 0):
+    """Write an order log of `num_orders` generated orders, all placed by the bench customer"""
+    with open(path, 'w') as f:
+        for order in iter_orders(num_orders, num_plants, 0, 1, seed):
+            order['customer'] = BENCH_CUSTOMER
+            f.write(json.dumps(order) + "\n")
+
+
+def make_cart(plants: List[Dict], num_lines: int) -> Cart:
+    cart = Cart()
+    for plant in plants[:num_lines]:
+        cart.add(plant['id'], plant['name'], plant['price'], plant['size'], 2)
+    return cart
+
+
+def count_elements(node) -> int:
+    children = getattr(node, 'children', None)
+    if not children:
+        return 1
+    return 1 + sum(count_elements(child) for child in children.values())
+
+
+def measure(page: str, cart: Cart, runs: int, warmup: int, state: Optional[Dict] = None,
+            click: Optional[str] = None) -> Dict:
+    """Rerun one page `runs` times and return latency percentiles (ms) and the element count.
+
+    With `click`, every rerun after the first is triggered by clicking the button with that key.
+    """
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.session_state.page = page
+    at.session_state.cart = cart
+    at.session_state.customer_id = BENCH_CUSTOMER
+    for key, value in (state or {}).items():
+        at.session_state[key] = value
+    timings = []
+    for i in range(warmup + runs):
+        if click is not None and i:
+            at.button(key=click).click()
+        start = time.perf_counter()
+        at.run()
+        elapsed = (time.perf_counter() - start) * 1000
+        if at.exception:
+            raise RuntimeError(f"{page} page raised: {at.exception[0].value}")
+        if i >= warmup:
+            timings.append(elapsed)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p90_ms': round(percentile(timings, 0.9), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'elements': count_elements(at._tree),
+    }
+
+
+def percentile(timings: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted timings: the smallest value with at least q of them at or below it"""
+    return timings[max(math.ceil(q * len(timings)) - 1, 0)]
+
+
+def run_scenario(workdir: str, page: str, num_plants: int, cart_lines: int, history: int,
+                 runs: int, warmup: int, state: Optional[Dict] = None, add_to_cart: bool = False) -> Dict:
+    scenario_dir = tempfile.mkdtemp(dir=workdir)
+    image = os.path.join(workdir, 'plant.png')
+    plants = write_catalog(os.path.join(scenario_dir, 'plants_data.json'), num_plants, image)
+    write_history(os.path.join(scenario_dir, 'orders.log'), num_plants, history)
+    os.environ['PLANTS_DATA_PATH'] = os.path.join(scenario_dir, 'plants_data.json')
+    os.environ['ORDERS_LOG_PATH'] = os.path.join(scenario_dir, 'orders.log')
+    os.environ['COUPONS_DATA_PATH'] = COUPONS_PATH
+    os.environ['SESSIONS_DB_PATH'] = os.path.join(scenario_dir, 'sessions.db')
+    os.environ['INVENTORY_DB_PATH'] = os.path.join(scenario_dir, 'inventory.db')
+    os.environ['SALES_DASHBOARD_KEY'] = 'bench'
+    # Cached resources are process-wide: start every scenario from a cold cache
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    click = f"add_{plants[0]['id']}" if add_to_cart else None
+    return measure(page, make_cart(plants, cart_lines), runs, warmup, state, click)
+
+
+def scenarios(sweep: Dict[str, List[int]]):
+    """Yield (name, page, catalog size, cart lines, history length, extra session state, click Add to Cart)"""
+    for size in sweep['catalog']:
+        yield f"main/catalog={size}", 'main', size, 1, 1, None, False
+    for size in sweep['catalog']:
+        yield f"search/catalog={size}", 'main', size, 1, 1, {'search_query': 'golden ros'}, False
+    for size in sweep['catalog']:
+        yield f"sorted/catalog={size}", 'main', size, 1, 1, {'sort_order': 'Price: high to low', 'price_range': (10.0, 40.0)}, False
+    for size in sweep['catalog']:
+        yield f"add/catalog={size}", 'main', size, 1, 1, None, True
+    mid_catalog = sweep['catalog'][len(sweep['catalog']) // 2]
+    for lines in sweep['cart']:
+        yield f"cart/cart={lines}", 'cart', mid_catalog, lines, 1, None, False
+    for lines in sweep['cart']:
+        yield f"cart_batch/cart={lines}", 'cart', mid_catalog, lines, 1, {'cart_batch_edit': True}, False
+    for orders in sweep['history']:
+        yield f"history/orders={orders}", 'history', 12, 1, orders, None, False
+    for orders in sweep['history']:
+        yield f"sales/orders={orders}", 'sales', 12, 1, orders, {'sales_unlocked': True}, False
+    yield "coupon", 'coupon', 12, 1, 1, None, False
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Return a description of every regression against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = base['p50_ms'] * (1 + tolerance) + slack_ms
+        if result['p50_ms'] > limit:
+            regressions.append(f"{name}: p50 {result['p50_ms']:.1f} ms > {limit:.1f} ms (baseline {base['p50_ms']:.1f} ms)")
+        if result['elements'] > base['elements']:
+            regressions.append(f"{name}: {result['elements']} elements > baseline {base['elements']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless rerun benchmarks for app.py")
+    parser.add_argument('--runs', type=int, default=20, help="Timed reruns per scenario")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed reruns before measuring")
+    parser.add_argument('--quick', action='store_true', help="Use the smaller sweep")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown (0.25 = 25%%)")
+    parser.add_argument('--slack-ms', type=float, default=5.0, help="Absolute p50 noise allowance")
+    parser.add_argument('--only', help="Only run scenarios whose name contains this text")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='plant-bench-')
+    Image.new('RGB', (400, 400), (82, 183, 136)).save(os.path.join(workdir, 'plant.png'))
+    cwd = os.getcwd()
+    os.chdir(workdir)  # thumbnails and other relative paths stay out of the repo
+    results = {}
+    try:
+        for name, page, num_plants, cart_lines, history, state, add in scenarios(QUICK_SWEEP if args.quick else FULL_SWEEP):
+            if args.only and args.only not in name:
+                continue
+            results[name] = run_scenario(workdir, page, num_plants, cart_lines, history, args.runs, args.warmup, state, add)
+            r = results[name]
+            print(f"{name:28} p50 {r['p50_ms']:8.1f} ms  p90 {r['p90_ms']:8.1f} ms  "
+                  f"p99 {r['p99_ms']:8.1f} ms  {r['elements']:6d} elements", flush=True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
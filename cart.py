@@ -0,0 +1,111 @@
+from fractions import Fraction
+from typing import Dict, Iterator, List, Tuple
+
+from pricing import SIZES, best_size_discount
+
+
+class CartLine:
+    """One plant in the cart"""
+    __slots__ = ('name', 'price', 'quantity', 'size')
+
+    def __init__(self, name: str, price: float, quantity: int, size: str):
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.size = size
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'price': self.price, 'quantity': self.quantity, 'size': self.size}
+
+
+class Cart:
+    """Shopping cart that keeps its totals up to date on every change.
+
+    add(), set_quantity() and remove() adjust the running subtotal, item count
+    and per-size quantities by the difference they make, so reading any total
+    or checking discount eligibility is O(1). The subtotal is kept as an exact
+    fraction, so it never drifts however many edits are made; read as a float
+    it can differ from the left to right sum of PricingTable.quote by an ulp,
+    never by a cent.
+    """
+    __slots__ = ('_lines', '_subtotal', 'item_count', 'size_counts')
+
+    def __init__(self):
+        self._lines: Dict[int, CartLine] = {}
+        self._subtotal = Fraction(0)
+        self.item_count = 0
+        self.size_counts: List[int] = [0] * len(SIZES)  # quantities indexed like pricing.SIZES
+
+    def _adjust(self, line: CartLine, delta: int):
+        self._subtotal += Fraction(line.price) * delta
+        self.item_count += delta
+        if line.size in SIZES:
+            self.size_counts[SIZES.index(line.size)] += delta
+
+    def add(self, plant_id: int, name: str, price: float, size: str, quantity: int = 1):
+        """Add `quantity` of a plant"""
+        line = self._lines.get(plant_id)
+        if line is None:
+            line = self._lines[plant_id] = CartLine(name, price, 0, size)
+        line.quantity += quantity
+        self._adjust(line, quantity)
+
+    def set_quantity(self, plant_id: int, quantity: int):
+        """Change the quantity of a plant already in the cart (0 or less removes it)"""
+        if quantity <= 0:
+            self.remove(plant_id)
+            return
+        line = self._lines[plant_id]
+        self._adjust(line, quantity - line.quantity)
+        line.quantity = quantity
+
+    def update(self, quantities: Dict[int, int]):
+        """Apply several quantity changes at once, e.g. a batch of cart page edits (0 or less removes)"""
+        for plant_id, quantity in quantities.items():
+            if plant_id in self._lines:
+                self.set_quantity(plant_id, quantity)
+
+    def remove(self, plant_id: int):
+        """Remove a plant from the cart"""
+        line = self._lines.pop(plant_id, None)
+        if line is not None:
+            self._adjust(line, -line.quantity)
+
+    def clear(self):
+        self.__init__()
+
+    @property
+    def subtotal(self) -> float:
+        return float(self._subtotal)
+
+    def size_discount(self) -> Tuple[int, str]:
+        """Return (percent, label) of the size discount the cart qualifies for"""
+        return best_size_discount(self.size_counts)
+
+    def __contains__(self, plant_id: int) -> bool:
+        return plant_id in self._lines
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __getitem__(self, plant_id: int) -> CartLine:
+        return self._lines[plant_id]
+
+    def items(self) -> Iterator[Tuple[int, CartLine]]:
+        return iter(self._lines.items())
+
+    def to_dict(self) -> Dict[int, Dict]:
+        """Return the cart as {plant_id: {'name', 'price', 'quantity', 'size'}}, the shape stored with orders"""
+        return {plant_id: line.to_dict() for plant_id, line in self._lines.items()}
+
+    def to_state(self) -> List[List]:
+        """Return the lines as JSON-friendly [plant_id, name, price, quantity, size] lists (see sessions.py)"""
+        return [[plant_id, line.name, line.price, line.quantity, line.size] for plant_id, line in self._lines.items()]
+
+    @classmethod
+    def from_state(cls, state: List[List]) -> 'Cart':
+        """Rebuild a cart saved with to_state()"""
+        cart = cls()
+        for plant_id, name, price, quantity, size in state:
+            cart.add(plant_id, name, price, size, quantity)
+        return cart
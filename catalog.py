@@ -0,0 +1,345 @@
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from columnar import ColumnarCatalog, compile_catalog
+from facets import mask_to_bits
+from ingest import PLANT_FIELDS, UNTRACKED_STOCK, CatalogIngest, IngestError, load_plants
+from pricing import PricingTable
+
+# Facets the SQLite catalog can filter on (each one is an indexed column)
+SQL_FACETS = ['size', 'color']
+
+Filters = Dict[str, List[str]]
+
+
+def file_stamp(path: str) -> Tuple[int, int]:
+    """Return (mtime, size) of a file; it changes whenever the file is rewritten"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class JsonCatalog:
+    """Catalog read from plants_data.json and kept in memory, filtered through the facet index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Streamed and validated record by record; the facet index is built along the way
+        self.plants, self.index = load_plants(path)
+        self._position_by_id = {plant['id']: i for i, plant in enumerate(self.plants)}
+
+    def __len__(self):
+        return len(self.plants)
+
+    def facet_values(self, facet: str) -> List[str]:
+        """Return the sorted values of a facet"""
+        return self.index.values(facet)
+
+    def facet_counts(self, facet: str, filters: Filters) -> Dict[str, int]:
+        """Return {value: count} for a facet, given the selections made in the other facets"""
+        return self.index.counts(facet, filters)
+
+    def count(self, filters: Filters) -> int:
+        """Return how many plants match the filters"""
+        return self.index.count(self.index.match(filters))
+
+    def match(self, filters: Filters) -> int:
+        """Return the bitset of catalog positions matching the filters"""
+        return self.index.match(filters)
+
+    def page(self, filters: Filters, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Return the matching plants in catalog order, only for the requested slice"""
+        stop = None if limit is None else offset + limit
+        return [self.plants[i] for i in self.index.positions(self.index.match(filters), offset, stop)]
+
+    def plants_at(self, positions: List[int]) -> List[Dict]:
+        """Return the plants at the given catalog positions, in that order"""
+        return [self.plants[i] for i in positions]
+
+    def get(self, plant_id: int) -> Optional[Dict]:
+        """Return one plant by id"""
+        position = self._position_by_id.get(plant_id)
+        return None if position is None else self.plants[position]
+
+    def get_many(self, plant_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Return {id: plant} for the ids that exist"""
+        found = {}
+        for plant_id in plant_ids:
+            plant = self.get(plant_id)
+            if plant is not None:
+                found[plant_id] = plant
+        return found
+
+    def sizes_for(self, plant_ids: Iterable[int]) -> Dict[int, str]:
+        """Return {id: size} for the ids that exist"""
+        return {plant_id: plant['size'] for plant_id, plant in self.get_many(plant_ids).items()}
+
+    def iter_columns(self, *fields: str) -> Iterator[Tuple]:
+        """Yield the given fields of every plant as tuples, in catalog order"""
+        for plant in self.plants:
+            yield tuple(plant[field] for field in fields)
+
+
+class SqliteCatalog:
+    """Catalog stored in an indexed SQLite file; only the requested rows are materialized.
+
+    Build the file with import_json(). Plants keep their file order through the
+    `position` rowid, and every facet column has a (facet, position) index so
+    filtered pages are read in order without sorting.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._totals: Dict[str, Dict[str, int]] = {}
+        # Files built before plants had a stock column read as untracked stock
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(plants)")}
+        self._expr = {field: field if field in columns else f"{UNTRACKED_STOCK} AS {field}" for field in PLANT_FIELDS}
+        self._select = ', '.join(self._expr.values())
+        for facet, value, count in self._conn().execute("SELECT facet, value, count FROM facet_counts"):
+            self._totals.setdefault(facet, {})[value] = count
+
+    def _conn(self) -> sqlite3.Connection:
+        # Streamlit runs sessions on different threads, so keep one read-only connection per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM plants").fetchone()[0]
+
+    @staticmethod
+    def _where(filters: Filters):
+        clauses, params = [], []
+        for facet, selected in filters.items():
+            if not selected:
+                continue
+            if facet not in SQL_FACETS:
+                raise ValueError(f"Unknown facet: {facet}")
+            clauses.append(f"{facet} IN ({', '.join('?' * len(selected))})")
+            params.extend(selected)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def facet_values(self, facet: str) -> List[str]:
+        """Return the sorted values of a facet"""
+        if facet not in SQL_FACETS:
+            raise ValueError(f"Unknown facet: {facet}")
+        return sorted(self._totals.get(facet, {}))
+
+    def facet_counts(self, facet: str, filters: Filters) -> Dict[str, int]:
+        """Return {value: count} for a facet, given the selections made in the other facets"""
+        if facet not in SQL_FACETS:
+            raise ValueError(f"Unknown facet: {facet}")
+        others = {name: selected for name, selected in filters.items() if name != facet and selected}
+        if not others:
+            return dict(self._totals.get(facet, {}))
+        where, params = self._where(others)
+        counts = dict.fromkeys(self._totals.get(facet, {}), 0)
+        rows = self._conn().execute(f"SELECT {facet}, COUNT(*) FROM plants {where} GROUP BY {facet}", params)
+        counts.update(rows.fetchall())
+        return counts
+
+    def count(self, filters: Filters) -> int:
+        """Return how many plants match the filters"""
+        where, params = self._where(filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM plants {where}", params).fetchone()[0]
+
+    def match(self, filters: Filters) -> int:
+        """Return the bitset of catalog positions matching the filters"""
+        size = len(self)
+        where, params = self._where(filters)
+        if not where:
+            return (1 << size) - 1
+        rows = self._conn().execute(f"SELECT position FROM plants {where}", params)
+        mask = np.zeros(size, dtype=bool)
+        mask[np.fromiter((row[0] for row in rows), dtype=np.int64)] = True
+        return mask_to_bits(mask)
+
+    def page(self, filters: Filters, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Return the matching plants in catalog order, only for the requested slice"""
+        where, params = self._where(filters)
+        sql = f"SELECT {self._select} FROM plants {where} ORDER BY position LIMIT ? OFFSET ?"
+        rows = self._conn().execute(sql, params + [-1 if limit is None else limit, offset])
+        return [dict(row) for row in rows]
+
+    def plants_at(self, positions: List[int]) -> List[Dict]:
+        """Return the plants at the given catalog positions, in that order"""
+        if not positions:
+            return []
+        sql = f"SELECT position, {self._select} FROM plants WHERE position IN ({', '.join('?' * len(positions))})"
+        by_position = {row['position']: {field: row[field] for field in PLANT_FIELDS}
+                       for row in self._conn().execute(sql, positions)}
+        return [by_position[position] for position in positions]
+
+    def get(self, plant_id: int) -> Optional[Dict]:
+        """Return one plant by id"""
+        return self.get_many([plant_id]).get(plant_id)
+
+    def get_many(self, plant_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Return {id: plant} for the ids that exist"""
+        plant_ids = list(plant_ids)
+        if not plant_ids:
+            return {}
+        sql = f"SELECT {self._select} FROM plants WHERE id IN ({', '.join('?' * len(plant_ids))})"
+        return {row['id']: dict(row) for row in self._conn().execute(sql, plant_ids)}
+
+    def sizes_for(self, plant_ids: Iterable[int]) -> Dict[int, str]:
+        """Return {id: size} for the ids that exist"""
+        plant_ids = list(plant_ids)
+        if not plant_ids:
+            return {}
+        sql = f"SELECT id, size FROM plants WHERE id IN ({', '.join('?' * len(plant_ids))})"
+        return {row[0]: row[1] for row in self._conn().execute(sql, plant_ids)}
+
+    def iter_columns(self, *fields: str) -> Iterator[Tuple]:
+        """Yield the given fields of every plant as tuples, in catalog order"""
+        unknown = set(fields) - set(PLANT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        for row in self._conn().execute(f"SELECT {', '.join(self._expr[field] for field in fields)} FROM plants ORDER BY position"):
+            yield tuple(row)
+
+
+def import_json(json_path: str, db_path: str):
+    """Build an indexed SQLite catalog from a plants_data.json file (streamed, never fully in memory)"""
+    plants = CatalogIngest(json_path, build_index=False)
+
+    # Build next to the target and swap it in, so readers never see a half-written file
+    tmp_path = f"{db_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    with conn:
+        conn.execute("""
+            CREATE TABLE plants (
+                position INTEGER PRIMARY KEY,
+                id INTEGER NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                description TEXT NOT NULL,
+                price REAL NOT NULL,
+                size TEXT NOT NULL,
+                color TEXT NOT NULL,
+                image TEXT NOT NULL,
+                stock INTEGER NOT NULL
+            )
+        """)
+        conn.executemany(
+            f"INSERT INTO plants (position, {', '.join(PLANT_FIELDS)}) VALUES (?, {', '.join('?' * len(PLANT_FIELDS))})",
+            ((position, *(plant[field] for field in PLANT_FIELDS)) for position, plant in enumerate(plants))
+        )
+        conn.execute("CREATE TABLE facet_counts (facet TEXT NOT NULL, value TEXT NOT NULL, count INTEGER NOT NULL)")
+        for facet in SQL_FACETS:
+            conn.execute(f"CREATE INDEX idx_plants_{facet} ON plants ({facet}, position)")
+            conn.execute(f"INSERT INTO facet_counts SELECT ?, {facet}, COUNT(*) FROM plants GROUP BY {facet}", (facet,))
+        conn.execute("ANALYZE")
+    conn.close()
+    try:
+        plants.check()
+    except IngestError:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, db_path)
+    return plants.count
+
+
+def open_catalog(path: str):
+    """Open a catalog file: SQLite for .db/.sqlite files, memory-mapped for .pcat files,
+    otherwise plants_data.json style JSON"""
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteCatalog(path)
+    if path.endswith('.pcat'):
+        return ColumnarCatalog(path)
+    return JsonCatalog(path)
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int  # increases by one every time a new catalog is swapped in
+    stamp: Tuple[int, int]  # file (mtime, size) the snapshot was built from
+    catalog: object  # JsonCatalog, SqliteCatalog or ColumnarCatalog, with its indexes built
+    pricing: PricingTable
+
+
+class CatalogStore:
+    """Versioned catalog snapshots with live reload.
+
+    A background thread polls the catalog file every `poll_interval` seconds.
+    When it changes, the new version is parsed and indexed on that thread and
+    then swapped in with a single assignment. Readers take current() once per
+    rerun and keep using that snapshot, so a swap never changes data under a
+    rerun that is already running. A file that fails to load is skipped and
+    retried on the next change.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.last_error: Optional[str] = None
+        self._failed_stamp: Optional[Tuple[int, int]] = None  # stamp of the last version that failed to load
+        self._current = self._build(1)
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def _build(self, version: int) -> CatalogSnapshot:
+        stamp = file_stamp(self.path)
+        catalog = open_catalog(self.path)
+        return CatalogSnapshot(version, stamp, catalog, PricingTable.from_catalog(catalog))
+
+    def current(self) -> CatalogSnapshot:
+        """Return the latest snapshot"""
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    def reload(self) -> bool:
+        """Load the file now if it changed since the current snapshot; returns True on a swap"""
+        try:
+            stamp = file_stamp(self.path)
+        except OSError as e:  # e.g. the file is being replaced; look again on the next poll
+            self.last_error = str(e)
+            return False
+        if stamp in (self._current.stamp, self._failed_stamp):
+            return False
+        try:
+            snapshot = self._build(self._current.version + 1)
+        except Exception as e:  # whatever broke the file, the watcher must outlive it and keep polling
+            self.last_error = str(e)
+            self._failed_stamp = stamp  # not parsed again until the file changes
+            return False
+        self.last_error = None
+        self._failed_stamp = None
+        self._current = snapshot
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def close(self):
+        """Stop watching the file"""
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python catalog.py plants_data.json plants.db|plants.pcat")
+        sys.exit(1)
+    try:
+        if sys.argv[2].endswith('.pcat'):
+            count = compile_catalog(sys.argv[1], sys.argv[2])
+        else:
+            count = import_json(sys.argv[1], sys.argv[2])
+    except IngestError as e:
+        print(e)
+        sys.exit(1)
+    print(f"Wrote {count} plants to {sys.argv[2]}")
@@ -0,0 +1,425 @@
+"""Checkout queue: orders are written to the order log off the request path.
+
+The cart page hands the queue an immutable CheckoutOrder and returns as
+soon as it is queued. A small pool of worker threads takes orders off the
+queue in batches, writes each batch to the order log with one write
+(retrying with exponential backoff when the write fails), then runs the
+post-processing hooks (e.g. an email or an export) for every order. The
+queue is bounded: when the workers fall behind by `max_pending` orders,
+submit() waits up to `submit_timeout` seconds for room and then raises
+CheckoutQueueFull instead of letting the backlog grow without limit.
+
+With a `spool_dir`, every order is appended to this process's spool file
+before submit() returns, and crossed off once it is in the order log (or
+has been given up on). When a server process dies with orders still
+queued, the next CheckoutQueue opened on the same directory finds its
+spool and queues those orders again, skipping any that reached the order
+log before the crash. Spool writes go straight to the file like order log
+writes, so they survive the process being killed. close(), run at
+interpreter exit, drains the queue.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from metrics import gauge, observe, span
+from orders import OrderLog
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process is assumed
+    fcntl = None
+
+_STOP = object()
+SPOOL_COMPACT_BYTES = 1024 * 1024
+
+
+class CheckoutOrder(NamedTuple):
+    """An order as it was at checkout; the record is frozen as JSON text.
+
+    `stock` holds (plant id, catalog stock) for each line as it was when the
+    units were reserved, so a failed order gives them back to the same
+    tracked or untracked plants even if the catalog was reloaded meanwhile.
+    """
+    checkout_id: str
+    customer: str
+    record: str
+    enqueued_at: float
+    stock: Tuple[Tuple[int, int], ...] = ()
+
+    def order(self) -> Dict:
+        return json.loads(self.record)
+
+
+class CheckoutQueueFull(Exception):
+    """The workers are too far behind to take another order right now"""
+
+
+class _Orphan(NamedTuple):
+    lock_fd: int
+    name: str  # spool path without the .spool / .lock extension
+    orders: List[Tuple[CheckoutOrder, int]]  # (snapshot, order log offset when it was spooled)
+
+
+def _write_all(fd: int, data: bytes):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class CheckoutSpool:
+    """Orders a server process has accepted but not written to the order log yet, in a file.
+
+    Each process appends to its own `<pid>-<random>.spool` in `directory` and
+    holds a lock on the matching .lock file for as long as it runs, so the
+    spool of a process that died is the one whose lock can be taken. The
+    file is emptied whenever nothing is outstanding, and rewritten with just
+    the outstanding orders when it grows past `compact_bytes`.
+    """
+
+    def __init__(self, directory: str, compact_bytes: int = SPOOL_COMPACT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self._name = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.path = f"{self._name}.spool"
+        self._lock_fd = os.open(f"{self._name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)  # held until this process exits
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._lock = threading.Lock()
+        self._outstanding: Dict[str, bytes] = {}  # checkout id -> its spool line
+        self._size = 0
+
+    def add(self, snapshot: CheckoutOrder, log_offset: int):
+        """Record an accepted order; raises OSError if it can't be written"""
+        line = (json.dumps({'order': list(snapshot), 'log_offset': log_offset}) + "\n").encode()
+        with self._lock:
+            _write_all(self._fd, line)
+            self._outstanding[snapshot.checkout_id] = line
+            self._size += len(line)
+
+    def done(self, checkout_ids: List[str]):
+        """Cross orders off once they are in the order log (or were given up on)"""
+        with self._lock:
+            for checkout_id in checkout_ids:
+                self._outstanding.pop(checkout_id, None)
+            try:
+                if not self._outstanding:
+                    os.ftruncate(self._fd, 0)
+                    self._size = 0
+                elif self._size > self.compact_bytes:
+                    self._compact()
+                else:
+                    line = (json.dumps({'done': checkout_ids}) + "\n").encode()
+                    _write_all(self._fd, line)
+                    self._size += len(line)
+            except OSError:
+                pass  # a replay would find these orders in the order log and skip them
+
+    def _compact(self):
+        data = b"".join(self._outstanding.values())
+        tmp_path = f"{self._name}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self._size = len(data)
+
+    def orphans(self) -> List[_Orphan]:
+        """Claim the spools of processes that are no longer running, with their outstanding orders"""
+        orphans = []
+        for entry in sorted(os.listdir(self.directory)):
+            name = os.path.join(self.directory, entry[:-len(".lock")])
+            if not entry.endswith(".lock") or name == self._name:
+                continue
+            try:
+                lock_fd = os.open(f"{name}.lock", os.O_RDWR)
+            except FileNotFoundError:
+                continue  # claimed and cleaned up by another process meanwhile
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(lock_fd)  # its process is alive
+                    continue
+            if not os.path.exists(f"{name}.lock"):
+                os.close(lock_fd)
+                continue
+            orphans.append(_Orphan(lock_fd, name, self._read(f"{name}.spool")))
+        return orphans
+
+    @staticmethod
+    def _read(path: str) -> List[Tuple[CheckoutOrder, int]]:
+        orders: Dict[str, Tuple[CheckoutOrder, int]] = {}
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line: it was never acknowledged
+                    if 'done' in entry:
+                        for checkout_id in entry['done']:
+                            orders.pop(checkout_id, None)
+                    else:
+                        checkout_id, customer, record, enqueued_at, stock = entry['order']
+                        orders[checkout_id] = (CheckoutOrder(checkout_id, customer, record, enqueued_at,
+                                                             tuple(tuple(pair) for pair in stock)),
+                                               entry['log_offset'])
+        except FileNotFoundError:
+            pass
+        return list(orders.values())
+
+    def discard(self, orphan: _Orphan):
+        """Delete an orphaned spool once its orders are safely in this process's spool"""
+        for extension in (".spool", ".tmp", ".lock"):
+            try:
+                os.remove(f"{orphan.name}{extension}")
+            except FileNotFoundError:
+                pass
+        os.close(orphan.lock_fd)
+
+    def close(self):
+        """Remove this process's spool if nothing is outstanding"""
+        with self._lock:
+            os.close(self._fd)
+            if not self._outstanding:
+                for path in (self.path, f"{self._name}.lock"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            os.close(self._lock_fd)
+
+
+def _written_checkout_ids(log_path: str, offset: int) -> Set[str]:
+    """Checkout ids of the orders in the log from `offset` on (from the start if the log is now shorter)"""
+    written = set()
+    with open(log_path, 'rb') as f:
+        if offset <= os.fstat(f.fileno()).st_size:
+            f.seek(offset)
+        for line in f:
+            if line.endswith(b"\n"):
+                written.add(json.loads(line).get('checkout_id'))
+    return written
+
+
+class CheckoutQueue:
+    """Bounded order queue drained into an OrderLog by a pool of worker threads.
+
+    hooks are called as hook(order_id, checkout_order) after the order is
+    written; on_failed(checkout_order, error) is called for orders that
+    could not be written after `max_retries` attempts. With `spool_dir`,
+    accepted orders are kept in a CheckoutSpool until they are written, and
+    orders spooled by a process that died are queued again on start.
+    """
+
+    def __init__(self, order_log: OrderLog, workers: int = 2, max_pending: int = 1000, batch_size: int = 64,
+                 max_retries: int = 5, retry_delay: float = 0.05, submit_timeout: float = 2.0,
+                 hooks: Optional[List[Callable[[int, CheckoutOrder], None]]] = None,
+                 on_failed: Optional[Callable[[CheckoutOrder, Exception], None]] = None,
+                 spool_dir: Optional[str] = None):
+        self.order_log = order_log
+        self.spool = CheckoutSpool(spool_dir) if spool_dir else None
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.submit_timeout = submit_timeout
+        self.hooks = list(hooks or [])
+        self.on_failed = on_failed
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}  # customer -> orders queued or being written
+        self._in_flight: Dict[int, float] = {}  # worker -> enqueued_at of the oldest order it holds
+        self.submitted = self.written = self.failed = self.retries = self.hook_errors = 0
+        self._workers = [threading.Thread(target=self._work, args=(i,), name=f"checkout-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+        self.replayed = self._replay() if self.spool else 0
+
+    def submit(self, customer: str, order: Dict, stock: Optional[Dict[int, int]] = None) -> CheckoutOrder:
+        """Queue an order snapshot; raises CheckoutQueueFull when there is no room in time.
+
+        `stock` is the plant id -> catalog stock the order's units were reserved against.
+        Raises OSError if the order can't be written to the spool.
+        """
+        snapshot = CheckoutOrder(uuid.uuid4().hex, customer, json.dumps(order), time.time(),
+                                 tuple(sorted((stock or {}).items())))
+        self._enqueue(snapshot, self.submit_timeout)
+        return snapshot
+
+    def _enqueue(self, snapshot: CheckoutOrder, timeout: Optional[float]):
+        with self._lock:
+            self._pending[snapshot.customer] = self._pending.get(snapshot.customer, 0) + 1
+        try:
+            if self.spool is not None:
+                # On disk before the customer is told the order was taken
+                self.spool.add(snapshot, self.order_log.end_offset)
+            self._queue.put(snapshot, timeout=timeout)
+        except queue.Full:
+            self._forget([snapshot])
+            raise CheckoutQueueFull(f"{self._queue.maxsize} orders are already waiting") from None
+        except OSError:
+            self._forget([snapshot])
+            raise
+        with self._lock:
+            self.submitted += 1
+
+    def _replay(self) -> int:
+        """Queue the orders left in the spools of dead processes that never reached the order log"""
+        replayed = 0
+        for orphan in self.spool.orphans():
+            if orphan.orders:
+                written = _written_checkout_ids(self.order_log.path, min(offset for _, offset in orphan.orders))
+                for snapshot, _ in orphan.orders:
+                    if snapshot.checkout_id not in written:
+                        self._enqueue(snapshot, None)
+                        replayed += 1
+            self.spool.discard(orphan)
+        return replayed
+
+    def pending_for(self, customer: str) -> int:
+        """Orders of a customer that are not in the order log yet"""
+        return self._pending.get(customer, 0)
+
+    def depth(self) -> int:
+        """Orders waiting for a worker"""
+        return self._queue.qsize()
+
+    def lag(self) -> float:
+        """Seconds the oldest order not yet written has been waiting (0 when caught up)"""
+        with self._queue.mutex:
+            oldest = [self._queue.queue[0].enqueued_at] if self._queue.queue else []
+        with self._lock:
+            oldest += self._in_flight.values()
+        return max(time.time() - min(oldest), 0.0) if oldest else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = {'submitted': self.submitted, 'written': self.written, 'failed': self.failed,
+                      'retries': self.retries, 'hook_errors': self.hook_errors}
+        return dict(counts, depth=self.depth(), lag_seconds=self.lag())
+
+    def register_gauges(self):
+        """Export depth, lag and the counters with the app's metrics"""
+        gauge('checkout_queue_depth', "Orders waiting for a checkout worker", self.depth)
+        gauge('checkout_queue_lag_seconds', "Age of the oldest order not yet in the order log", self.lag)
+        gauge('checkout_orders_written', "Orders written to the order log by the checkout queue",
+              lambda: self.written)
+        gauge('checkout_orders_failed', "Orders dropped after every write attempt failed", lambda: self.failed)
+
+    def _forget(self, orders: Iterable[CheckoutOrder]):
+        """Drop orders that are written, given up on or were never queued from the pending counts and the spool"""
+        orders = list(orders)
+        with self._lock:
+            for snapshot in orders:
+                left = self._pending.get(snapshot.customer, 0) - 1
+                if left > 0:
+                    self._pending[snapshot.customer] = left
+                else:
+                    self._pending.pop(snapshot.customer, None)
+        if self.spool is not None:
+            self.spool.done([snapshot.checkout_id for snapshot in orders])
+
+    def _next_batch(self) -> List:
+        """Block for one order, then take whatever else is already queued (up to batch_size)"""
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, worker: int):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            orders = batch[:-1] if stop else batch
+            if orders:
+                with self._lock:
+                    self._in_flight[worker] = orders[0].enqueued_at
+                try:
+                    self._write(orders)
+                finally:
+                    with self._lock:
+                        self._in_flight.pop(worker, None)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, orders: List[CheckoutOrder]):
+        # Orders are dated when the customer checked out, not when they reached the log; the checkout id
+        # lets a spool replay tell which orders got there
+        records = [(snapshot.customer, dict(snapshot.order(), created_at=snapshot.enqueued_at,
+                                            checkout_id=snapshot.checkout_id)) for snapshot in orders]
+        error = None
+        for attempt in range(self.max_retries):
+            try:
+                with span('checkout_write'):
+                    order_ids = self.order_log.append_many(records)
+                break
+            except Exception as e:  # append_many leaves nothing of a failed batch behind, so it is safe to retry
+                error = e
+                if attempt + 1 < self.max_retries:
+                    with self._lock:
+                        self.retries += 1
+                    time.sleep(min(self.retry_delay * 2 ** attempt, 2.0))
+        else:
+            with self._lock:
+                self.failed += len(orders)
+            for snapshot in orders:
+                if self.on_failed is not None:
+                    try:
+                        self.on_failed(snapshot, error)
+                    except Exception:
+                        pass  # keep the worker alive for the next batch
+            self._forget(orders)
+            return
+
+        now = time.time()
+        with self._lock:
+            self.written += len(orders)
+        for snapshot in orders:
+            observe('checkout_lag', (now - snapshot.enqueued_at) * 1000)
+        self._forget(orders)  # in the order history from here on
+        for order_id, snapshot in zip(order_ids, orders):
+            for hook in self.hooks:
+                self._run_hook(hook, order_id, snapshot)
+
+    def _run_hook(self, hook, order_id: int, snapshot: CheckoutOrder):
+        for attempt in range(self.max_retries):
+            try:
+                hook(order_id, snapshot)
+                return
+            except Exception:
+                if attempt + 1 < self.max_retries:
+                    time.sleep(min(self.retry_delay * 2 ** attempt, 2.0))
+        with self._lock:
+            self.hook_errors += 1  # the order itself is safely written; only the side effect is lost
+
+    def join(self):
+        """Wait until every queued order has been handled"""
+        self._queue.join()
+
+    def close(self, timeout: float = 10.0):
+        """Drain the queue and stop the workers"""
+        if not any(worker.is_alive() for worker in self._workers):
+            return
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        self.order_log.sync()
+        if self.spool is not None and not any(worker.is_alive() for worker in self._workers):
+            self.spool.close()  # kept for the next start if orders are still outstanding
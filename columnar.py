@@ -0,0 +1,271 @@
+"""Compiled, memory-mapped columnar catalog (.pcat files).
+
+Layout (little-endian, every section 8-byte aligned):
+    magic b'PLANTCAT' | header length (u32) | JSON header | sections
+
+The header lists the plant count, the color dictionary and where each
+section starts. Sections are fixed-width columns (id int64, price float64,
+size uint8, color uint16, stock int64), the ids sorted with their positions for lookups,
+a string heap holding name/description/image of every plant with an
+offset table (3 offsets per plant plus one), and the precomputed facet
+bitmaps. Opening the file maps it read-only: columns are numpy views over
+the map, so server processes share one copy through the page cache and only
+the plants actually shown are turned into dicts.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from facets import FacetIndex
+from ingest import PLANT_FIELDS, UNTRACKED_STOCK, CatalogIngest
+from pricing import SIZES
+
+MAGIC = b'PLANTCAT'
+FORMAT_VERSION = 2  # 2 added the stock column
+COLUMNAR_FACETS = ['size', 'color']
+STRING_FIELDS = ['name', 'description', 'image']
+
+Filters = Dict[str, List[str]]
+
+
+def _pad(f, alignment: int = 8):
+    f.write(b'\0' * (-f.tell() % alignment))
+
+
+def compile_catalog(json_path: str, out_path: str) -> int:
+    """Compile a plants_data.json file into a .pcat file; returns the number of plants"""
+    ingest = CatalogIngest(json_path)
+    ids, prices, size_codes, color_codes, stock = array('q'), array('d'), array('B'), array('H'), array('q')
+    offsets = array('Q', [0])
+    colors: Dict[str, int] = {}
+    size_index = {size: code for code, size in enumerate(SIZES)}
+
+    # Numeric columns stay in compact arrays; strings go straight to a scratch heap file
+    with tempfile.TemporaryFile() as heap:
+        for plant in ingest:
+            ids.append(plant['id'])
+            prices.append(plant['price'])
+            size_codes.append(size_index[plant['size']])
+            color_codes.append(colors.setdefault(plant['color'], len(colors)))
+            stock.append(plant['stock'])
+            for field in STRING_FIELDS:
+                data = plant[field].encode('utf-8')
+                heap.write(data)
+                offsets.append(offsets[-1] + len(data))
+        ingest.check()
+        if len(colors) > 0xFFFF:
+            raise ValueError(f"Too many distinct colors for the columnar format: {len(colors)}")
+
+        count = len(ids)
+        id_column = np.frombuffer(ids, dtype=np.int64) if count else np.zeros(0, dtype=np.int64)
+        id_order = np.argsort(id_column, kind='stable')
+        index = ingest.index()
+        nbytes = (count + 7) // 8
+        color_values = sorted(colors, key=colors.get)
+        facet_values = {'size': SIZES, 'color': color_values}
+
+        sections = [
+            ('id', '<i8', ids.tobytes()),
+            ('price', '<f8', prices.tobytes()),
+            ('size', '<u1', size_codes.tobytes()),
+            ('color', '<u2', color_codes.tobytes()),
+            ('stock', '<i8', stock.tobytes()),
+            ('sorted_ids', '<i8', id_column[id_order].tobytes()),
+            ('id_positions', '<i8', id_order.astype(np.int64).tobytes()),
+            ('string_offsets', '<u8', offsets.tobytes()),
+        ]
+        bitmaps = b''.join(index.bitsets[facet].get(value, 0).to_bytes(nbytes, 'little')
+                           for facet in COLUMNAR_FACETS for value in facet_values[facet])
+
+        # Section offsets depend on the header length, so lay the sections out relative to its end
+        layout = {}
+        position = 0
+        for name, dtype, data in sections:
+            layout[name] = [position, dtype]
+            position += len(data) + (-len(data) % 8)
+        layout['facet_bitmaps'] = [position, '|u1']
+        position += len(bitmaps) + (-len(bitmaps) % 8)
+        layout['strings'] = [position, '|u1']
+
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'count': count,
+            'colors': color_values,
+            'sizes': SIZES,
+            'sections': layout,
+        }).encode()
+        header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+        tmp_path = f"{out_path}.tmp"
+        with open(tmp_path, 'wb') as out:
+            out.write(MAGIC)
+            out.write(struct.pack('<I', len(header)))
+            out.write(header)
+            for _, _, data in sections:
+                out.write(data)
+                _pad(out)
+            out.write(bitmaps)
+            _pad(out)
+            heap.seek(0)
+            while True:
+                block = heap.read(1024 * 1024)
+                if not block:
+                    break
+                out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+    # Swap in atomically; processes that still map the old file keep reading it safely
+    os.replace(tmp_path, out_path)
+    return count
+
+
+class ColumnarCatalog:
+    """Read-only catalog over a memory-mapped .pcat file built with compile_catalog()"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled plant catalog")
+        (header_length,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        base = len(MAGIC) + 4
+        header = json.loads(self._map[base:base + header_length])
+        if header['version'] not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unsupported catalog format version {header['version']}")
+        self._count = header['count']
+        self._colors: List[str] = header['colors']
+        self._sizes: List[str] = header['sizes']
+        data_start = base + header_length
+        sections = {name: data_start + offset for name, (offset, _) in header['sections'].items()}
+
+        def column(name: str, dtype: str, length: int) -> np.ndarray:
+            return np.frombuffer(self._map, dtype=dtype, count=length, offset=sections[name])
+
+        n = self._count
+        self.ids = column('id', '<i8', n)
+        self.prices = column('price', '<f8', n)
+        self.size_codes = column('size', '<u1', n)
+        self.color_codes = column('color', '<u2', n)
+        # Version 1 files have no stock column: every plant is untracked
+        self.stock = column('stock', '<i8', n) if 'stock' in sections else np.full(n, UNTRACKED_STOCK, dtype=np.int64)
+        self._sorted_ids = column('sorted_ids', '<i8', n)
+        self._id_positions = column('id_positions', '<i8', n)
+        self._string_offsets = column('string_offsets', '<u8', len(STRING_FIELDS) * n + 1)
+        self._strings_start = sections['strings']
+
+        # The facet index is just the stored bitmaps turned into ints (no pass over the plants)
+        nbytes = (n + 7) // 8
+        position = sections['facet_bitmaps']
+        bitsets: Dict[str, Dict[str, int]] = {}
+        for facet, values in (('size', self._sizes), ('color', self._colors)):
+            bitsets[facet] = {}
+            for value in values:
+                bits = int.from_bytes(self._map[position:position + nbytes], 'little')
+                if bits:
+                    bitsets[facet][value] = bits
+                position += nbytes
+        self.index = FacetIndex.from_bitsets(n, bitsets)
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, position: int, field: int) -> str:
+        slot = position * len(STRING_FIELDS) + field
+        start, end = self._string_offsets[slot:slot + 2]
+        return self._map[self._strings_start + int(start):self._strings_start + int(end)].decode('utf-8')
+
+    def _plant(self, position: int) -> Dict:
+        return {
+            'id': int(self.ids[position]),
+            'name': self._string(position, 0),
+            'description': self._string(position, 1),
+            'price': float(self.prices[position]),
+            'size': self._sizes[self.size_codes[position]],
+            'color': self._colors[self.color_codes[position]],
+            'image': self._string(position, 2),
+            'stock': int(self.stock[position]),
+        }
+
+    def _positions_of(self, plant_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids found, their positions)"""
+        wanted = np.fromiter(plant_ids, dtype=np.int64)
+        slots = np.searchsorted(self._sorted_ids, wanted)
+        slots[slots == self._count] = 0
+        found = self._sorted_ids[slots] == wanted if self._count else np.zeros(len(wanted), dtype=bool)
+        return wanted[found], self._id_positions[slots[found]]
+
+    def facet_values(self, facet: str) -> List[str]:
+        """Return the sorted values of a facet"""
+        return self.index.values(facet)
+
+    def facet_counts(self, facet: str, filters: Filters) -> Dict[str, int]:
+        """Return {value: count} for a facet, given the selections made in the other facets"""
+        return self.index.counts(facet, filters)
+
+    def count(self, filters: Filters) -> int:
+        """Return how many plants match the filters"""
+        return self.index.count(self.index.match(filters))
+
+    def match(self, filters: Filters) -> int:
+        """Return the bitset of catalog positions matching the filters"""
+        return self.index.match(filters)
+
+    def page(self, filters: Filters, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Return the matching plants in catalog order, only for the requested slice"""
+        stop = None if limit is None else offset + limit
+        return [self._plant(i) for i in self.index.positions(self.index.match(filters), offset, stop)]
+
+    def plants_at(self, positions: List[int]) -> List[Dict]:
+        """Return the plants at the given catalog positions, in that order"""
+        return [self._plant(i) for i in positions]
+
+    def get(self, plant_id: int) -> Optional[Dict]:
+        """Return one plant by id"""
+        return self.get_many([plant_id]).get(plant_id)
+
+    def get_many(self, plant_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Return {id: plant} for the ids that exist"""
+        found, positions = self._positions_of(plant_ids)
+        return {int(plant_id): self._plant(int(position)) for plant_id, position in zip(found, positions)}
+
+    def sizes_for(self, plant_ids: Iterable[int]) -> Dict[int, str]:
+        """Return {id: size} for the ids that exist"""
+        found, positions = self._positions_of(plant_ids)
+        return {int(plant_id): self._sizes[code] for plant_id, code in zip(found, self.size_codes[positions])}
+
+    def iter_columns(self, *fields: str, chunk: int = 65536) -> Iterator[Tuple]:
+        """Yield the given fields of every plant as tuples, in catalog order"""
+        unknown = set(fields) - set(PLANT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        width = len(STRING_FIELDS)
+        # Decode a chunk of rows at a time: one slice of each column and of the string heap
+        for first in range(0, self._count, chunk):
+            last = min(first + chunk, self._count)
+            offsets = self._string_offsets[first * width:last * width + 1].tolist()
+            base = offsets[0]
+            heap = self._map[self._strings_start + base:self._strings_start + offsets[-1]]
+            columns = []
+            for field in fields:
+                if field in STRING_FIELDS:
+                    slot = STRING_FIELDS.index(field)
+                    columns.append([heap[offsets[i] - base:offsets[i + 1] - base].decode('utf-8')
+                                    for i in range(slot, (last - first) * width, width)])
+                elif field == 'size':
+                    columns.append([self._sizes[code] for code in self.size_codes[first:last].tolist()])
+                elif field == 'color':
+                    columns.append([self._colors[code] for code in self.color_codes[first:last].tolist()])
+                else:
+                    columns.append({'id': self.ids, 'price': self.prices, 'stock': self.stock}[field][first:last].tolist())
+            yield from zip(*columns)
+
+    def pricing_columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (ids, prices, size codes) columns without materializing any plant"""
+        return self.ids, self.prices, self.size_codes.astype(np.int8)
@@ -0,0 +1,134 @@
+import hashlib
+import html
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional
+
+COUPON_PAGE_CSS = """
+<style>
+.rounded-box {
+    border: 2px solid #000000;
+    border-radius: 12px;
+    padding: 15px;
+    margin-bottom: 20px;
+    background-color: #E3EEEF;
+}
+.coupon-key {
+    font-weight: bold;
+    font-size: 22px;
+    color: #333333;
+    margin-bottom: 10px;
+}
+.coupon-info {
+    font-size: 18px;
+    color: #070D0D;
+    margin-left: 10px;
+}
+</style>
+"""
+
+
+class CouponSnapshot(NamedTuple):
+    version: str  # content hash of coupons.json
+    coupons: Mapping[str, Mapping]  # upper-case code -> {'discount_percent', 'description'}
+    html: str  # coupon page, rendered once per snapshot
+
+    def percent(self, code: str) -> float:
+        """Return the discount percent of a coupon code, 0 if it doesn't exist"""
+        coupon = self.coupons.get(code.upper())
+        return coupon['discount_percent'] if coupon else 0
+
+
+def render_coupon_html(coupons: Mapping[str, Mapping]) -> str:
+    """Render every coupon inside its own rounded box"""
+    boxes = [COUPON_PAGE_CSS]
+    for code, details in coupons.items():
+        boxes.append(f"""
+        <div class='rounded-box'>
+            <div class='coupon-key'>{html.escape(code)}</div>
+            <div class='coupon-info'>Discount: {details['discount_percent']}%</div>
+            <div class='coupon-info'>Description: {html.escape(details['description'])}</div>
+        </div>
+        """)
+    return "".join(boxes)
+
+
+def parse_coupons(data: bytes) -> CouponSnapshot:
+    """Build a snapshot from the raw bytes of a coupons.json file"""
+    coupons = {}
+    for code, details in json.loads(data)['coupons'].items():
+        coupons[code.upper()] = MappingProxyType({
+            'discount_percent': details['discount_percent'],
+            'description': details['description'],
+        })
+    coupons = MappingProxyType(coupons)
+    return CouponSnapshot(hashlib.sha1(data).hexdigest(), coupons, render_coupon_html(coupons))
+
+
+class CouponTable:
+    """coupons.json loaded once into a hash index and reloaded when the file changes.
+
+    snapshot() stats the file at most every `check_interval` seconds. A new
+    mtime or size triggers a re-read; the snapshot is only replaced when the
+    content hash differs and the new file parses, so readers always get a
+    complete, immutable table and a bad edit keeps the previous one live
+    (and is not parsed again until the file changes).
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stat = self._stat_key()
+        self._failed_stat = None  # stat of the last version that failed to parse
+        with open(path, 'rb') as f:
+            self._snapshot = parse_coupons(f.read())
+        self._checked_at = time.monotonic()
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def _stat_key(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self) -> CouponSnapshot:
+        """Return the current coupon snapshot, reloading it first if the file changed"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self):
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is already checking
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                stat = self._stat_key()
+            except OSError as e:  # e.g. the file is being replaced; look again on the next check
+                self.last_error = str(e)
+                return
+            if stat in (self._stat, self._failed_stat):
+                return
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                if hashlib.sha1(data).hexdigest() != self._snapshot.version:
+                    self._snapshot = parse_coupons(data)
+                    self.reloads += 1
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Half-written or invalid file: keep serving the old snapshot until the file changes again
+                self.last_error = str(e)
+                self._failed_stat = stat
+                return
+            self._stat = stat
+            self._failed_stat = None
+            self.last_error = None
+        finally:
+            self._lock.release()
+
+    def rates(self) -> Dict[str, float]:
+        """Return {CODE: discount_percent} from the current snapshot"""
+        return {code: details['discount_percent'] for code, details in self.snapshot().coupons.items()}
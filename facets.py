@@ -0,0 +1,138 @@
+import re
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# Facets indexed for every catalog load: name -> function returning the facet value of a plant.
+# Register more with register_facet() before the index is built.
+FACETS: Dict[str, Callable[[Dict], str]] = {
+    'size': lambda plant: plant['size'],
+    'color': lambda plant: plant['color'],
+}
+
+_NONZERO_RUN = re.compile(rb'[^\x00]+')
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def register_facet(name: str, key: Callable[[Dict], str]):
+    """Register a new facet so future indexes get one bitset per value"""
+    FACETS[name] = key
+
+
+def iter_positions(bits: int) -> Iterator[int]:
+    """Yield the positions of the set bits in ascending order"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    # Skip empty bytes with the regex engine instead of a python loop
+    for run in _NONZERO_RUN.finditer(data):
+        start = run.start()
+        for offset, byte in enumerate(run.group(), start):
+            base = offset * 8
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+def mask_to_bits(mask: np.ndarray) -> int:
+    """Turn a boolean array over catalog positions into a bitset"""
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def bits_to_mask(bits: int, size: int) -> np.ndarray:
+    """Turn a bitset into a boolean array over `size` catalog positions"""
+    data = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(data, count=size, bitorder='little').astype(bool)
+
+
+class FacetIndexBuilder:
+    """Builds the facet bitsets one plant at a time, e.g. while a catalog is being streamed in"""
+
+    def __init__(self, facets: Optional[Dict[str, Callable[[Dict], str]]] = None):
+        self.facets = dict(facets or FACETS)
+        self.size = 0
+        self._bitmaps: Dict[str, Dict[str, bytearray]] = {name: {} for name in self.facets}
+
+    def add(self, plant: Dict):
+        """Index the next plant (its position is the number of plants added before it)"""
+        i = self.size
+        byte = i >> 3
+        for name, key in self.facets.items():
+            bitmaps = self._bitmaps[name]
+            value = key(plant)
+            bitmap = bitmaps.get(value)
+            if bitmap is None:
+                bitmap = bitmaps[value] = bytearray(max(byte + 1, 64))
+            elif byte >= len(bitmap):
+                # At least double, so growing stays amortized O(1) even after a long gap
+                bitmap.extend(bytes(max(byte + 1, 2 * len(bitmap)) - len(bitmap)))
+            bitmap[byte] |= 1 << (i & 7)
+        self.size += 1
+
+    def bitsets(self) -> Dict[str, Dict[str, int]]:
+        return {name: {value: int.from_bytes(bitmap, 'little') for value, bitmap in bitmaps.items()}
+                for name, bitmaps in self._bitmaps.items()}
+
+    def build(self) -> 'FacetIndex':
+        return FacetIndex.from_bitsets(self.size, self.bitsets())
+
+
+class FacetIndex:
+    """One bitset per facet value, built once per catalog load.
+
+    Bit i of a bitset is set when plants[i] has that value. A filter is a
+    union of the selected values within a facet and an intersection across
+    facets, so it only costs a few big-int OR/AND operations.
+    """
+
+    def __init__(self, plants: List[Dict], facets: Optional[Dict[str, Callable[[Dict], str]]] = None):
+        builder = FacetIndexBuilder(facets)
+        for plant in plants:
+            builder.add(plant)
+        self._load(builder.size, builder.bitsets())
+
+    @classmethod
+    def from_bitsets(cls, size: int, bitsets: Dict[str, Dict[str, int]]) -> 'FacetIndex':
+        """Wrap bitsets that were already built (see FacetIndexBuilder)"""
+        index = cls.__new__(cls)
+        index._load(size, bitsets)
+        return index
+
+    def _load(self, size: int, bitsets: Dict[str, Dict[str, int]]):
+        self.size = size
+        self.all = (1 << size) - 1
+        self.bitsets = bitsets
+        # Values and counts never change for a given catalog, so work them out once here
+        self.sorted_values = {name: sorted(values) for name, values in bitsets.items()}
+        self.totals = {name: {value: bits.bit_count() for value, bits in values.items()}
+                       for name, values in bitsets.items()}
+
+    def values(self, facet: str) -> List[str]:
+        """Return the sorted values seen for a facet"""
+        return self.sorted_values[facet]
+
+    def counts(self, facet: str, selections: Dict[str, List[str]]) -> Dict[str, int]:
+        """Return {value: count} for a facet under the selections made in the *other* facets"""
+        base = self.match({name: selected for name, selected in selections.items() if name != facet})
+        if base == self.all:
+            return dict(self.totals[facet])
+        return {value: (bits & base).bit_count() for value, bits in self.bitsets[facet].items()}
+
+    def match(self, selections: Dict[str, List[str]]) -> int:
+        """Return the bitset of plants matching every facet selection (empty selection = no filter)"""
+        result = self.all
+        for facet, selected in selections.items():
+            if not selected:
+                continue
+            values = self.bitsets[facet]
+            union = 0
+            for value in selected:
+                union |= values.get(value, 0)
+            result &= union
+        return result
+
+    def count(self, bits: int) -> int:
+        """Return the number of plants in a bitset"""
+        return bits.bit_count()
+
+    def positions(self, bits: int, start: int = 0, stop: Optional[int] = None) -> List[int]:
+        """Return catalog positions for the set bits, optionally only the [start:stop] slice"""
+        return list(islice(iter_positions(bits), start, stop))
@@ -0,0 +1,245 @@
+"""Seeded, streaming generator for production-scale test data.
+
+Writes catalogs, coupon tables and order histories in the same formats the
+app reads (plants_data.json, coupons.json and the orders.log order log)
+without holding the dataset in memory: plants are generated in fixed-size
+chunks from (seed, chunk number), so any plant can be regenerated on its
+own when orders need it.
+
+Usage:
+    python generate_data.py plants 1000000 -o plants_1m.json --seed 7
+    python generate_data.py coupons 50000 -o coupons_50k.json --seed 7
+    python generate_data.py orders 2000000 --plants 1000000 --coupons 50000 -o orders_2m.log --seed 7
+"""
+import argparse
+import json
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from pricing import SIZES, quote_totals
+
+CHUNK_SIZE = 65536
+
+# Roughly what an outdoor plant shop stocks: lots of small plants, fewer big ones
+SIZE_WEIGHTS = [0.45, 0.35, 0.20]
+SIZE_MEDIAN_PRICE = [9.0, 19.0, 38.0]
+PRICE_SPREAD = 0.35  # sigma of the log-normal price around the size median
+SIZE_MEAN_STOCK = [60, 30, 12]  # units on hand, drawn from a Poisson around these
+
+COLORS = ['green', 'red', 'yellow', 'purple', 'white', 'pink', 'orange', 'blue']
+COLOR_WEIGHTS = [0.30, 0.14, 0.12, 0.11, 0.11, 0.10, 0.07, 0.05]
+
+ADJECTIVES = ['Dwarf', 'Giant', 'Golden', 'Crimson', 'Wild', 'Alpine', 'Royal', 'Sweet', 'Creeping',
+              'Japanese', 'English', 'Mountain', 'Silver', 'Scarlet', 'Velvet', 'Coastal']
+GENERA = ['Rose', 'Lavender', 'Sunflower', 'Marigold', 'Daisy', 'Hydrangea', 'Tulip', 'Basil',
+          'Birch', 'Petunia', 'Geranium', 'Oak', 'Maple', 'Fern', 'Salvia', 'Aster', 'Dahlia',
+          'Peony', 'Camellia', 'Jasmine', 'Hosta', 'Heather', 'Rosemary', 'Thyme']
+DESCRIPTIONS = [
+    "Hardy {color} {genus} that thrives in full sun",
+    "Easy-care {genus} with {color} blooms all summer",
+    "Fragrant {color} {genus}, perfect for borders and containers",
+    "Compact {genus} with striking {color} foliage",
+    "Fast-growing {genus} that attracts bees and butterflies",
+    "Classic {color} {genus} for cottage gardens",
+]
+IMAGES = [
+    "https://hedgexpress.co.uk/wp-content/uploads/2024/12/DB8A3843-300x300.jpeg",
+    "https://www.chengtainursery.com/wp-content/uploads/2024/09/photo_1_2024-09-26_12-01-01-Photoroom-300x300.png",
+    "https://i.pinimg.com/474x/88/f8/2b/88f82bcf680466f311fc0d6937041ec0.jpg",
+    "https://www.gardenia.net/wp-content/uploads/2023/05/hydrangea-macrophylla-blue-heaven-300x300.webp",
+    "https://finelineslandscaping.co.za/images/shop/pelargonium-zonale-kariba-red-300x300.webp",
+]
+
+COUPON_PREFIXES = ['WELCOME', 'SPRING', 'SUMMER', 'AUTUMN', 'GARDEN', 'SAVE', 'BLOOM', 'GREEN']
+COUPON_PERCENTS = [5, 10, 10, 15, 15, 20, 25, 30]
+COUPON_USAGE = 0.3  # share of orders that use a coupon
+
+
+def plant_chunk(seed: int, chunk: int) -> Dict[str, np.ndarray]:
+    """Generate the columns of one chunk of plants (ids chunk*CHUNK_SIZE+1 ...)"""
+    rng = np.random.default_rng([seed, chunk])
+    sizes = rng.choice(len(SIZES), CHUNK_SIZE, p=SIZE_WEIGHTS)
+    prices = np.array(SIZE_MEDIAN_PRICE)[sizes] * rng.lognormal(0.0, PRICE_SPREAD, CHUNK_SIZE)
+    # Shop-style prices: x.49 / x.99 / x.00
+    prices = np.maximum(np.floor(prices), 1.0) + rng.choice([0.49, 0.99, 0.0], CHUNK_SIZE, p=[0.3, 0.5, 0.2])
+    return {
+        'size': sizes,
+        'color': rng.choice(len(COLORS), CHUNK_SIZE, p=COLOR_WEIGHTS),
+        'price': np.round(prices, 2),
+        'adjective': rng.integers(len(ADJECTIVES), size=CHUNK_SIZE),
+        'genus': rng.integers(len(GENERA), size=CHUNK_SIZE),
+        'description': rng.integers(len(DESCRIPTIONS), size=CHUNK_SIZE),
+        'image': rng.integers(len(IMAGES), size=CHUNK_SIZE),
+        'stock': rng.poisson(np.array(SIZE_MEAN_STOCK)[sizes]),
+    }
+
+
+def _plant(columns: Dict[str, np.ndarray], i: int, plant_id: int) -> Dict:
+    genus = GENERA[columns['genus'][i]]
+    color = COLORS[columns['color'][i]]
+    return {
+        'id': plant_id,
+        'name': f"{ADJECTIVES[columns['adjective'][i]]} {genus}",
+        'description': DESCRIPTIONS[columns['description'][i]].format(color=color, genus=genus.lower()),
+        'price': float(columns['price'][i]),
+        'size': SIZES[columns['size'][i]],
+        'color': color,
+        'image': IMAGES[columns['image'][i]],
+        'stock': int(columns['stock'][i]),
+    }
+
+
+def iter_plants(num_plants: int, seed: int = 0) -> Iterator[Dict]:
+    """Yield plant records with ids 1..num_plants, one chunk in memory at a time"""
+    for chunk in range((num_plants + CHUNK_SIZE - 1) // CHUNK_SIZE):
+        columns = plant_chunk(seed, chunk)
+        first_id = chunk * CHUNK_SIZE + 1
+        for i in range(min(CHUNK_SIZE, num_plants - chunk * CHUNK_SIZE)):
+            yield _plant(columns, i, first_id + i)
+
+
+class PlantLookup:
+    """Regenerate single plants by id, keeping a few recently used chunks"""
+
+    def __init__(self, seed: int, max_chunks: int = 16):
+        self.seed = seed
+        self.max_chunks = max_chunks
+        self._chunks: 'OrderedDict[int, Dict[str, np.ndarray]]' = OrderedDict()
+
+    def __getitem__(self, plant_id: int) -> Dict:
+        chunk, i = divmod(plant_id - 1, CHUNK_SIZE)
+        columns = self._chunks.get(chunk)
+        if columns is None:
+            columns = self._chunks[chunk] = plant_chunk(self.seed, chunk)
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(chunk)
+        return _plant(columns, i, plant_id)
+
+
+def coupon(index: int, seed: int = 0) -> Tuple[str, int, str]:
+    """Return (code, discount_percent, description) of coupon number `index`"""
+    mixed = (index * 2654435761 + seed * 40503) % 2**32
+    prefix = COUPON_PREFIXES[mixed % len(COUPON_PREFIXES)]
+    percent = COUPON_PERCENTS[(mixed >> 8) % len(COUPON_PERCENTS)]
+    return f"{prefix}{percent}X{index}", percent, f"{prefix.title()} offer - {percent}% off"
+
+
+def write_plants(out, num_plants: int, seed: int = 0) -> int:
+    """Stream a {"plants": [...]} catalog to a file object, one plant per line"""
+    out.write('{\n  "plants": [\n')
+    for plant in iter_plants(num_plants, seed):
+        if plant['id'] > 1:
+            out.write(',\n')
+        out.write('    ')
+        out.write(json.dumps(plant))
+    out.write('\n  ]\n}\n')
+    return num_plants
+
+
+def write_coupons(out, num_coupons: int, seed: int = 0) -> int:
+    """Stream a {"coupons": {...}} table to a file object, one coupon per line"""
+    out.write('{\n  "coupons": {\n')
+    for index in range(num_coupons):
+        code, percent, description = coupon(index, seed)
+        if index:
+            out.write(',\n')
+        out.write(f'    {json.dumps(code)}: {json.dumps({"discount_percent": percent, "description": description})}')
+    out.write('\n  }\n}\n')
+    return num_coupons
+
+
+def iter_orders(num_orders: int, num_plants: int, num_coupons: int, num_customers: int,
+                seed: int = 0, start_time: float = None) -> Iterator[Dict]:
+    """Yield order log records priced with the shop's rules (size discount, coupon, GST)"""
+    rng = np.random.default_rng([seed, 2**31])
+    plants = PlantLookup(seed)
+    start_time = time.time() - 365 * 86400 if start_time is None else start_time
+    for order_id in range(1, num_orders + 1):
+        # Popular plants are ordered far more often (Zipf-like), so low ids are hot
+        num_lines = int(rng.integers(1, 7))
+        plant_ids = {int(min(rng.zipf(1.3), num_plants)) if rng.random() < 0.7 else int(rng.integers(1, num_plants + 1))
+                     for _ in range(num_lines)}
+        items = {}
+        size_counts = [0] * len(SIZES)
+        subtotal = 0
+        for plant_id in plant_ids:
+            plant = plants[plant_id]
+            quantity = int(rng.integers(1, 5))
+            items[plant_id] = {'name': plant['name'], 'price': plant['price'], 'quantity': quantity,
+                              'size': plant['size']}
+            size_counts[SIZES.index(plant['size'])] += quantity
+            subtotal += plant['price'] * quantity
+
+        code, percent = "NIL", 0
+        if num_coupons and rng.random() < COUPON_USAGE:
+            code, percent, _ = coupon(int(rng.integers(num_coupons)), seed)
+        quote = quote_totals(subtotal, size_counts, percent)
+        total_discount = quote.size_discount + quote.coupon_discount
+        yield {
+            'items': items,
+            'subtotal': quote.subtotal,
+            'GST': quote.gst,
+            'final_total': quote.total,
+            'item_count': sum(size_counts),
+            'Discount': "-$" + str(round(total_discount, 2)) if total_discount > 0 else "NIL",
+            'Coupon': code,
+            'coupon_discount': quote.coupon_discount,
+            'order_id': order_id,
+            'customer': f"customer-{int(rng.integers(num_customers))}",
+            'created_at': start_time + order_id * (365 * 86400 / num_orders),
+        }
+
+
+def write_orders(out, num_orders: int, num_plants: int, num_coupons: int, num_customers: int, seed: int = 0) -> int:
+    """Stream an order log (one JSON order per line) to a file object"""
+    for order in iter_orders(num_orders, num_plants, num_coupons, num_customers, seed):
+        out.write(json.dumps(order))
+        out.write('\n')
+    return num_orders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate large seeded catalogs, coupon tables and order logs")
+    parser.add_argument('--seed', type=int, default=0)
+    sub = parser.add_subparsers(dest='kind', required=True)
+
+    plants_parser = sub.add_parser('plants', help="plants_data.json style catalog")
+    plants_parser.add_argument('count', type=int)
+    plants_parser.add_argument('-o', '--output', default='-')
+
+    coupons_parser = sub.add_parser('coupons', help="coupons.json style coupon table")
+    coupons_parser.add_argument('count', type=int)
+    coupons_parser.add_argument('-o', '--output', default='-')
+
+    orders_parser = sub.add_parser('orders', help="orders.log style order history")
+    orders_parser.add_argument('count', type=int)
+    orders_parser.add_argument('--plants', type=int, required=True, help="Size of the catalog the orders refer to")
+    orders_parser.add_argument('--coupons', type=int, default=0, help="Size of the coupon table to draw from")
+    orders_parser.add_argument('--customers', type=int, default=10000)
+    orders_parser.add_argument('-o', '--output', default='-')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', buffering=1024 * 1024)
+    start = time.perf_counter()
+    try:
+        if args.kind == 'plants':
+            count = write_plants(out, args.count, args.seed)
+        elif args.kind == 'coupons':
+            count = write_coupons(out, args.count, args.seed)
+        else:
+            count = write_orders(out, args.count, args.plants, args.coupons, args.customers, args.seed)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} {args.kind} in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from PIL import Image, ImageOps
+
+# Failed fetches are not retried before this many seconds
+RETRY_FAILED_AFTER = 300
+
+
+def fetch_image(source: str, timeout: float = 10) -> bytes:
+    """Return the raw bytes of an image URL or local file path"""
+    if source.startswith(('http://', 'https://')):
+        request = urllib.request.Request(source, headers={'User-Agent': 'garden-paradise-thumbnailer'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read()
+    if source.startswith('file://'):
+        source = source[len('file://'):]
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def make_thumbnail(data: bytes, size: Tuple[int, int]) -> bytes:
+    """Crop and scale an image to exactly `size`, returned as JPEG bytes"""
+    with Image.open(io.BytesIO(data)) as image:
+        thumbnail = ImageOps.fit(image.convert('RGB'), size)
+    out = io.BytesIO()
+    thumbnail.save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    """Fetch each image once, keep a fixed-size thumbnail on disk and the hot ones in memory.
+
+    get() never waits for the network: a thumbnail that is not in memory or on
+    disk yet is queued for a pool of background workers and get() returns None,
+    so the caller shows the original URL until it is ready. An image is only
+    queued once however many sessions ask for it. The in-memory cache is an
+    LRU bounded by total thumbnail bytes. `hits` and `misses` count memory
+    lookups; `fetches` counts trips to the image source.
+    """
+
+    def __init__(self, cache_dir: str = 'thumbnails', size: Tuple[int, int] = (200, 200),
+                 max_bytes: int = 32 * 1024 * 1024, fetch: Callable[[str], bytes] = fetch_image,
+                 workers: int = 4, max_pending: int = 1000):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.max_pending = max_pending
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._lru: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._failed: Dict[str, float] = {}
+        self._pending: Set[str] = set()  # queued or being built
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._queue: 'queue.Queue[Optional[str]]' = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, name=f"thumbnailer-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def path_for(self, source: str) -> str:
+        """Return the on-disk thumbnail path for an image source"""
+        digest = hashlib.sha1(f"{source}|{self.size[0]}x{self.size[1]}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def get(self, source: str) -> Optional[bytes]:
+        """Return thumbnail bytes for an image, or None while it isn't built (see prefetch)"""
+        with self._lock:
+            thumbnail = self._lru.get(source)
+            if thumbnail is not None:
+                self._lru.move_to_end(source)
+                self.hits += 1
+                return thumbnail
+            self.misses += 1
+
+        try:
+            with open(self.path_for(source), 'rb') as f:
+                thumbnail = f.read()
+        except OSError:
+            self.prefetch(source)  # not built yet (or by another process)
+            return None
+        self._remember(source, thumbnail)
+        return thumbnail
+
+    def prefetch(self, source: str):
+        """Queue a thumbnail to be built in the background, unless it is queued already or failed lately"""
+        with self._lock:
+            if source in self._lru or source in self._pending or len(self._pending) >= self.max_pending:
+                return  # a full queue is left alone; the image is asked for again on its next view
+            failed_at = self._failed.get(source)
+            if failed_at is not None and time.monotonic() - failed_at < RETRY_FAILED_AFTER:
+                return
+            self._pending.add(source)
+        self._queue.put(source)
+
+    def _remember(self, source: str, thumbnail: bytes):
+        with self._lock:
+            if source not in self._lru:
+                self._lru[source] = thumbnail
+                self._bytes += len(thumbnail)
+                while self._bytes > self.max_bytes and len(self._lru) > 1:
+                    _, evicted = self._lru.popitem(last=False)
+                    self._bytes -= len(evicted)
+
+    def _work(self):
+        while True:
+            source = self._queue.get()
+            try:
+                if source is None:
+                    return
+                thumbnail = self._build(source)
+                if thumbnail is not None:
+                    self._remember(source, thumbnail)
+            finally:
+                with self._lock:
+                    self._pending.discard(source)
+                self._queue.task_done()
+
+    def _build(self, source: str) -> Optional[bytes]:
+        with self._lock:
+            self.fetches += 1
+        try:
+            thumbnail = make_thumbnail(self.fetch(source), self.size)
+        except Exception:
+            with self._lock:
+                self._failed[source] = time.monotonic()
+            return None
+
+        # Write to a temp file first so other processes never read half a thumbnail
+        tmp_path = f"{self.path_for(source)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, self.path_for(source))
+        except OSError:
+            # e.g. a full disk: serve it from memory, and build it again if it gets evicted
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return thumbnail
+
+    def join(self):
+        """Wait until every queued thumbnail has been built (or has failed)"""
+        self._queue.join()
+
+    def close(self):
+        """Stop the workers once the queued thumbnails are done"""
+        for _ in self._workers:
+            self._queue.put(None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetches': self.fetches,
+                'pending': len(self._pending),
+                'entries': len(self._lru),
+                'bytes': self._bytes,
+            }
@@ -0,0 +1,346 @@
+"""Streaming, validating ingest for plants_data.json style catalogs.
+
+The "plants" array is parsed one record at a time from fixed-size chunks of
+the file, so only the current chunk and record are held besides whatever the
+caller keeps. Every record is checked and normalized on the way in; bad
+records are skipped and reported together with the line they start on, and
+IngestError is raised once the whole file has been read.
+
+Usage:
+    python ingest.py plants_data.json   # validate a catalog and list every problem
+"""
+import json
+import math
+import re
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from facets import FacetIndex, FacetIndexBuilder
+from pricing import SIZES
+
+PLANT_FIELDS = ['id', 'name', 'description', 'price', 'size', 'color', 'image', 'stock']
+OPTIONAL_FIELDS = {'stock'}
+UNTRACKED_STOCK = -1  # stock of a plant whose record has no "stock": never runs out
+
+CHUNK_CHARS = 1024 * 1024
+MAX_RECORD_CHARS = 1024 * 1024  # a record longer than this is treated as malformed
+MAX_REPORTED_ERRORS = 100
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+class IngestError(ValueError):
+    """The catalog file has invalid records; `errors` lists them as 'line N: problem'"""
+
+    def __init__(self, errors: List[str], total: Optional[int] = None):
+        self.errors = errors
+        self.total = len(errors) if total is None else total
+        more = f"\n... and {self.total - len(errors)} more" if self.total > len(errors) else ""
+        super().__init__(f"{self.total} invalid catalog record(s):\n" + "\n".join(errors) + more)
+
+
+class _Reader:
+    """JSON tokens from a text file read in chunks, keeping track of line numbers"""
+
+    def __init__(self, f, chunk_chars: int):
+        self.f = f
+        self.chunk_chars = chunk_chars
+        self.buf = ""
+        self.pos = 0
+        self.line = 1
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer; returns False at the end of the file"""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_chars)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data  # drop what was already consumed
+        self.pos = 0
+        return True
+
+    def advance(self, end: int):
+        self.line += self.buf.count("\n", self.pos, end)
+        self.pos = end
+
+    def error(self, message: str, pos: Optional[int] = None) -> IngestError:
+        line = self.line if pos is None else self.line + self.buf.count("\n", self.pos, pos)
+        return IngestError([f"line {line}: {message}"])
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at the end of the file)"""
+        while True:
+            self.advance(_WHITESPACE.match(self.buf, self.pos).end())
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise self.error(f"expected '{char}' but found {repr(found) if found else 'end of file'}")
+        self.advance(self.pos + 1)
+
+    def value(self) -> Tuple[int, object]:
+        """Decode the next JSON value; returns (line it starts on, value)"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Most likely the value continues in the next chunk
+                if len(self.buf) - self.pos <= MAX_RECORD_CHARS and self.fill():
+                    continue
+                raise self.error(f"invalid JSON: {e.msg}", e.pos)
+            if end == len(self.buf) and self.fill():
+                continue  # a number right at the end of the chunk may be cut short
+            line = self.line
+            self.advance(end)
+            return line, value
+
+    def array_items(self) -> Iterator[Tuple[int, object]]:
+        """Yield (line, value) for the elements of the array whose '[' was just consumed"""
+        if self.peek() == "]":
+            self.advance(self.pos + 1)
+            return
+        scan = _DECODER.scan_once
+        while True:
+            # Fast path: the value and the separator after it are both in the buffer
+            buf, start = self.buf, self.pos
+            try:
+                value, end = scan(buf, start)
+                match = _SEPARATOR.match(buf, end)
+            except (StopIteration, json.JSONDecodeError):
+                match = None
+            if match is not None and match.end() < len(buf):
+                line = self.line
+                self.line += buf.count("\n", start, match.end())
+                self.pos = match.end()
+            else:
+                line, value = self.value()
+                found = self.peek()
+                if found not in (",", "]"):
+                    raise self.error(f"expected ',' or ']' but found {repr(found) if found else 'end of file'}")
+                match = _SEPARATOR.match(self.buf, self.pos)
+                self.advance(match.end())
+            yield line, value
+            if match.group(1) == "]":
+                return
+
+
+def iter_records(f, chunk_chars: int = CHUNK_CHARS) -> Iterator[Tuple[int, object]]:
+    """Yield (line, raw record) for every element of the top-level "plants" array"""
+    reader = _Reader(f, chunk_chars)
+    reader.expect("{")
+    while True:
+        if reader.peek() in ("}", ""):
+            raise reader.error('no "plants" array in the file')
+        _, key = reader.value()
+        reader.expect(":")
+        if key == "plants":
+            break
+        reader.value()  # some other top-level key: skip its value
+        if reader.peek() == ",":
+            reader.advance(reader.pos + 1)
+
+    reader.expect("[")
+    yield from reader.array_items()
+
+
+_SIZE_SET = frozenset(SIZES)
+
+
+def _clean_copy(raw) -> Optional[Dict]:
+    """Fast path for a record that is already valid and normalized: return it rebuilt with
+    shared key strings and interned facet values (each decoded record otherwise carries its
+    own copies), or None if it needs the full check"""
+    try:
+        stock = raw.get('stock', UNTRACKED_STOCK)
+        if len(raw) != len(PLANT_FIELDS) - ('stock' not in raw):
+            return None
+        plant_id, price, name, color = raw['id'], raw['price'], raw['name'], raw['color']
+        size, description, image = raw['size'], raw['description'], raw['image']
+        if not (type(plant_id) is int and plant_id >= 0
+                and type(stock) is int and (stock >= 0 or 'stock' not in raw)
+                and type(price) is float and math.isfinite(price) and price >= 0
+                and size in _SIZE_SET
+                and type(name) is str and name and not name[0].isspace() and not name[-1].isspace()
+                and type(color) is str and color and color.islower() and color == color.strip()
+                and type(description) is str and type(image) is str):
+            return None
+    except (KeyError, TypeError, AttributeError):
+        return None
+    return {'id': plant_id, 'name': name, 'description': description, 'price': price,
+            'size': sys.intern(size), 'color': sys.intern(color), 'image': image, 'stock': stock}
+
+
+def normalize_plant(raw) -> Dict:
+    """Return a cleaned-up copy of a plant record, or raise ValueError listing what is wrong with it"""
+    plant = _clean_copy(raw)
+    if plant is not None:
+        return plant
+    if not isinstance(raw, dict):
+        raise ValueError(f"expected a plant object, got {type(raw).__name__}")
+    missing = [field for field in PLANT_FIELDS if field not in raw and field not in OPTIONAL_FIELDS]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    plant = dict(raw)
+    problems = []
+
+    plant_id = raw['id']
+    if isinstance(plant_id, str) and plant_id.strip().isdigit():
+        plant_id = int(plant_id)
+    elif isinstance(plant_id, float) and plant_id.is_integer():
+        plant_id = int(plant_id)
+    if isinstance(plant_id, bool) or not isinstance(plant_id, int) or plant_id < 0:
+        problems.append(f"id must be a non-negative integer, got {raw['id']!r}")
+    plant['id'] = plant_id
+
+    price = raw['price']
+    if isinstance(price, str):
+        try:
+            price = float(price.strip().lstrip('$'))
+        except ValueError:
+            pass
+    if isinstance(price, bool) or not isinstance(price, (int, float)) or not math.isfinite(price) or price < 0:
+        problems.append(f"price must be a non-negative number, got {raw['price']!r}")
+    else:
+        plant['price'] = float(price)
+
+    size = raw['size'].strip().lower() if isinstance(raw['size'], str) else raw['size']
+    if size not in SIZES:
+        problems.append(f"size must be one of {', '.join(SIZES)}, got {raw['size']!r}")
+    plant['size'] = size
+
+    for field in ('name', 'color'):
+        if not isinstance(raw[field], str) or not raw[field].strip():
+            problems.append(f"{field} must be a non-empty string, got {raw[field]!r}")
+        else:
+            plant[field] = raw[field].strip()
+    if isinstance(plant['color'], str):
+        plant['color'] = plant['color'].lower()
+
+    for field in ('description', 'image'):
+        if not isinstance(raw[field], str):
+            problems.append(f"{field} must be a string, got {raw[field]!r}")
+
+    stock = raw.get('stock', UNTRACKED_STOCK)
+    if 'stock' in raw:
+        if isinstance(stock, str) and stock.strip().isdigit():
+            stock = int(stock)
+        elif isinstance(stock, float) and stock.is_integer():
+            stock = int(stock)
+        if isinstance(stock, bool) or not isinstance(stock, int) or stock < 0:
+            problems.append(f"stock must be a non-negative integer, got {raw['stock']!r}")
+    plant['stock'] = stock
+
+    if problems:
+        raise ValueError("; ".join(problems))
+    plant['size'], plant['color'] = sys.intern(plant['size']), sys.intern(plant['color'])
+    return plant
+
+
+class _SeenIds:
+    """Bitmap of the ids seen so far (a set takes over for ids too big for the bitmap)"""
+    MAX_BITMAP_BYTES = 64 * 1024 * 1024
+
+    def __init__(self):
+        self._bitmap = bytearray(1024)
+        self._large = set()
+
+    def add(self, plant_id: int) -> bool:
+        """Mark an id as seen; returns False if it was seen before"""
+        byte, bit = plant_id >> 3, 1 << (plant_id & 7)
+        if byte >= self.MAX_BITMAP_BYTES:
+            if plant_id in self._large:
+                return False
+            self._large.add(plant_id)
+            return True
+        if byte >= len(self._bitmap):
+            self._bitmap.extend(bytes(min(max(byte + 1, 2 * len(self._bitmap)), self.MAX_BITMAP_BYTES) - len(self._bitmap)))
+        if self._bitmap[byte] & bit:
+            return False
+        self._bitmap[byte] |= bit
+        return True
+
+
+class CatalogIngest:
+    """Stream the valid, normalized plants of a catalog file.
+
+    Iterating yields each good plant in file order while checking id
+    uniqueness and, with build_index, adding it to the facet index. Problems
+    are collected in `errors`; call check() afterwards to raise them.
+    """
+
+    def __init__(self, path: str, build_index: bool = True, chunk_chars: int = CHUNK_CHARS):
+        self.path = path
+        self.chunk_chars = chunk_chars
+        self.errors: List[str] = []
+        self.error_count = 0
+        self.count = 0
+        self._index = FacetIndexBuilder() if build_index else None
+
+    def _report(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {message}")
+
+    def __iter__(self) -> Iterator[Dict]:
+        seen = _SeenIds()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                for line, raw in iter_records(f, self.chunk_chars):
+                    try:
+                        plant = normalize_plant(raw)
+                    except ValueError as e:
+                        self._report(line, str(e))
+                        continue
+                    if not seen.add(plant['id']):
+                        self._report(line, f"duplicate id {plant['id']}")
+                        continue
+                    if self._index is not None:
+                        self._index.add(plant)
+                    self.count += 1
+                    yield plant
+            except IngestError as e:
+                # Broken JSON: nothing after this point can be trusted
+                for error in e.errors:
+                    self.error_count += 1
+                    self.errors.append(error)
+
+    def check(self):
+        """Raise IngestError if any record was rejected"""
+        if self.error_count:
+            raise IngestError(self.errors, self.error_count)
+
+    def index(self) -> FacetIndex:
+        """Return the facet index of the plants yielded so far"""
+        return self._index.build()
+
+
+def load_plants(path: str) -> Tuple[List[Dict], FacetIndex]:
+    """Read and validate a catalog file; returns (plants, facet index) or raises IngestError"""
+    ingest = CatalogIngest(path)
+    plants = list(ingest)
+    ingest.check()
+    return plants, ingest.index()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python ingest.py plants_data.json")
+        sys.exit(1)
+    ingest = CatalogIngest(sys.argv[1], build_index=False)
+    for _ in ingest:
+        pass
+    for error in ingest.errors:
+        print(error)
+    if ingest.error_count > len(ingest.errors):
+        print(f"... and {ingest.error_count - len(ingest.errors)} more")
+    print(f"{ingest.count} valid plants, {ingest.error_count} problem(s)")
+    sys.exit(1 if ingest.error_count else 0)
@@ -0,0 +1,272 @@
+"""Stock levels and checkout reservations.
+
+A plant's "stock" in the catalog is the number of units ever put on sale
+(raise it to restock). The inventory counts the units sold, so what is
+left is stock - sold. A checkout reserves every line of the cart in one
+step: either all lines fit in what is left and are counted as sold, or
+nothing changes and OutOfStock says which plants ran short. Plants whose
+stock is untracked (-1) are never counted and never run out.
+
+Neither backend has a global lock. MemoryInventory guards the counts with
+a fixed set of lock stripes, one per group of plant ids, so checkouts of
+different plants never wait for each other. SqliteInventory keeps the
+counts in SQLite files shared by every server process, split into shards
+by plant id the same way, and reserves with conditional updates inside a
+short write transaction on each shard the cart touches.
+"""
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Tuple
+
+from ingest import UNTRACKED_STOCK
+
+
+class OutOfStock(Exception):
+    """A reservation that didn't fit; `shortages` maps plant id -> units still available"""
+
+    def __init__(self, shortages: Dict[int, int]):
+        super().__init__(", ".join(f"plant {plant_id}: {units} left" for plant_id, units in sorted(shortages.items())))
+        self.shortages = shortages
+
+
+def _tracked_lines(quantities: Dict[int, int], stock: Dict[int, int]) -> List[Tuple[int, int, int]]:
+    """(plant id, quantity, stock) for the lines whose plant has tracked stock, in plant id order"""
+    return [(plant_id, quantity, stock[plant_id]) for plant_id, quantity in sorted(quantities.items())
+            if quantity > 0 and stock.get(plant_id, UNTRACKED_STOCK) != UNTRACKED_STOCK]
+
+
+class Inventory(ABC):
+    """Units sold per plant, with all-or-nothing reservations"""
+
+    @abstractmethod
+    def reserve(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        """Count `quantities` (plant id -> units) as sold, or raise OutOfStock and count nothing.
+
+        `stock` maps plant id -> the catalog's stock for it (UNTRACKED_STOCK to skip the check).
+        """
+
+    @abstractmethod
+    def release(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        """Undo a reservation (e.g. the order couldn't be saved)"""
+
+    @abstractmethod
+    def sold_many(self, plant_ids: Iterable[int]) -> Dict[int, int]:
+        """Return plant id -> units sold (0 for plants never sold)"""
+
+    def available(self, plants: Iterable[Dict]) -> Dict[int, int]:
+        """Return plant id -> units left for catalog plants with tracked stock"""
+        tracked = {plant['id']: plant['stock'] for plant in plants if plant['stock'] != UNTRACKED_STOCK}
+        sold = self.sold_many(tracked)
+        return {plant_id: max(stock - sold[plant_id], 0) for plant_id, stock in tracked.items()}
+
+    def close(self):
+        pass
+
+
+class MemoryInventory(Inventory):
+    """Sold counts in a dict, locked per stripe of plant ids (one process only)"""
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._sold: Dict[int, int] = {}
+
+    def _stripes(self, lines) -> List[threading.Lock]:
+        # Always taken in stripe order, so two checkouts can't each hold a lock the other wants
+        return [self._locks[i] for i in sorted({plant_id % len(self._locks) for plant_id, _, _ in lines})]
+
+    def reserve(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        lines = _tracked_lines(quantities, stock)
+        locks = self._stripes(lines)
+        for lock in locks:
+            lock.acquire()
+        try:
+            shortages = {plant_id: max(units - self._sold.get(plant_id, 0), 0) for plant_id, quantity, units in lines
+                         if self._sold.get(plant_id, 0) + quantity > units}
+            if shortages:
+                raise OutOfStock(shortages)
+            for plant_id, quantity, _ in lines:
+                self._sold[plant_id] = self._sold.get(plant_id, 0) + quantity
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def release(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        lines = _tracked_lines(quantities, stock)
+        locks = self._stripes(lines)
+        for lock in locks:
+            lock.acquire()
+        try:
+            for plant_id, quantity, _ in lines:
+                self._sold[plant_id] = max(self._sold.get(plant_id, 0) - quantity, 0)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def sold_many(self, plant_ids: Iterable[int]) -> Dict[int, int]:
+        return {plant_id: self._sold.get(plant_id, 0) for plant_id in plant_ids}
+
+
+class SqliteInventory(Inventory):
+    """Sold counts in SQLite files (WAL mode), shared by every server process on the host.
+
+    The plants are split over `shards` files by plant id (`path` itself for
+    one shard, `path`.0, `path`.1, ... otherwise). SQLite locks a whole file
+    for writing, so a reservation only write-locks the shards its lines fall
+    in: checkouts of plants in different shards commit in parallel. Shards
+    are locked in shard order, so two checkouts never wait for each other
+    in a cycle. A reservation commits its shards one after the other once
+    every line fits; if a commit fails the shards already committed are
+    released again.
+    """
+
+    def __init__(self, path: str, shards: int = 1, busy_timeout: float = 5.0):
+        self.path = path
+        self.shards = shards
+        self.busy_timeout = busy_timeout
+        self._paths = [path] if shards == 1 else [f"{path}.{i}" for i in range(shards)]
+        self._local = threading.local()
+        for shard in range(shards):
+            conn = self._conn(shard)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sold (plant_id INTEGER PRIMARY KEY, units INTEGER NOT NULL)")
+        self._check_layout()
+
+    def _conn(self, shard: int) -> sqlite3.Connection:
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = [None] * self.shards
+        conn = conns[shard]
+        if conn is None:
+            # Autocommit mode: reserve() opens its own transactions
+            conn = sqlite3.connect(self._paths[shard], timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conns[shard] = conn
+        return conn
+
+    def _check_layout(self):
+        """Record the shard count in the first shard; adopt the counts of a single-file inventory"""
+        conn = self._conn(0)
+        conn.execute("BEGIN IMMEDIATE")  # one process at a time sets up (and migrates) the files
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS layout (shards INTEGER NOT NULL)")
+            row = conn.execute("SELECT shards FROM layout").fetchone()
+            adopt = row is None and self.shards > 1 and os.path.exists(self.path)
+            if row is None:
+                if self.shards == 1 and os.path.exists(f"{self.path}.0"):
+                    raise ValueError(f"{self.path} has been split into shards ({self.path}.0, ...); open it with those")
+                conn.execute("INSERT INTO layout (shards) VALUES (?)", (self.shards,))
+                if adopt:
+                    self._adopt(self.path)
+            elif row[0] != self.shards:
+                raise ValueError(f"{self._paths[0]} belongs to an inventory of {row[0]} shards, not {self.shards}")
+            conn.execute("COMMIT")
+        except BaseException:
+            self._rollback([0])
+            raise
+        if adopt:
+            os.replace(self.path, f"{self.path}.migrated")
+
+    def _adopt(self, old_path: str):
+        """Copy the sold counts of a single-file inventory into the shards"""
+        old = sqlite3.connect(old_path)
+        try:
+            rows = [tuple(row) for row in old.execute("SELECT plant_id, units FROM sold")]
+        except sqlite3.OperationalError:
+            rows = []  # not an inventory after all
+        finally:
+            old.close()
+        # Nothing is sold from the shards before the layout is committed, so copying the counts over is safe to redo
+        sql = "INSERT OR REPLACE INTO sold (plant_id, units) VALUES (?, ?)"
+        for shard, shard_rows in sorted(self._by_shard(rows).items()):
+            conn = self._conn(shard)
+            if shard == 0:
+                conn.executemany(sql, shard_rows)  # inside the setup transaction
+            else:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(sql, shard_rows)
+
+    def _by_shard(self, lines) -> Dict[int, List]:
+        groups: Dict[int, List] = {}
+        for line in lines:
+            groups.setdefault(line[0] % self.shards, []).append(line)
+        return groups
+
+    def reserve(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        lines = _tracked_lines(quantities, stock)
+        if not lines:
+            return
+        groups = self._by_shard(lines)
+        locked, committed = [], []
+        try:
+            short = []
+            for shard in sorted(groups):
+                conn = self._conn(shard)
+                # IMMEDIATE takes the shard's write lock up front, so the checks and updates see one consistent count
+                conn.execute("BEGIN IMMEDIATE")
+                locked.append(shard)
+                for plant_id, quantity, units in groups[shard]:
+                    # Compare-and-add: the row only changes if the new total still fits in stock
+                    changed = conn.execute(
+                        "INSERT INTO sold (plant_id, units) SELECT ?1, ?2 WHERE ?2 <= ?3 "
+                        "ON CONFLICT(plant_id) DO UPDATE SET units = units + excluded.units "
+                        "WHERE units + excluded.units <= ?3", (plant_id, quantity, units)).rowcount
+                    if not changed:
+                        short.append((plant_id, units))
+            if short:
+                self._rollback(locked)
+                sold = self.sold_many(plant_id for plant_id, _ in short)
+                raise OutOfStock({plant_id: max(units - sold[plant_id], 0) for plant_id, units in short})
+            for shard in locked:
+                self._conn(shard).execute("COMMIT")
+                committed.append(shard)
+        except sqlite3.Error:
+            self._rollback(locked)
+            if committed:  # give back what the shards that did commit counted
+                self.release({plant_id: quantity for shard in committed for plant_id, quantity, _ in groups[shard]},
+                             stock)
+            raise
+
+    def _rollback(self, shards: List[int]):
+        for shard in shards:
+            conn = self._conn(shard)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    def release(self, quantities: Dict[int, int], stock: Dict[int, int]):
+        for shard, lines in self._by_shard(_tracked_lines(quantities, stock)).items():
+            conn = self._conn(shard)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("UPDATE sold SET units = max(units - ?, 0) WHERE plant_id = ?",
+                                 [(quantity, plant_id) for plant_id, quantity, _ in lines])
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._rollback([shard])
+                raise
+
+    def sold_many(self, plant_ids: Iterable[int]) -> Dict[int, int]:
+        plant_ids = list(plant_ids)
+        sold = dict.fromkeys(plant_ids, 0)
+        groups: Dict[int, List[int]] = {}
+        for plant_id in plant_ids:
+            groups.setdefault(plant_id % self.shards, []).append(plant_id)
+        for shard, ids in groups.items():
+            sql = f"SELECT plant_id, units FROM sold WHERE plant_id IN ({', '.join('?' * len(ids))})"
+            sold.update(self._conn(shard).execute(sql, ids))
+        return sold
+
+    def close(self):
+        for conn in getattr(self._local, 'conns', None) or ():
+            if conn is not None:
+                conn.close()
+        self._local.conns = None
+
+
+def open_inventory(path: str, shards: int = 16) -> Inventory:
+    """':memory:' keeps sold counts in this process only; anything else is SQLite files split into `shards`"""
+    if path == ':memory:':
+        return MemoryInventory()
+    return SqliteInventory(path, shards)
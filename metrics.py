@@ -0,0 +1,233 @@
+"""In-process timing spans aggregated into latency histograms, plus gauges.
+
+Spans are off unless PLANT_METRICS=1. When off, timed() hands back the
+function it decorates untouched and span() returns a shared no-op context
+manager, so instrumented code pays nothing beyond a global lookup.
+
+When on, histograms are written in Prometheus text format to
+PLANT_METRICS_FILE (default metrics.prom) every PLANT_METRICS_INTERVAL
+seconds, and served over HTTP at /metrics if PLANT_METRICS_PORT is set.
+Gauges (e.g. the checkout queue depth) are read when the metrics are
+exported, so registering one costs nothing until then.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.environ.get('PLANT_METRICS', '0').lower() in ('1', 'true', 'yes', 'on')
+METRICS_FILE = os.environ.get('PLANT_METRICS_FILE', 'metrics.prom')
+EXPORT_INTERVAL = float(os.environ.get('PLANT_METRICS_INTERVAL', '10'))
+METRICS_PORT = os.environ.get('PLANT_METRICS_PORT')
+
+# Upper bucket bounds in milliseconds (the last bucket is +Inf)
+BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+_NOOP = contextlib.nullcontext()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+    __slots__ = ('counts', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile (ms) as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class Registry:
+    """Named histograms shared by every session of the server process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def add_gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """Export `read()` as plant_shop_<name>; registering a name again replaces it"""
+        with self._lock:
+            self._gauges[name] = (help_text, read)
+
+    def gauges(self) -> Dict[str, float]:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        return {name: float(read()) for name, (_, read) in gauges}
+
+    def observe(self, name: str, ms: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._histograms)
+
+    def get(self, name: str) -> Optional[Histogram]:
+        return self._histograms.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Render every histogram in the Prometheus text exposition format"""
+        lines = ["# HELP plant_shop_span_ms Time spent in instrumented app functions",
+                 "# TYPE plant_shop_span_ms histogram"]
+        with self._lock:
+            for name in sorted(self._histograms):
+                histogram = self._histograms[name]
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'plant_shop_span_ms_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'plant_shop_span_ms_bucket{{span="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'plant_shop_span_ms_sum{{span="{name}"}} {histogram.total_ms:.3f}')
+                lines.append(f'plant_shop_span_ms_count{{span="{name}"}} {histogram.count}')
+            gauges = sorted(self._gauges.items())
+        for name, (help_text, read) in gauges:
+            lines += [f"# HELP plant_shop_{name} {help_text}", f"# TYPE plant_shop_{name} gauge",
+                      f"plant_shop_{name} {float(read()):g}"]
+        return "\n".join(lines) + "\n"
+
+    def to_text(self) -> str:
+        """Human-readable table: count, mean and estimated percentiles per span"""
+        rows = [f"{'span':32} {'count':>8} {'mean ms':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+        with self._lock:
+            for name in sorted(self._histograms):
+                h = self._histograms[name]
+                rows.append(f"{name:32} {h.count:8d} {h.total_ms / h.count:9.2f} {h.quantile(0.5):8.2f} "
+                            f"{h.quantile(0.9):8.2f} {h.quantile(0.99):8.2f} {h.max_ms:8.2f}")
+        rows += [f"{name:32} {value:g}" for name, value in self.gauges().items()]
+        return "\n".join(rows) + "\n"
+
+    def write(self, path: str):
+        """Write the Prometheus text to `path`, replacing it atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def span(name: str):
+    """Context manager timing the block it wraps"""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def observe(name: str, ms: float):
+    """Record one measurement taken elsewhere (a no-op when metrics are off)"""
+    if ENABLED:
+        REGISTRY.observe(name, ms)
+
+
+def gauge(name: str, help_text: str, read: Callable[[], float]):
+    """Register a gauge read at export time"""
+    REGISTRY.add_gauge(name, help_text, read)
+
+
+def timed(name: Optional[str] = None):
+    """Decorator timing every call of a function (a no-op when metrics are off)"""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe(span_name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('/metrics', ''):
+            self.send_error(404)
+            return
+        body = REGISTRY.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep scrapes out of the Streamlit log
+
+
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+def _export_loop():
+    while True:
+        time.sleep(EXPORT_INTERVAL)
+        try:
+            REGISTRY.write(METRICS_FILE)
+        except OSError:
+            pass  # try again on the next tick
+
+
+def start_exporter():
+    """Start the file exporter (and HTTP endpoint if configured) once per process"""
+    global _exporter_started
+    if not ENABLED:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    threading.Thread(target=_export_loop, name="metrics-export", daemon=True).start()
+    if METRICS_PORT:
+        server = ThreadingHTTPServer(('127.0.0.1', int(METRICS_PORT)), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
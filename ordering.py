@@ -0,0 +1,59 @@
+from typing import List
+
+import numpy as np
+
+from facets import bits_to_mask, mask_to_bits
+
+# Grid sort options; 'Featured' keeps catalog order (or search relevance)
+SORT_OPTIONS = ['Featured', 'Price: low to high', 'Price: high to low', 'Name: A to Z']
+
+
+class SortIndex:
+    """Presorted permutations of the catalog, built once per catalog version.
+
+    A price range is two binary searches in the sorted prices, and a sorted
+    page of any filter bitset is a walk down a permutation keeping the
+    positions whose bit is set, so nothing is sorted or copied per rerun.
+    """
+
+    def __init__(self, prices: np.ndarray, names: List[str]):
+        self.size = len(prices)
+        prices = np.asarray(prices, dtype=np.float64)
+        # Stable sorts: equal prices keep catalog order in both directions
+        by_price = np.argsort(prices, kind='stable')
+        self.sorted_prices = prices[by_price]
+        self.orders = {
+            'Price: low to high': by_price,
+            'Price: high to low': np.argsort(-prices, kind='stable'),
+            'Name: A to Z': np.array(sorted(range(self.size), key=lambda i: names[i].casefold()), dtype=np.int64),
+        }
+
+    @classmethod
+    def from_catalog(cls, catalog) -> 'SortIndex':
+        prices, names = [], []
+        for price, name in catalog.iter_columns('price', 'name'):
+            prices.append(price)
+            names.append(name)
+        return cls(np.array(prices, dtype=np.float64), names)
+
+    @property
+    def min_price(self) -> float:
+        return float(self.sorted_prices[0]) if self.size else 0.0
+
+    @property
+    def max_price(self) -> float:
+        return float(self.sorted_prices[-1]) if self.size else 0.0
+
+    def price_bits(self, low: float, high: float) -> int:
+        """Return the bitset of plants priced between low and high (inclusive)"""
+        start = np.searchsorted(self.sorted_prices, low, side='left')
+        stop = np.searchsorted(self.sorted_prices, high, side='right')
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.orders['Price: low to high'][start:stop]] = True
+        return mask_to_bits(mask)
+
+    def positions(self, sort: str, bits: int, start: int = 0, stop=None) -> List[int]:
+        """Return the [start:stop] slice of the positions in `bits`, in `sort` order"""
+        order = self.orders[sort]
+        selected = order[bits_to_mask(bits, self.size)[order]]
+        return selected[start:stop].tolist()
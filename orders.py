@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process is assumed
+    fcntl = None
+
+_TAIL_BLOCK = 64 * 1024
+_INDEX_UNDER_LOCK = 64 * 1024  # build_index() scans without the write lock until less than this is left
+
+
+class OrderLog:
+    """Durable, append-only order log (one JSON record per line).
+
+    Order ids are monotonic and handed out in O(1) from an in-memory counter.
+    Writes go straight to the file but fsync is batched: it happens every
+    `sync_every` orders or `sync_interval` seconds, whichever comes first.
+    Recovery on open only reads the tail of the file: a torn last line from a
+    crash is cut off and the counter resumes after the last complete order.
+    """
+
+    def __init__(self, path: str, sync_every: int = 32, sync_interval: float = 0.5):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._offsets: Optional[Dict[str, List[int]]] = None  # customer -> line offsets, see build_index()
+        self._index_lock = threading.Lock()  # one index build at a time; writers never wait for it
+
+        self._lock_file()
+        try:
+            self._end, self._last_id = self._recover()
+        finally:
+            self._unlock_file()
+
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="order-log-sync", daemon=True)
+        self._syncer.start()
+
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _recover(self):
+        """Drop a torn last line and return (end offset, last order id)"""
+        size = os.fstat(self._fd).st_size
+        tail = b""
+        position = size
+        # Read backwards until we hold the last complete line (and the newline before it)
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(_TAIL_BLOCK, position)
+            position -= step
+            tail = os.pread(self._fd, step, position) + tail
+
+        if tail and not tail.endswith(b"\n"):
+            cut = tail.rfind(b"\n") + 1
+            size = position + cut
+            os.ftruncate(self._fd, size)
+            os.fsync(self._fd)
+            tail = tail[:cut]
+
+        lines = tail.splitlines()
+        last_id = json.loads(lines[-1])['order_id'] if lines else 0
+        return size, last_id
+
+    def append(self, customer: str, order: Dict) -> int:
+        """Write an order for a customer and return its new order id"""
+        return self.append_many([(customer, order)])[0]
+
+    def append_many(self, orders: List[Tuple[str, Dict]]) -> List[int]:
+        """Write (customer, order) pairs in one write and return their new order ids.
+
+        An order that already has a created_at keeps it. If the write fails
+        nothing is left in the file, so the whole batch can be retried.
+        """
+        with self._lock:
+            self._lock_file()
+            try:
+                self._catch_up()
+                now = time.time()
+                order_ids, lines = [], []
+                for order_id, (customer, order) in enumerate(orders, self._last_id + 1):
+                    record = dict(order, order_id=order_id, customer=customer,
+                                  created_at=order.get('created_at', now))
+                    order_ids.append(order_id)
+                    lines.append((json.dumps(record) + "\n").encode())
+                data = b"".join(lines)
+                try:
+                    if os.write(self._fd, data) != len(data):
+                        raise OSError("short write to the order log")
+                except OSError:
+                    os.ftruncate(self._fd, self._end)  # don't leave half a batch behind
+                    raise
+            finally:
+                self._unlock_file()
+
+            offset = self._end
+            for (customer, _), line in zip(orders, lines):
+                if self._offsets is not None:
+                    self._offsets.setdefault(customer, []).append(offset)
+                offset += len(line)
+            self._end = offset
+            if order_ids:
+                self._last_id = order_ids[-1]
+            self._unsynced += len(order_ids)
+            if self._unsynced >= self.sync_every:
+                try:
+                    self._sync_locked()
+                except OSError:
+                    pass  # the orders are written; the sync thread tries again
+        return order_ids
+
+    def _sync_locked(self):
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Force pending orders to disk"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.sync_interval):
+            with self._lock:
+                if self._unsynced and time.monotonic() - self._last_sync >= self.sync_interval:
+                    try:
+                        self._sync_locked()
+                    except OSError:
+                        pass  # e.g. a full disk; try again on the next tick
+
+    def _catch_up(self):
+        """Pick up orders appended by other server processes since our last look"""
+        if os.fstat(self._fd).st_size == self._end:
+            return
+        start = self._end
+        self._end, self._last_id = self._recover()
+        if self._offsets is not None:
+            self._index(start, self._end)
+
+    def _scan(self, start: int, end: int) -> Dict[str, List[int]]:
+        """Return customer -> offsets of the complete lines in [start, end)"""
+        offsets: Dict[str, List[int]] = {}
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if offset >= end:
+                    break
+                offsets.setdefault(json.loads(line)['customer'], []).append(offset)
+                offset += len(line)
+        return offsets
+
+    def _index(self, start: int, end: int):
+        for customer, offsets in self._scan(start, end).items():
+            self._offsets.setdefault(customer, []).extend(offsets)
+
+    def _read_at(self, offset: int) -> Dict:
+        data = b""
+        while True:
+            chunk = os.pread(self._fd, 4096, offset + len(data))
+            newline = chunk.find(b"\n")
+            if newline >= 0 or not chunk:
+                return json.loads(data + (chunk[:newline] if newline >= 0 else chunk))
+            data += chunk
+
+    def count_for(self, customer: str) -> int:
+        """Return how many orders a customer has"""
+        self._refresh_index()
+        with self._lock:
+            return len(self._offsets.get(customer, ()))
+
+    def orders_for(self, customer: str, start: int = 0, limit: Optional[int] = None,
+                   newest_first: bool = False) -> List[Dict]:
+        """Return a customer's orders (oldest first unless newest_first), only reading the [start:start+limit] slice"""
+        self._refresh_index()
+        with self._lock:
+            offsets = self._offsets.get(customer, [])
+            total = len(offsets)
+            stop = total if limit is None else min(total, start + limit)
+            if newest_first:
+                page = offsets[max(total - stop, 0):max(total - start, 0)][::-1]
+            else:
+                page = offsets[start:stop]
+        return [self._read_at(offset) for offset in page]
+
+    def _refresh_index(self):
+        if self._offsets is None:
+            self.build_index()
+        with self._lock:
+            self._lock_file()
+            try:
+                self._catch_up()  # indexes whatever other processes appended
+            finally:
+                self._unlock_file()
+
+    def build_index(self):
+        """Index the log by customer, if that hasn't been done yet.
+
+        The scan runs without holding the write lock, so checkouts keep
+        appending meanwhile; the lock is only taken to swap the index in and
+        add the orders written during the scan.
+        """
+        with self._index_lock:
+            if self._offsets is not None:
+                return
+            offsets: Dict[str, List[int]] = {}
+            start = 0
+            while True:
+                with self._lock:
+                    end = self._end
+                if end - start <= _INDEX_UNDER_LOCK:
+                    break
+                # Scan what is there, then go round for what was written during the scan
+                for customer, found in self._scan(start, end).items():
+                    offsets.setdefault(customer, []).extend(found)
+                start = end
+            with self._lock:
+                self._offsets = offsets
+                self._index(start, self._end)
+
+    def build_index_in_background(self):
+        """Start build_index() in a daemon thread, so the first history read doesn't pay for the scan"""
+        threading.Thread(target=self.build_index, name="order-log-index", daemon=True).start()
+        return self
+
+    @property
+    def last_order_id(self) -> int:
+        return self._last_id
+
+    @property
+    def end_offset(self) -> int:
+        """Size of the log as of our last look; an order appended from now on starts at or after it"""
+        return self._end
+
+    def close(self):
+        """Sync pending orders and close the file"""
+        self._closed.set()
+        with self._lock:
+            self._sync_locked()
+            os.close(self._fd)
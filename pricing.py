@@ -0,0 +1,173 @@
+from typing import Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+GST_RATE = 0.1
+
+SIZES = ['small', 'medium', 'big']
+
+# Automatic size discounts: (size, minimum quantity, percent, label).
+# The highest eligible percent is applied to the whole subtotal.
+SIZE_DISCOUNT_RULES = [
+    ('big', 3, 20, "3 big plants"),
+    ('medium', 4, 15, "4 medium plants"),
+    ('small', 5, 10, "5 small plants"),
+]
+
+
+class Quote(NamedTuple):
+    subtotal: float
+    size_discount: float
+    size_discount_percent: int
+    size_discount_label: str
+    coupon_discount: float
+    coupon_percent: float
+    gst: float
+    total: float
+
+
+def best_size_discount(size_counts) -> Tuple[int, str]:
+    """Return (percent, label) of the best size discount for per-size quantities indexed like SIZES"""
+    best_percent, best_label = 0, ""
+    for size, minimum, percent, label in SIZE_DISCOUNT_RULES:
+        if size_counts[SIZES.index(size)] >= minimum and percent > best_percent:
+            best_percent, best_label = percent, label
+    return best_percent, best_label
+
+
+def quote_totals(subtotal: float, size_counts, coupon_percent: float = 0) -> Quote:
+    """Apply the size discount, coupon and GST to a subtotal; O(1) given per-size quantities"""
+    size_percent, size_label = best_size_discount(size_counts)
+    size_discount = subtotal * (size_percent / 100) if size_percent else 0.0
+
+    after_size = subtotal - size_discount
+    coupon_discount = after_size * (coupon_percent / 100) if coupon_percent else 0.0
+    gst = (after_size - coupon_discount) * GST_RATE
+    total = after_size - coupon_discount + gst
+    return Quote(subtotal, size_discount, size_percent, size_label,
+                 coupon_discount, coupon_percent, gst, total)
+
+
+class PricingTable:
+    """Catalog ids, prices and size codes as sorted arrays, built once per catalog version.
+
+    quote() prices a whole cart in one vectorized pass: ids are looked up with
+    searchsorted, sizes are counted with bincount, and discounts and GST follow
+    the same order of operations as the cart page.
+    """
+
+    def __init__(self, ids: Iterable[int], prices: Iterable[float], sizes: Iterable[str]):
+        ids = np.fromiter(ids, dtype=np.int64)
+        prices = np.fromiter(prices, dtype=np.float64)
+        size_codes = np.fromiter((SIZES.index(size) if size in SIZES else -1 for size in sizes), dtype=np.int8)
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.prices = prices[order]
+        self.size_codes = size_codes[order]
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, prices: np.ndarray, size_codes: np.ndarray) -> 'PricingTable':
+        """Build the table from numeric columns (size codes index SIZES)"""
+        table = cls.__new__(cls)
+        order = np.argsort(ids, kind='stable')
+        table.ids = np.asarray(ids, dtype=np.int64)[order]
+        table.prices = np.asarray(prices, dtype=np.float64)[order]
+        table.size_codes = np.asarray(size_codes, dtype=np.int8)[order]
+        return table
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Build the table from any catalog repository"""
+        if hasattr(catalog, 'pricing_columns'):  # columnar catalogs hand over their arrays directly
+            return cls.from_arrays(*catalog.pricing_columns())
+        ids, prices, sizes = [], [], []
+        for plant_id, price, size in catalog.iter_columns('id', 'price', 'size'):
+            ids.append(plant_id)
+            prices.append(price)
+            sizes.append(size)
+        return cls(ids, prices, sizes)
+
+    def rows_for(self, ids: np.ndarray) -> np.ndarray:
+        """Return the table row of each id, -1 for ids not in the catalog"""
+        rows = np.searchsorted(self.ids, ids)
+        rows[rows == len(self.ids)] = 0
+        found = len(self.ids) > 0 and self.ids[rows] == ids
+        return np.where(found, rows, -1)
+
+    def quote(self, ids, quantities, prices=None, coupon_percent: float = 0) -> Quote:
+        """Price a cart given arrays of plant ids and quantities.
+
+        `prices` overrides the catalog prices (the cart keeps the price a plant
+        was added at); ids missing from the catalog are charged but never count
+        towards a size discount.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        rows = self.rows_for(ids)
+        known = rows >= 0
+        if prices is None:
+            if not known.all():
+                raise ValueError(f"Unknown plant ids: {ids[~known].tolist()}")
+            prices = self.prices[rows]
+        line_totals = np.asarray(prices, dtype=np.float64) * quantities
+
+        # accumulate adds left to right, so the subtotal is bit-for-bit the same as a python loop
+        subtotal = float(np.add.accumulate(line_totals)[-1]) if len(line_totals) else 0.0
+
+        size_codes = self.size_codes[rows[known]]
+        sized = size_codes >= 0
+        size_counts = np.bincount(size_codes[sized], weights=quantities[known][sized], minlength=len(SIZES))
+        return quote_totals(subtotal, size_counts, coupon_percent)
+
+
+    def quote_batch(self, lengths, ids, quantities, prices, coupon_percents) -> Quote:
+        """Price many carts at once; every field of the returned Quote is an array with one entry per cart.
+
+        The lines of all carts are concatenated in `ids`, `quantities` and
+        `prices` (NaN = catalog price) and `lengths` gives the number of lines
+        of each cart. Results are identical to calling quote() cart by cart.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        prices = np.array(prices, dtype=np.float64)
+        coupon_percents = np.asarray(coupon_percents, dtype=np.float64)
+        num_carts = len(lengths)
+
+        rows = self.rows_for(ids)
+        known = rows >= 0
+        missing = np.isnan(prices)
+        if (missing & ~known).any():
+            raise ValueError(f"Unknown plant ids: {ids[missing & ~known].tolist()}")
+        prices[missing] = self.prices[rows[missing]]
+        line_totals = prices * quantities
+
+        # Lay the lines out as a (cart, line) grid and add it column by column:
+        # each cart is still summed left to right, exactly like quote()
+        cart_of_line = np.repeat(np.arange(num_carts), lengths)
+        line_in_cart = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        grid = np.zeros((num_carts, int(lengths.max()) if num_carts else 0))
+        grid[cart_of_line, line_in_cart] = line_totals
+        subtotal = np.zeros(num_carts)
+        for column in grid.T:
+            subtotal = subtotal + column
+
+        size_codes = np.where(known, self.size_codes[np.maximum(rows, 0)], -1)
+        sized = size_codes >= 0
+        size_counts = np.zeros((num_carts, len(SIZES)), dtype=np.int64)
+        np.add.at(size_counts, (cart_of_line[sized], size_codes[sized]), quantities[sized])
+
+        size_percent = np.zeros(num_carts, dtype=np.int64)
+        size_label = np.full(num_carts, "", dtype=object)
+        for size, minimum, percent, label in SIZE_DISCOUNT_RULES:
+            better = (size_counts[:, SIZES.index(size)] >= minimum) & (percent > size_percent)
+            size_percent[better] = percent
+            size_label[better] = label
+        size_discount = np.where(size_percent > 0, subtotal * (size_percent / 100), 0.0)
+
+        after_size = subtotal - size_discount
+        coupon_discount = np.where(coupon_percents > 0, after_size * (coupon_percents / 100), 0.0)
+        gst = (after_size - coupon_discount) * GST_RATE
+        total = after_size - coupon_discount + gst
+        return Quote(subtotal, size_discount, size_percent, size_label,
+                     coupon_discount, coupon_percents, gst, total)
@@ -0,0 +1,136 @@
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from facets import iter_positions, mask_to_bits
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-case word tokens"""
+    return _TOKEN.findall(text.lower())
+
+
+@lru_cache(maxsize=65536)
+def _token_set(text: str) -> frozenset:
+    # Names and descriptions repeat a lot across a big catalog, so tokenize each text once
+    return frozenset(tokenize(text))
+
+
+class _Postings:
+    """Inverted index in CSR form: the positions of terms[t] are positions[offsets[t]:offsets[t + 1]].
+
+    Terms are sorted, so every term starting with a prefix sits in one
+    contiguous range found with bisect, and so do their positions.
+    """
+
+    def __init__(self, pairs_terms: array, pairs_positions: array, vocabulary: List[str]):
+        order = sorted(range(len(vocabulary)), key=vocabulary.__getitem__)
+        self.terms = [vocabulary[t] for t in order]
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[order] = np.arange(len(vocabulary))
+
+        term_ids = rank[np.frombuffer(pairs_terms, dtype=np.int64)] if pairs_terms else np.zeros(0, dtype=np.int64)
+        # Stable sort by term keeps each term's positions ascending (they were added in catalog order)
+        by_term = np.argsort(term_ids, kind='stable')
+        self.positions = np.frombuffer(pairs_positions, dtype=np.int64)[by_term] if pairs_positions else by_term
+        self.offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.terms)), out=self.offsets[1:])
+
+    def mark(self, mask: np.ndarray, prefix: str):
+        """Set mask[i] for every position with a term starting with `prefix`"""
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + '\uffff', lo)
+        if lo < hi:
+            mask[self.positions[self.offsets[lo]:self.offsets[hi]]] = True
+
+
+class SearchIndex:
+    """Inverted index over plant names and descriptions, built once per catalog version.
+
+    Every query word is matched as a prefix, so results follow the customer
+    while they type. match() returns two bitsets over catalog positions (the
+    same bit layout as the facet index): plants with every word in their name,
+    and plants with every word anywhere in name or description. Results are
+    ranked name matches first, then description matches, each in catalog order.
+    """
+
+    def __init__(self, texts: Iterable[Tuple[str, str]]):
+        vocabulary: List[str] = []
+        term_ids = {}
+        # (term, position) pairs, kept in compact typed arrays while scanning the catalog
+        name_terms, name_positions, text_terms, text_positions = array('q'), array('q'), array('q'), array('q')
+        position = -1
+        for position, (name, description) in enumerate(texts):
+            name_tokens = _token_set(name)
+            for token in name_tokens | _token_set(description):
+                term = term_ids.get(token)
+                if term is None:
+                    term = term_ids[token] = len(vocabulary)
+                    vocabulary.append(token)
+                text_terms.append(term)
+                text_positions.append(position)
+                if token in name_tokens:
+                    name_terms.append(term)
+                    name_positions.append(position)
+        self.size = position + 1
+        self._name = _Postings(name_terms, name_positions, vocabulary)
+        self._text = _Postings(text_terms, text_positions, vocabulary)
+
+    @classmethod
+    def from_catalog(cls, catalog) -> 'SearchIndex':
+        return cls(catalog.iter_columns('name', 'description'))
+
+    def match(self, query: str) -> Optional[Tuple[int, int]]:
+        """Return (name match bits, name-or-description match bits), or None for an empty query"""
+        words = tokenize(query)
+        if not words:
+            return None
+        in_name = np.ones(self.size, dtype=bool)
+        anywhere = np.ones(self.size, dtype=bool)
+        for word in dict.fromkeys(words):
+            word_mask = np.zeros(self.size, dtype=bool)
+            self._name.mark(word_mask, word)
+            in_name &= word_mask
+            word_mask = np.zeros(self.size, dtype=bool)
+            self._text.mark(word_mask, word)
+            anywhere &= word_mask
+        return mask_to_bits(in_name), mask_to_bits(anywhere)
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[str]:
+        """Return up to `limit` name words starting with `prefix`, for type-ahead hints"""
+        prefix = prefix.lower()
+        lo = bisect_left(self._name.terms, prefix)
+        return [term for term in islice(self._name.terms, lo, lo + limit) if term.startswith(prefix)]
+
+
+def ranked_tiers(matches: Tuple[int, int], filter_bits: int) -> List[int]:
+    """Combine search matches with the facet filter bitset into ranked tiers (name hits, then the rest)"""
+    in_name, anywhere = matches
+    return [filter_bits & in_name, filter_bits & anywhere & ~in_name]
+
+
+def tier_positions(tiers: List[int], start: int = 0, stop: Optional[int] = None) -> List[int]:
+    """Return the [start:stop] slice of the positions of every tier, tier after tier"""
+    positions: List[int] = []
+    for bits in tiers:
+        count = bits.bit_count()
+        if start >= count:
+            start -= count
+            if stop is not None:
+                stop -= count
+            continue
+        take_stop = None if stop is None else min(stop, count)
+        positions.extend(islice(iter_positions(bits), start, take_stop))
+        if stop is not None:
+            stop -= count
+            if stop <= 0:
+                break
+        start = 0
+    return positions
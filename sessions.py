@@ -0,0 +1,275 @@
+"""Server-side session store: carts and customer ids that outlive a Streamlit process.
+
+A browser session is identified by a random token kept in a cookie (see
+app.restore_session). Its state (the customer id its orders are filed under and
+the cart) is saved to a SessionStore, so a restarted server or another
+server process behind the load balancer picks the cart up where it was.
+
+SessionCache sits in front of the store: reads are served from an LRU of
+recently used sessions and writes only mark the entry dirty. A background
+thread writes dirty sessions behind every `flush_interval` seconds (and
+before they are evicted), and sessions idle for longer than `ttl` are
+dropped from the cache and, eventually, from the store.
+"""
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class SessionStore(ABC):
+    """Where session state is kept; state is a JSON-serializable dict"""
+
+    @abstractmethod
+    def load(self, token: str) -> Optional[Tuple[Dict, float]]:
+        """Return (state, last used time), or None for an unknown token"""
+
+    @abstractmethod
+    def save_many(self, sessions: Iterable[Tuple[str, Dict, float]]):
+        """Save (token, state, last used time) records"""
+
+    @abstractmethod
+    def delete(self, token: str):
+        """Forget a session"""
+
+    @abstractmethod
+    def expire(self, idle_before: float) -> int:
+        """Delete the sessions last used before `idle_before`; returns how many went"""
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in a dict: survives Streamlit reruns and reconnects but not a restart (one process only)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[str, float]] = {}
+
+    def load(self, token: str) -> Optional[Tuple[Dict, float]]:
+        with self._lock:
+            record = self._sessions.get(token)
+        return None if record is None else (json.loads(record[0]), record[1])
+
+    def save_many(self, sessions: Iterable[Tuple[str, Dict, float]]):
+        # Stored serialized, so callers can't mutate what was saved
+        records = {token: (json.dumps(state), used) for token, state, used in sessions}
+        with self._lock:
+            self._sessions.update(records)
+
+    def delete(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def expire(self, idle_before: float) -> int:
+        with self._lock:
+            stale = [token for token, (_, used) in self._sessions.items() if used < idle_before]
+            for token in stale:
+                del self._sessions[token]
+        return len(stale)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a SQLite file (WAL mode), shared by every server process on the host"""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, state TEXT NOT NULL, "
+                     "last_used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Session threads and the flush thread each get their own connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable across a process crash
+            self._local.conn = conn
+        return conn
+
+    def load(self, token: str) -> Optional[Tuple[Dict, float]]:
+        row = self._conn().execute("SELECT state, last_used FROM sessions WHERE token = ?", (token,)).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def save_many(self, sessions: Iterable[Tuple[str, Dict, float]]):
+        rows = [(token, json.dumps(state), used) for token, state, used in sessions]
+        if not rows:
+            return
+        conn = self._conn()
+        # One transaction for the whole batch; an older copy never overwrites a newer one
+        with conn:
+            conn.executemany("INSERT INTO sessions (token, state, last_used) VALUES (?, ?, ?) "
+                             "ON CONFLICT(token) DO UPDATE SET state = excluded.state, last_used = excluded.last_used "
+                             "WHERE excluded.last_used >= sessions.last_used", rows)
+
+    def delete(self, token: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def expire(self, idle_before: float) -> int:
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM sessions WHERE last_used < ?", (idle_before,)).rowcount
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_session_store(path: str) -> SessionStore:
+    """':memory:' keeps sessions in this process only; anything else is a SQLite file"""
+    if path == ':memory:':
+        return MemorySessionStore()
+    return SqliteSessionStore(path)
+
+
+class _Entry:
+    __slots__ = ('state', 'last_used', 'saved_used', 'dirty')
+
+    def __init__(self, state: Dict, last_used: float, saved_used: float, dirty: bool):
+        self.state = state
+        self.last_used = last_used
+        self.saved_used = saved_used  # last_used as the store has it
+        self.dirty = dirty
+
+
+class SessionCache:
+    """Write-behind LRU cache in front of a SessionStore.
+
+    get() and put() only touch memory. Dirty sessions are written to the
+    store in one batch every `flush_interval` seconds, and right away when
+    the LRU evicts them (more than `max_sessions` cached). Sessions idle for
+    `ttl` seconds are dropped from the cache and deleted from the store; a
+    session that is only read is written back now and then so the store
+    knows it is still in use.
+    """
+
+    def __init__(self, store: SessionStore, max_sessions: int = 10_000, ttl: float = 30 * 24 * 3600,
+                 flush_interval: float = 2.0, clock=time.time):
+        self.store = store
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._last_expire = 0.0
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._flusher.start()
+
+    def get(self, token: str, refresh: bool = False) -> Optional[Dict]:
+        """Return a session's state, or None if there is no such (live) session.
+
+        refresh=True re-reads the store unless this process holds unsaved
+        changes, for a session that may have been served by another process.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and now - entry.last_used > self.ttl:
+                del self._entries[token]
+                entry = None
+            if entry is not None and (entry.dirty or not refresh):
+                entry.last_used = now
+                self._entries.move_to_end(token)
+                return entry.state
+        record = self.store.load(token)
+        if record is None or now - record[1] > self.ttl:
+            return None  # an expired row the store hasn't deleted yet counts as gone
+        state, used = record
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry.dirty:
+                return entry.state  # put() got in while we were reading
+            self._entries[token] = _Entry(state, now, used, False)
+            self._entries.move_to_end(token)
+            evicted = self._evict_locked()
+        self._write(evicted)
+        return state
+
+    def put(self, token: str, state: Dict):
+        """Record a session's new state; it reaches the store on the next flush"""
+        with self._lock:
+            now = self.clock()
+            self._entries[token] = _Entry(state, now, now, True)
+            self._entries.move_to_end(token)
+            evicted = self._evict_locked()
+        self._write(evicted)
+
+    def delete(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+        self.store.delete(token)
+
+    def _unsaved(self, entry: _Entry) -> bool:
+        # Changed, or read often enough since it was saved that the store could expire it
+        return entry.dirty or entry.last_used - entry.saved_used > self.ttl / 2
+
+    def _evict_locked(self):
+        """Pop the least recently used sessions over the limit; returns the unsaved ones to write"""
+        evicted = []
+        while len(self._entries) > self.max_sessions:
+            token, entry = self._entries.popitem(last=False)
+            if self._unsaved(entry):
+                evicted.append((token, entry.state, entry.last_used))
+        return evicted
+
+    def _write(self, records):
+        if records:
+            self.store.save_many(records)
+
+    def flush(self):
+        """Write every unsaved session to the store now, and drop the idle ones"""
+        now = self.clock()
+        with self._lock:
+            dirty = []
+            for token, entry in list(self._entries.items()):
+                if self._unsaved(entry):
+                    dirty.append((token, entry.state, entry.last_used))
+                    entry.dirty = False
+                    entry.saved_used = entry.last_used
+                elif now - entry.last_used > self.ttl:
+                    del self._entries[token]
+        try:
+            self._write(dirty)
+        except sqlite3.Error:
+            # Keep them dirty and try again on the next flush
+            with self._lock:
+                for token, _, _ in dirty:
+                    entry = self._entries.get(token)
+                    if entry is not None:
+                        entry.dirty = True
+            raise
+        # Expiring is a range delete on the last_used index; once a minute is plenty
+        if now - self._last_expire >= 60:
+            self._last_expire = now
+            self.store.expire(now - self.ttl)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # e.g. the database is locked for longer than the busy timeout
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        """Write everything pending and stop the flush thread"""
+        self._closed.set()
+        self.flush()
+        self.store.close()
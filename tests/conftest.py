@@ -0,0 +1,30 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The shop's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLANTS = [
+    {'id': 1, 'name': "Sunflower", 'description': "Bright flowers", 'price': 33.5, 'size': 'big',
+     'color': 'yellow', 'image': "https://example.com/1.jpg", 'stock': 25},
+    {'id': 2, 'name': "Rose Bush", 'description': "Classic red roses", 'price': 24.9, 'size': 'medium',
+     'color': 'red', 'image': "https://example.com/2.jpg"},
+    {'id': 3, 'name': "Lavender", 'description': "Fragrant purple spikes", 'price': 12.75, 'size': 'small',
+     'color': 'purple', 'image': "https://example.com/3.jpg", 'stock': 3},
+]
+
+
+def write_catalog(path, plants):
+    with open(path, 'w') as f:
+        json.dump({'plants': plants}, f)
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    """A small plants_data.json style catalog"""
+    path = tmp_path / 'plants_data.json'
+    write_catalog(path, PLANTS)
+    return str(path)
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from analytics import SalesAnalytics, SalesTotals
+from pricing import quote_totals
+
+
+def make_order(order_id, quantities=(('small', 12.75, 1),), coupon=("NIL", 0)):
+    """An order log record priced the way the checkout prices it"""
+    items, size_counts, subtotal = {}, [0, 0, 0], 0.0
+    for plant_id, (size, price, quantity) in enumerate(quantities, start=1):
+        items[str(plant_id)] = {'name': f"Plant {plant_id}", 'price': price, 'quantity': quantity, 'size': size}
+        size_counts[['small', 'medium', 'big'].index(size)] += quantity
+        subtotal += price * quantity
+    quote = quote_totals(subtotal, size_counts, coupon[1])
+    return {'items': items, 'subtotal': quote.subtotal, 'GST': quote.gst, 'final_total': quote.total,
+            'Coupon': coupon[0], 'coupon_discount': quote.coupon_discount, 'order_id': order_id}
+
+
+def write_log(path, orders, mode='w'):
+    with open(path, mode) as f:
+        for order in orders:
+            f.write(json.dumps(order) + "\n")
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / 'orders.log'
+    write_log(path, [make_order(order_id) for order_id in range(1, 6)])
+    return str(path)
+
+
+def test_coupon_is_credited_with_its_own_discount_only():
+    # Five small plants earn a size discount on top of the coupon
+    order = make_order(1, [('small', 10.0, 5)], ("SAVE10", 10))
+    totals = SalesTotals()
+    totals.add(order)
+    [(code, orders, discount, _)] = totals.top_coupons(5)
+    assert (code, orders) == ("SAVE10", 1)
+    assert discount == pytest.approx(order['coupon_discount'])
+    assert discount < totals.discount
+
+    # Orders logged before coupon_discount existed get the same figure
+    del order['coupon_discount']
+    old = SalesTotals()
+    old.add(order)
+    assert old.top_coupons(5)[0][2] == pytest.approx(discount)
+
+
+def test_restart_continues_from_the_checkpoint(log_path, tmp_path):
+    checkpoint = str(tmp_path / 'orders.log.analytics')
+    assert SalesAnalytics(log_path, checkpoint, checkpoint_every=1).refresh() == 5
+    write_log(log_path, [make_order(6), make_order(7)], mode='a')
+
+    restarted = SalesAnalytics(log_path, checkpoint)
+    assert restarted.totals.orders == 5
+    assert restarted.refresh() == 2  # only the orders appended since
+    assert restarted.totals.orders == 7
+
+
+def test_partly_written_order_waits_for_the_next_refresh(log_path):
+    analytics = SalesAnalytics(log_path)
+    analytics.refresh()
+    line = json.dumps(make_order(6)) + "\n"
+    with open(log_path, 'a') as f:
+        f.write(line[:10])
+    assert analytics.refresh() == 0
+    with open(log_path, 'a') as f:
+        f.write(line[10:])
+    assert analytics.refresh() == 1
+    assert analytics.totals.orders == 6
+
+
+def test_shorter_log_starts_over(log_path, tmp_path):
+    checkpoint = str(tmp_path / 'orders.log.analytics')
+    analytics = SalesAnalytics(log_path, checkpoint, checkpoint_every=1)
+    analytics.refresh()
+    write_log(log_path, [make_order(1)])
+
+    assert analytics.refresh() == 1
+    assert analytics.totals.orders == 1
+    restarted = SalesAnalytics(log_path, checkpoint)  # the checkpoint now covers the new log
+    assert restarted.totals.orders == 1
+    assert restarted.refresh() == 0
+
+
+def test_checkpoint_of_a_different_log_is_ignored(log_path, tmp_path):
+    checkpoint = str(tmp_path / 'orders.log.analytics')
+    SalesAnalytics(log_path, checkpoint, checkpoint_every=1).refresh()
+    # Same length, but the order the checkpoint ended on is no longer there
+    write_log(log_path, [make_order(order_id) for order_id in range(5, 10)])
+
+    replaced = SalesAnalytics(log_path, checkpoint)
+    assert replaced.totals.orders == 0
+    assert replaced.refresh() == 5
+
+
+def test_coupon_codes_are_counted_whatever_their_case():
+    totals = SalesTotals()
+    for order_id, code in enumerate(["welcome10", "Welcome10", "WELCOME10"], start=1):
+        totals.add(make_order(order_id, coupon=(code, 10)))
+    [(code, orders, _, _)] = totals.top_coupons(5)
+    assert (code, orders) == ("WELCOME10", 3)
@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+import batch_quote
+from catalog import open_catalog
+from pricing import PricingTable
+
+
+@pytest.fixture
+def worker(catalog_path):
+    """Set up this process the way the pool sets up each worker"""
+    batch_quote._init_worker(catalog_path, {'WELCOME10': 10}, False)
+
+
+def test_quote_carts_matches_the_pricing_table(catalog_path):
+    table = PricingTable.from_catalog(open_catalog(catalog_path))
+    carts = [{'cart_id': 'a', 'items': {'1': {'quantity': 2, 'price': 33.5}, '3': {'quantity': 1}},
+              'coupon': 'welcome10'}]
+    [record] = batch_quote.quote_carts(carts, table, {'WELCOME10': 10})
+    quote = table.quote([1, 3], [2, 1], [33.5, 12.75], coupon_percent=10)
+    assert record['cart_id'] == 'a'
+    assert record['total'] == quote.total
+    assert record['coupon'] == 'WELCOME10'
+
+
+@pytest.mark.parametrize('line, error', [
+    ('{"cart_id": ', "Invalid JSON"),
+    ('5', "not int"),
+    ('[{"id": 1, "quantity": 1}]', "not list"),
+    ('"cart"', "not str"),
+    ('null', "not NoneType"),
+])
+def test_malformed_line_gets_an_error_record(worker, line, error):
+    good = json.dumps({'cart_id': 'ok', 'items': [{'id': 2, 'quantity': 1}]})
+    records = [json.loads(out) for out in batch_quote._quote_chunk([good, line, good])]
+    assert [record['cart_id'] for record in records] == ['ok', None, 'ok']
+    assert error in records[1]['error']
+    assert 'error' not in records[0] and 'error' not in records[2]
+
+
+def test_malformed_cart_fields(worker):
+    lines = [json.dumps(cart) for cart in [
+        {'cart_id': 'qty', 'items': {'1': {'quantity': 'many'}}},
+        {'cart_id': 'line', 'items': [5]},
+        {'cart_id': 'unknown', 'items': {'99': {'quantity': 1}}},
+    ]]
+    records = [json.loads(out) for out in batch_quote._quote_chunk(lines)]
+    assert [record['cart_id'] for record in records] == ['qty', 'line', 'unknown']
+    assert all('error' in record for record in records)
+    assert "Unknown plant ids: [99]" in records[2]['error']
+
+
+def test_run_keeps_going_past_bad_lines(catalog_path):
+    lines = ['5', '{"cart_id": "a", "items": {"1": {"quantity": 1}}}', '[1, 2]', '', 'not json']
+    output = io.StringIO()
+    count = batch_quote.run(io.StringIO("\n".join(lines) + "\n"), output, catalog_path, {}, workers=1, chunk_size=2)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == 4  # blank lines are skipped
+    assert [('error' in record) for record in records] == [True, False, True, True]
+    assert records[1]['subtotal'] == 33.5
@@ -0,0 +1,68 @@
+import random
+from fractions import Fraction
+
+import pytest
+
+from cart import Cart
+from pricing import SIZES, PricingTable, quote_totals
+
+LINES = [(81.84, 3, 'big'), (9.39, 1, 'small'), (55.03, 7, 'medium'), (79.38, 1, 'small')]
+MONEY_FIELDS = ['subtotal', 'size_discount', 'coupon_discount', 'gst', 'total']
+
+
+def cents(quote):
+    return {field: round(getattr(quote, field), 2) for field in MONEY_FIELDS}
+
+
+def table_quote(cart, coupon_percent):
+    """What the vectorized pricing path charges for the same lines"""
+    ids = [plant_id for plant_id, _ in cart.items()]
+    table = PricingTable(ids, [line.price for _, line in cart.items()], [line.size for _, line in cart.items()])
+    return table.quote(ids, [line.quantity for _, line in cart.items()], coupon_percent=coupon_percent)
+
+
+def test_cart_page_and_pricing_table_agree_to_the_cent():
+    cart = Cart()
+    for plant_id, (price, quantity, size) in enumerate(LINES, 1):
+        cart.add(plant_id, f"plant {plant_id}", price, size, quantity)
+    assert cents(quote_totals(cart.subtotal, cart.size_counts, 10)) == cents(table_quote(cart, 10))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_running_totals_agree_to_the_cent_after_random_edits(seed):
+    rng = random.Random(seed)
+    cart = Cart()
+    for _ in range(300):
+        plant_id = rng.randint(1, 40)
+        action = rng.random()
+        if plant_id not in cart or action < 0.4:
+            cart.add(plant_id, f"plant {plant_id}", rng.randint(1, 99999) / 100, rng.choice(SIZES), rng.randint(1, 4))
+        elif action < 0.8:
+            cart.set_quantity(plant_id, rng.randint(0, 6))
+        else:
+            cart.remove(plant_id)
+    if len(cart):
+        coupon_percent = rng.choice([0, 5, 10, 15])
+        assert cents(quote_totals(cart.subtotal, cart.size_counts, coupon_percent)) == \
+            cents(table_quote(cart, coupon_percent))
+    assert cart.item_count == sum(line.quantity for _, line in cart.items())
+
+
+def test_subtotal_never_drifts():
+    cart = Cart()
+    for plant_id, (price, quantity, size) in enumerate(LINES, 1):
+        cart.add(plant_id, f"plant {plant_id}", price, size, quantity)
+    for _ in range(1000):
+        cart.set_quantity(2, 5)
+        cart.set_quantity(2, 1)
+    cart.set_quantity(1, 5)
+    cart.add(2, "plant 2", 9.39, 'small')
+    cart.remove(3)
+    cart.add(3, "plant 3", 55.03, 'medium', 2)
+    exact = sum(Fraction(line['price']) * line['quantity'] for line in cart.to_dict().values())
+    assert cart.subtotal == float(exact)
+    assert cart.item_count == 5 + 2 + 1 + 2
+    assert Cart.from_state(cart.to_state()).subtotal == cart.subtotal
+    for plant_id in list(cart.to_dict()):
+        cart.remove(plant_id)
+    assert cart.subtotal == 0.0
@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+
+import catalog
+from catalog import CatalogStore
+from conftest import PLANTS, write_catalog
+
+
+def touch(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def store(catalog_path):
+    store = CatalogStore(catalog_path, poll_interval=3600)  # the tests call reload() themselves
+    yield store
+    store.close()
+
+
+def test_reload_swaps_in_a_changed_file(store, catalog_path):
+    assert store.reload() is False
+    write_catalog(catalog_path, PLANTS + [dict(PLANTS[0], id=4, name="Daisy")])
+    touch(catalog_path, 10**18)
+    assert store.reload() is True
+    assert store.version == 2
+    assert store.current().catalog.get_many([4])[4]['name'] == "Daisy"
+
+
+def test_failed_build_is_not_retried_until_the_file_changes(store, catalog_path, monkeypatch):
+    builds = []
+    open_catalog = catalog.open_catalog
+    monkeypatch.setattr(catalog, 'open_catalog', lambda path: builds.append(path) or open_catalog(path))
+    with open(catalog_path, 'w') as f:
+        f.write('{"plants": [{"id": 1,')
+    touch(catalog_path, 10**18)
+
+    assert store.reload() is False
+    assert store.last_error
+    assert store.reload() is False
+    assert store.reload() is False
+    assert len(builds) == 1  # the broken file was parsed once
+    assert store.version == 1  # readers keep the last good catalog
+
+    write_catalog(catalog_path, PLANTS)
+    touch(catalog_path, 2 * 10**18)
+    assert store.reload() is True
+    assert len(builds) == 2
+    assert store.last_error is None
+    assert store.version == 2
+
+
+def test_missing_file_keeps_the_current_snapshot(store, catalog_path):
+    os.remove(catalog_path)
+    assert store.reload() is False
+    assert store.last_error
+    write_catalog(catalog_path, PLANTS)
+    touch(catalog_path, 10**18)
+    assert store.reload() is True
+
+
+def test_watcher_survives_an_unexpected_error(catalog_path, monkeypatch):
+    store = CatalogStore(catalog_path, poll_interval=0.01)
+    open_catalog = catalog.open_catalog
+
+    def broken(path):
+        raise IndexError("bytearray index out of range")  # not one of the usual parse errors
+
+    monkeypatch.setattr(catalog, 'open_catalog', broken)
+    touch(catalog_path, 10**18)
+    deadline = time.monotonic() + 5
+    while store.last_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.last_error == "bytearray index out of range"
+
+    monkeypatch.setattr(catalog, 'open_catalog', open_catalog)
+    write_catalog(catalog_path, PLANTS + [dict(PLANTS[0], id=4, name="Daisy")])
+    touch(catalog_path, 2 * 10**18)
+    while store.version == 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.version == 2  # the watcher kept polling
+    store.close()
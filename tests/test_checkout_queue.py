@@ -0,0 +1,146 @@
+import atexit
+import json
+import os
+import threading
+
+import pytest
+
+from checkout_queue import CheckoutOrder, CheckoutQueue, CheckoutQueueFull, CheckoutSpool
+from orders import OrderLog
+
+ORDER = {'items': {'1': {'name': "Sunflower", 'price': 33.5, 'quantity': 2, 'size': 'big'}},
+         'subtotal': 67.0, 'GST': 6.7, 'final_total': 73.7, 'Coupon': "NIL", 'Discount': "NIL"}
+
+
+@pytest.fixture
+def order_log(tmp_path):
+    log = OrderLog(str(tmp_path / 'orders.log'))
+    yield log
+    log.close()
+
+
+def failing(order_log, monkeypatch, failures):
+    """Make the first `failures` append_many calls raise OSError"""
+    append_many = order_log.append_many
+    calls = []
+
+    def flaky(orders):
+        calls.append(len(orders))
+        if len(calls) <= failures:
+            raise OSError("disk full")
+        return append_many(orders)
+
+    monkeypatch.setattr(order_log, 'append_many', flaky)
+    return calls
+
+
+def test_write_is_retried_until_it_succeeds(order_log, monkeypatch):
+    calls = failing(order_log, monkeypatch, 2)
+    written = []
+    queue = CheckoutQueue(order_log, workers=1, retry_delay=0.001,
+                          hooks=[lambda order_id, snapshot: written.append(order_id)])
+    queue.submit('alice', ORDER)
+    queue.join()
+    assert len(calls) == 3
+    assert queue.stats()['retries'] == 2 and queue.written == 1 and queue.failed == 0
+    assert written == [1]
+    assert order_log.orders_for('alice')[0]['final_total'] == 73.7
+    assert queue.pending_for('alice') == 0
+    queue.close()
+
+
+def test_order_that_never_writes_is_handed_to_on_failed(order_log, monkeypatch):
+    failing(order_log, monkeypatch, 100)
+    failed = []
+    queue = CheckoutQueue(order_log, workers=1, max_retries=3, retry_delay=0.001,
+                          on_failed=lambda snapshot, error: failed.append((snapshot, error)))
+    snapshot = queue.submit('alice', ORDER, stock={1: 25, 7: -1})
+    queue.join()
+    assert queue.failed == 1 and queue.written == 0
+    [(failed_snapshot, error)] = failed
+    assert failed_snapshot == snapshot
+    assert dict(failed_snapshot.stock) == {1: 25, 7: -1}  # what the units were reserved against
+    assert isinstance(error, OSError)
+    assert queue.pending_for('alice') == 0
+    queue.close()
+
+
+def test_failing_hook_is_counted_and_the_worker_keeps_going(order_log):
+    def hook(order_id, snapshot):
+        raise RuntimeError("mail server down")
+
+    queue = CheckoutQueue(order_log, workers=1, max_retries=2, retry_delay=0.001, hooks=[hook])
+    for _ in range(3):
+        queue.submit('bob', ORDER)
+    queue.join()
+    assert queue.written == 3
+    assert queue.hook_errors == 3
+    assert order_log.count_for('bob') == 3
+    queue.close()
+
+
+def test_full_queue_refuses_the_order(order_log, monkeypatch):
+    release = threading.Event()
+    append_many = order_log.append_many
+    monkeypatch.setattr(order_log, 'append_many', lambda orders: release.wait() and append_many(orders))
+    queue = CheckoutQueue(order_log, workers=1, max_pending=1, batch_size=1, submit_timeout=0.05)
+    queue.submit('carol', ORDER)  # taken by the worker, which blocks
+    while queue.depth():
+        pass
+    queue.submit('carol', ORDER)  # fills the queue
+    with pytest.raises(CheckoutQueueFull):
+        queue.submit('carol', ORDER)
+    assert queue.pending_for('carol') == 2
+    release.set()
+    queue.join()
+    assert order_log.count_for('carol') == 2
+    queue.close()
+
+
+def test_spool_is_emptied_and_compacted(tmp_path):
+    spool = CheckoutSpool(str(tmp_path / 'spool'), compact_bytes=1)
+    snapshots = [CheckoutOrder(f"id{i}", 'dave', '{}', float(i), ((1, 5),)) for i in range(3)]
+    for snapshot in snapshots:
+        spool.add(snapshot, 0)
+    spool.done(['id0', 'id2'])  # over compact_bytes: rewritten with just id1
+    assert [snapshot for snapshot, _ in CheckoutSpool._read(spool.path)] == [snapshots[1]]
+    spool.done(['id1'])
+    assert os.path.getsize(spool.path) == 0
+    spool.close()
+    assert os.listdir(tmp_path / 'spool') == []
+
+
+def test_orders_left_by_a_dead_process_are_written_once(tmp_path, order_log, monkeypatch):
+    spool_dir = str(tmp_path / 'spool')
+    stuck, never = threading.Event(), threading.Event()
+    monkeypatch.setattr(order_log, 'append_many', lambda orders: stuck.set() or never.wait())  # never writes
+    crashed = CheckoutQueue(order_log, workers=1, batch_size=1, spool_dir=spool_dir)
+    submitted = [crashed.submit(customer, ORDER, stock={1: 25}) for customer in ('erin', 'frank', 'erin')]
+    assert stuck.wait(5)
+    # The second order reached the order log just before the crash, but wasn't crossed off the spool
+    monkeypatch.undo()
+    order_log.append('frank', dict(ORDER, checkout_id=submitted[1].checkout_id))
+    os.close(crashed.spool._lock_fd)  # the process dies: its spool lock goes with it
+    atexit.unregister(crashed.close)  # and never drains its queue
+
+    restarted = CheckoutQueue(OrderLog(order_log.path), workers=1, spool_dir=spool_dir)
+    assert restarted.replayed == 2
+    restarted.join()
+    assert restarted.order_log.count_for('erin') == 2
+    assert restarted.order_log.count_for('frank') == 1
+    checkout_ids = {order['checkout_id'] for customer in ('erin', 'frank')
+                    for order in restarted.order_log.orders_for(customer)}
+    assert checkout_ids == {snapshot.checkout_id for snapshot in submitted}
+    restarted.close()
+    assert os.listdir(spool_dir) == []
+
+
+def test_a_live_process_keeps_its_spool(tmp_path, order_log):
+    spool_dir = str(tmp_path / 'spool')
+    running = CheckoutSpool(spool_dir)
+    running.add(CheckoutOrder('id', 'gina', json.dumps(ORDER), 0.0), 0)
+    queue = CheckoutQueue(order_log, workers=1, spool_dir=spool_dir)
+    assert queue.replayed == 0
+    assert os.path.exists(running.path)
+    queue.close()
+    running.close()
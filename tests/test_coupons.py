@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+import coupons
+from coupons import CouponTable
+
+
+def write_coupons(path, percents, mtime_ns):
+    with open(path, 'w') as f:
+        json.dump({'coupons': {code: {'discount_percent': percent, 'description': f"{percent}% off"}
+                               for code, percent in percents.items()}}, f)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'coupons.json')
+    write_coupons(path, {'WELCOME10': 10}, 10**18)
+    return path
+
+
+def test_codes_match_whatever_their_case(path):
+    assert CouponTable(path).snapshot().percent('welcome10') == 10
+
+
+def test_edit_is_picked_up(path):
+    table = CouponTable(path, check_interval=0)
+    write_coupons(path, {'WELCOME10': 10, 'SPRING20': 20}, 2 * 10**18)
+    assert table.rates() == {'WELCOME10': 10, 'SPRING20': 20}
+    assert table.reloads == 1
+
+
+def test_broken_file_is_parsed_once_until_it_changes(path, monkeypatch):
+    parses = []
+    parse_coupons = coupons.parse_coupons
+    monkeypatch.setattr(coupons, 'parse_coupons', lambda data: parses.append(data) or parse_coupons(data))
+    table = CouponTable(path, check_interval=0)
+    parses.clear()
+    with open(path, 'w') as f:
+        f.write('{"coupons": {"SPRING20": ')
+    os.utime(path, ns=(2 * 10**18, 2 * 10**18))
+
+    for _ in range(3):
+        assert table.rates() == {'WELCOME10': 10}  # the last good table stays live
+    assert len(parses) == 1
+    assert table.last_error
+
+    write_coupons(path, {'SPRING20': 20}, 3 * 10**18)
+    assert table.rates() == {'SPRING20': 20}
+    assert table.last_error is None
@@ -0,0 +1,25 @@
+from facets import FacetIndex, FacetIndexBuilder, iter_positions
+
+
+def plant(color, size='small'):
+    return {'color': color, 'size': size}
+
+
+def test_value_returning_after_a_long_gap():
+    # 'blue' gets a small bitmap at position 0 and comes back thousands of plants later
+    plants = [plant('blue')] + [plant('red')] * 2000 + [plant('blue')]
+    index = FacetIndex(plants)
+    assert list(iter_positions(index.bitsets['color']['blue'])) == [0, 2001]
+    assert index.counts('color', {}) == {'blue': 2, 'red': 2000}
+
+
+def test_builder_matches_a_catalog_grouped_by_value():
+    plants = [plant(color, size) for color, size in
+              [('red', 'big')] * 700 + [('green', 'small')] * 900 + [('red', 'medium')] * 3]
+    builder = FacetIndexBuilder()
+    for p in plants:
+        builder.add(p)
+    index = builder.build()
+    assert index.size == len(plants)
+    assert index.match({'color': ['red']}).bit_count() == 703
+    assert index.match({'color': ['red'], 'size': ['medium']}) == ((1 << 3) - 1) << 1600
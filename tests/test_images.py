@@ -0,0 +1,92 @@
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from images import ThumbnailCache
+
+
+def png(color='green', size=(400, 300)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, format='PNG')
+    return out.getvalue()
+
+
+class Source:
+    """Stands in for the image hosts: counts fetches and can be held until released"""
+
+    def __init__(self, data=None):
+        self.data = data or png()
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, url):
+        self.calls.append(url)
+        self.release.wait(5)
+        if url.endswith('missing.png'):
+            raise OSError("404")
+        return self.data
+
+
+@pytest.fixture
+def source():
+    return Source()
+
+
+@pytest.fixture
+def cache(tmp_path, source):
+    cache = ThumbnailCache(str(tmp_path / 'thumbnails'), size=(50, 50), fetch=source)
+    yield cache
+    cache.close()
+
+
+def test_miss_is_built_in_the_background_then_hits(cache, source):
+    source.release.clear()
+    assert cache.get('http://img/a.png') is None  # returns straight away: the page shows the URL
+    assert cache.stats()['pending'] == 1
+    source.release.set()
+    cache.join()
+
+    thumbnail = cache.get('http://img/a.png')
+    assert Image.open(io.BytesIO(thumbnail)).size == (50, 50)
+    assert cache.get('http://img/a.png') is thumbnail
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['fetches'], stats['pending']) == (2, 1, 1, 0)
+    assert os.path.exists(cache.path_for('http://img/a.png'))
+
+
+def test_image_asked_for_by_many_sessions_is_fetched_once(cache, source):
+    source.release.clear()
+    for _ in range(5):
+        assert cache.get('http://img/a.png') is None
+    source.release.set()
+    cache.join()
+    assert source.calls == ['http://img/a.png']
+
+
+def test_thumbnail_on_disk_is_served_without_fetching(tmp_path, cache, source):
+    cache.get('http://img/a.png')
+    cache.join()
+    restarted = ThumbnailCache(cache.cache_dir, size=(50, 50), fetch=source)
+    assert restarted.get('http://img/a.png') is not None
+    assert restarted.stats()['fetches'] == 0
+    restarted.close()
+
+
+def test_failed_fetch_is_not_retried_straight_away(cache, source):
+    assert cache.get('http://img/missing.png') is None
+    cache.join()
+    assert cache.get('http://img/missing.png') is None
+    cache.join()
+    assert source.calls == ['http://img/missing.png']
+
+
+def test_failed_write_still_serves_the_thumbnail(cache, monkeypatch):
+    monkeypatch.setattr(os, 'replace', lambda src, dst: (_ for _ in ()).throw(OSError("disk full")))
+    cache.get('http://img/a.png')
+    cache.join()
+    assert cache.get('http://img/a.png') is not None
+    assert os.listdir(cache.cache_dir) == []  # no temp file left behind
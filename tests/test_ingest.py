@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from conftest import PLANTS, write_catalog
+from ingest import UNTRACKED_STOCK, CatalogIngest, IngestError, load_plants, normalize_plant
+
+
+def test_load_plants_indexes_a_catalog_sorted_by_color(tmp_path):
+    plants = [dict(PLANTS[1], id=i, color='red') for i in range(1, 3000)] + [dict(PLANTS[0], id=3000)]
+    plants.insert(0, dict(PLANTS[0], id=0))  # 'yellow' comes back after a long run of 'red'
+    path = tmp_path / 'plants_data.json'
+    write_catalog(path, plants)
+    loaded, index = load_plants(str(path))
+    assert len(loaded) == 3001
+    assert index.counts('color', {}) == {'red': 2999, 'yellow': 2}
+
+
+def test_missing_stock_is_untracked(catalog_path):
+    plants, _ = load_plants(catalog_path)
+    assert [plant['stock'] for plant in plants] == [25, UNTRACKED_STOCK, 3]
+
+
+def test_sloppy_values_are_normalized():
+    plant = normalize_plant(dict(PLANTS[0], id="7", price="$4.50", size=" Big ", color=" Yellow ", stock=2.0))
+    assert (plant['id'], plant['price'], plant['size'], plant['color'], plant['stock']) == (7, 4.5, 'big', 'yellow', 2)
+
+
+def test_bad_records_are_reported_with_their_line(tmp_path):
+    path = tmp_path / 'plants_data.json'
+    records = [PLANTS[0], dict(PLANTS[1], size='huge'), dict(PLANTS[2], price=-1), dict(PLANTS[2], id=1), PLANTS[2]]
+    # One record per line, after the opening '{"plants": [' line
+    path.write_text('{"plants": [\n' + ",\n".join(json.dumps(record) for record in records) + "\n]}\n")
+
+    ingest = CatalogIngest(str(path))
+    assert [plant['id'] for plant in ingest] == [1, 3]
+    assert ingest.errors == ["line 3: size must be one of small, medium, big, got 'huge'",
+                             "line 4: price must be a non-negative number, got -1",
+                             "line 5: duplicate id 1"]
+    with pytest.raises(IngestError) as raised:
+        ingest.check()
+    assert raised.value.total == 3
+
+
+def test_broken_json_is_reported_with_its_line(tmp_path):
+    path = tmp_path / 'plants_data.json'
+    path.write_text('{"plants": [\n' + json.dumps(PLANTS[0]) + ',\n{"id": 2,\n"name": }\n]}\n')
+    with pytest.raises(IngestError) as raised:
+        load_plants(str(path))
+    assert raised.value.errors[0].startswith("line 4: invalid JSON")
+
+
+def test_records_split_across_chunks(tmp_path):
+    path = tmp_path / 'plants_data.json'
+    write_catalog(path, PLANTS)
+    plants = list(CatalogIngest(str(path), chunk_chars=7))
+    assert [plant['name'] for plant in plants] == [plant['name'] for plant in PLANTS]
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from inventory import MemoryInventory, OutOfStock, SqliteInventory, open_inventory
+
+STOCK = {plant_id: 10 for plant_id in range(1, 41)}
+STOCK[41] = -1  # untracked
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'sharded'])
+def inventory(request, tmp_path):
+    if request.param == 'memory':
+        inventory = MemoryInventory()
+    else:
+        inventory = SqliteInventory(str(tmp_path / 'inventory.db'), shards=1 if request.param == 'sqlite' else 8)
+    yield inventory
+    inventory.close()
+
+
+def test_reservation_is_all_or_nothing(inventory):
+    inventory.reserve({1: 4, 2: 10, 41: 100}, STOCK)
+    with pytest.raises(OutOfStock) as shortage:
+        inventory.reserve({3: 1, 1: 7, 2: 1}, STOCK)
+    assert shortage.value.shortages == {1: 6, 2: 0}
+    assert inventory.sold_many([1, 2, 3, 41]) == {1: 4, 2: 10, 3: 0, 41: 0}
+    inventory.release({1: 4, 2: 10}, STOCK)
+    assert inventory.sold_many([1, 2]) == {1: 0, 2: 0}
+
+
+def test_concurrent_checkouts_never_oversell(inventory):
+    def buyer(seed):
+        for i in range(50):
+            try:
+                inventory.reserve({1 + (seed + i) % 40: 1, 1 + (seed * 7 + i) % 40: 2}, STOCK)
+            except OutOfStock:
+                pass
+
+    threads = [threading.Thread(target=buyer, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sold = inventory.sold_many(range(1, 41))
+    assert all(units <= 10 for units in sold.values())
+    assert sum(sold.values()) > 0
+
+
+def test_sharded_inventory_adopts_a_single_file(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    single = SqliteInventory(path)
+    single.reserve({1: 3, 2: 5}, STOCK)
+    single.close()
+
+    sharded = open_inventory(path, shards=4)
+    assert sharded.sold_many([1, 2, 3]) == {1: 3, 2: 5, 3: 0}
+    sharded.close()
+    assert (tmp_path / 'inventory.db.migrated').exists()
+    reopened = open_inventory(path, shards=4)
+    assert reopened.sold_many([1, 2]) == {1: 3, 2: 5}  # adopted once, not again
+    reopened.close()
+    with pytest.raises(ValueError):
+        SqliteInventory(path, shards=8)
+    with pytest.raises(ValueError):
+        SqliteInventory(path)
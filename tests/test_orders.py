@@ -0,0 +1,42 @@
+import threading
+
+import orders
+from orders import OrderLog
+
+
+def test_orders_written_during_the_index_scan_are_indexed(tmp_path, monkeypatch):
+    monkeypatch.setattr(orders, '_INDEX_UNDER_LOCK', 0)  # scan even this small log without the lock
+    log = OrderLog(str(tmp_path / 'orders.log'))
+    for i in range(5):
+        log.append('alice' if i % 2 else 'bob', {'n': i})
+    scan = log._scan
+    scanning = threading.Event()
+
+    def slow_scan(start, end):
+        # A checkout during the scan must not wait for it
+        if not scanning.is_set():
+            scanning.set()
+            writer = threading.Thread(target=log.append, args=('alice', {'n': 5}))
+            writer.start()
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        return scan(start, end)
+
+    log._scan = slow_scan
+    assert log.count_for('alice') == 3
+    assert [order['n'] for order in log.orders_for('alice')] == [1, 3, 5]
+    assert [order['n'] for order in log.orders_for('bob', newest_first=True)] == [4, 2, 0]
+    log.append('bob', {'n': 6})
+    assert log.count_for('bob') == 4
+    log.close()
+
+
+def test_index_picks_up_other_writers(tmp_path):
+    path = str(tmp_path / 'orders.log')
+    reader, writer = OrderLog(path), OrderLog(path)
+    reader.build_index_in_background()
+    writer.append('carol', {'n': 1})
+    assert reader.count_for('carol') == 1
+    assert reader.orders_for('carol')[0]['order_id'] == 1
+    reader.close()
+    writer.close()
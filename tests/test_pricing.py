@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+import pytest
+
+from pricing import PricingTable, quote_totals
+
+CATALOG = [  # (id, price, size)
+    (1, 81.84, 'big'), (2, 55.03, 'medium'), (3, 9.39, 'small'),
+    (4, 79.38, 'big'), (5, 12.75, 'small'), (6, 24.9, 'medium'),
+]
+
+
+def cart_page_totals(cart, plants, coupon_percent):
+    """The cart page arithmetic from before the pricing kernel (calculate_total,
+    calculate_size_discount and apply_coupon in show_cart_page), transcribed as it was"""
+    total_noGST = 0
+    for item in cart.values():
+        total_noGST += item['price'] * item['quantity']
+
+    auto_discount_amount, auto_discount_percent, auto_discount_label = 0.0, 0, ""
+    if cart:
+        id_to_size = {p['id']: p['size'] for p in plants}
+        size_counts = {"big": 0, "medium": 0, "small": 0}
+        for plant_id, item in cart.items():
+            size = id_to_size.get(plant_id)
+            if size in size_counts:
+                size_counts[size] += item['quantity']
+        candidates = []
+        if size_counts["big"] >= 3:
+            candidates.append((20, "3 big plants"))
+        if size_counts["medium"] >= 4:
+            candidates.append((15, "4 medium plants"))
+        if size_counts["small"] >= 5:
+            candidates.append((10, "5 small plants"))
+        if candidates:
+            auto_discount_percent, auto_discount_label = max(candidates, key=lambda t: t[0])
+            auto_discount_amount = total_noGST * (auto_discount_percent / 100)
+
+    subtotal_after_auto = total_noGST - auto_discount_amount
+    GST_amount = subtotal_after_auto * 0.1
+    final_total = subtotal_after_auto + GST_amount
+    discount_amount = 0
+    if coupon_percent:
+        discount_amount = subtotal_after_auto * (coupon_percent / 100)
+        GST_amount = (subtotal_after_auto - discount_amount) * 0.1
+        final_total = subtotal_after_auto - discount_amount + GST_amount
+    return (total_noGST, auto_discount_amount, auto_discount_percent, auto_discount_label,
+            discount_amount, GST_amount, final_total)
+
+
+CARTS = {
+    'empty': ([], 0),
+    'no discount': ([(1, 2), (3, 1)], 0),
+    'three big': ([(1, 2), (4, 1), (3, 1)], 0),
+    'four small is not enough': ([(3, 3), (5, 1)], 0),
+    'five small': ([(3, 3), (5, 2)], 0),
+    'medium beats small': ([(2, 1), (6, 3), (3, 5)], 0),
+    'every rule met, big wins': ([(1, 3), (2, 4), (3, 5)], 0),
+    'coupon after the size discount': ([(1, 3), (2, 1)], 10),
+    'coupon without a size discount': ([(2, 1), (3, 2)], 15),
+    'unknown plant never counts for size': ([(1, 2), (999, 1)], 5),
+    'bulk order': ([(1, 40), (2, 17), (3, 99), (4, 1), (5, 3), (6, 250)], 5),
+}
+
+
+def priced(lines):
+    """The cart as the old session state held it: plant id -> price added at and quantity"""
+    prices = {plant_id: price for plant_id, price, _ in CATALOG}
+    return {plant_id: {'price': prices.get(plant_id, 19.99), 'quantity': quantity} for plant_id, quantity in lines}
+
+
+@pytest.fixture(scope='module')
+def table():
+    return PricingTable(*zip(*CATALOG))
+
+
+@pytest.mark.parametrize('name', CARTS)
+def test_quote_matches_the_old_cart_page(table, name):
+    lines, coupon_percent = CARTS[name]
+    cart = priced(lines)
+    plants = [{'id': plant_id, 'size': size} for plant_id, _, size in CATALOG]
+    expected = cart_page_totals(cart, plants, coupon_percent)
+
+    quote = table.quote(list(cart), [item['quantity'] for item in cart.values()],
+                        [item['price'] for item in cart.values()], coupon_percent)
+    assert (quote.subtotal, quote.size_discount, quote.size_discount_percent, quote.size_discount_label,
+            quote.coupon_discount, quote.gst, quote.total) == expected
+
+
+def test_quote_batch_matches_the_old_cart_page(table):
+    plants = [{'id': plant_id, 'size': size} for plant_id, _, size in CATALOG]
+    carts = [(priced(lines), coupon_percent) for lines, coupon_percent in CARTS.values()]
+    # NaN prices fall back to the catalog price; ids outside the catalog carry their own
+    batch = table.quote_batch(
+        [len(cart) for cart, _ in carts],
+        [plant_id for cart, _ in carts for plant_id in cart],
+        [item['quantity'] for cart, _ in carts for item in cart.values()],
+        [math.nan if plant_id != 999 else item['price'] for cart, _ in carts for plant_id, item in cart.items()],
+        [coupon_percent for _, coupon_percent in carts])
+    for i, (cart, coupon_percent) in enumerate(carts):
+        expected = cart_page_totals(cart, plants, coupon_percent)
+        got = tuple(np.asarray(field)[i] for field in
+                    (batch.subtotal, batch.size_discount, batch.size_discount_percent, batch.size_discount_label,
+                     batch.coupon_discount, batch.gst, batch.total))
+        assert got == expected
+
+
+def test_quote_totals_matches_the_old_cart_page():
+    # 3 big plants and a coupon: both discounts and GST on the amount left after them
+    cart = priced([(1, 2), (4, 1)])
+    plants = [{'id': plant_id, 'size': size} for plant_id, _, size in CATALOG]
+    quote = quote_totals(cart[1]['price'] * 2 + cart[4]['price'], [0, 0, 3], 10)
+    assert quote.total == cart_page_totals(cart, plants, 10)[-1]
+
+
+def test_unknown_plant_without_a_price_is_refused(table):
+    with pytest.raises(ValueError, match="999"):
+        table.quote([1, 999], [1, 1])
@@ -0,0 +1,134 @@
+import sqlite3
+
+import pytest
+
+from sessions import MemorySessionStore, SessionCache, SqliteSessionStore
+
+TTL = 1000.0
+
+
+class Clock:
+    def __init__(self, now=10_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CountingStore(MemorySessionStore):
+    """Records every batch written, and can be made to fail like a locked database"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.fail = False
+
+    def save_many(self, sessions):
+        sessions = list(sessions)
+        if self.fail:
+            raise sqlite3.OperationalError("database is locked")
+        self.batches.append([token for token, _, _ in sessions])
+        super().save_many(sessions)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store():
+    return CountingStore()
+
+
+def make_cache(store, clock, **kwargs):
+    # The tests flush by hand; the background flush never gets a turn
+    return SessionCache(store, ttl=TTL, flush_interval=3600, clock=clock, **kwargs)
+
+
+def test_writes_wait_for_the_flush(store, clock):
+    cache = make_cache(store, clock)
+    cache.put('a', {'cart': [1]})
+    cache.put('a', {'cart': [1, 2]})
+    assert store.load('a') is None
+    cache.flush()
+    assert store.batches == [['a']]
+    assert store.load('a') == ({'cart': [1, 2]}, clock.now)
+    cache.flush()
+    assert store.batches == [['a']]  # nothing changed since
+
+
+def test_eviction_writes_unsaved_sessions_only(store, clock):
+    cache = make_cache(store, clock, max_sessions=2)
+    cache.put('a', {'cart': [1]})
+    cache.put('b', {'cart': [2]})
+    cache.flush()
+    cache.put('c', {'cart': [3]})  # evicts 'a', already saved
+    cache.put('d', {'cart': [4]})  # evicts 'b', already saved
+    cache.put('e', {'cart': [5]})  # evicts 'c', never saved
+    assert store.batches == [['a', 'b'], ['c']]
+    assert len(cache) == 2
+    assert cache.get('c') == {'cart': [3]}  # read back from the store
+
+
+def test_idle_sessions_expire_from_cache_and_store(store, clock):
+    cache = make_cache(store, clock)
+    cache.put('idle', {'cart': [1]})
+    cache.put('busy', {'cart': [2]})
+    cache.flush()
+    clock.now += TTL / 2
+    cache.get('busy')
+    clock.now += TTL / 2 + 1
+    assert cache.get('idle') is None
+    cache.put('busy', {'cart': [2, 3]})
+    cache.flush()
+    assert store.load('idle') is None
+    assert cache.get('busy') == {'cart': [2, 3]}
+    assert len(cache) == 1
+
+
+def test_expired_row_left_in_the_store_counts_as_gone(store, clock):
+    store.save_many([('old', {'cart': [1]}, clock.now - TTL - 1)])
+    assert make_cache(store, clock).get('old') is None
+
+
+def test_read_only_session_is_kept_alive_in_the_store(store, clock):
+    cache = make_cache(store, clock)
+    cache.put('a', {'cart': [1]})
+    cache.flush()
+    for _ in range(3):
+        clock.now += TTL / 3
+        assert cache.get('a') == {'cart': [1]}
+    cache.flush()  # read for more than ttl/2 since it was saved: its last use is written back
+    assert store.load('a')[1] == clock.now
+
+
+def test_failed_flush_keeps_sessions_dirty(store, clock):
+    cache = make_cache(store, clock)
+    cache.put('a', {'cart': [1]})
+    store.fail = True
+    with pytest.raises(sqlite3.OperationalError):
+        cache.flush()
+    store.fail = False
+    cache.flush()
+    assert store.load('a') == ({'cart': [1]}, clock.now)
+
+
+def test_refresh_picks_up_another_process(tmp_path, clock):
+    path = str(tmp_path / 'sessions.db')
+    ours = make_cache(SqliteSessionStore(path), clock)
+    theirs = make_cache(SqliteSessionStore(path), clock)
+    ours.put('a', {'cart': [1]})
+    ours.flush()
+    assert theirs.get('a') == {'cart': [1]}
+
+    clock.now += 1
+    theirs.put('a', {'cart': [1, 2]})  # the next rerun was served by the other process
+    theirs.flush()
+    assert ours.get('a') == {'cart': [1]}  # the cached copy, without refresh
+    assert ours.get('a', refresh=True) == {'cart': [1, 2]}
+
+    ours.put('a', {'cart': [9]})  # unsaved changes here win over the store
+    assert ours.get('a', refresh=True) == {'cart': [9]}
+    ours.close()
+    theirs.close()